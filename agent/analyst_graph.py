@@ -7,7 +7,8 @@ from typing import Dict, Any
 from langgraph.graph import StateGraph, END
 from agent.state import AgentState
 # from agent.retriever import data_retriever_node
-from agent.analyst_v2 import data_retriever_v2_node, quality_check_node # [NEW] Import Quality Check
+from langchain_core.runnables import RunnableLambda
+from agent.analyst_v2 import data_retriever_v2_node, adata_retriever_v2_node, quality_check_node # [NEW] Import Quality Check
 from agent.reporter import data_reporter_node
 
 def create_analyst_graph():
@@ -18,7 +19,7 @@ def create_analyst_graph():
 
     # Add Nodes
     # workflow.add_node("DataRetriever", data_retriever_node)
-    workflow.add_node("DataRetriever", data_retriever_v2_node) # [NEW]
+    workflow.add_node("DataRetriever", RunnableLambda(data_retriever_v2_node, afunc=adata_retriever_v2_node)) # [NEW] sync / async
     workflow.add_node("QualityCheck", quality_check_node)
     workflow.add_node("DataReporter", data_reporter_node)
 
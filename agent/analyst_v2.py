@@ -2,13 +2,17 @@
 AKC Framework 3.0 - Data Analyst Agent (V2)
 Implemented using langchain.agents.create_agent
 """
+import contextvars
+from contextlib import contextmanager
 import json
 import logging
+import os
+import threading
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 
 from langchain.agents import create_agent, AgentState
-from langchain.agents.middleware import wrap_tool_call, dynamic_prompt, ModelRequest
+from langchain.agents.middleware import AgentMiddleware, dynamic_prompt, ModelRequest
 from langchain.messages import SystemMessage, ToolMessage, AIMessage, HumanMessage
 from langchain_core.messages import BaseMessage
 
@@ -17,12 +21,14 @@ from agent.state import AgentState as ProjectAgentState
 from tools.entity_resolver import resolve_entity
 from tools.campaign_template_tool import (
     id_finder,
+    query_budget_summary,
     query_campaign_basic,
     query_investment_budget,
     query_execution_budget,
     query_targeting_segments,
     execute_sql_template
 )
+from tools.columnar import store_tool_result
 from tools.performance_tools import (
     query_format_benchmark,
     query_unified_performance,
@@ -32,6 +38,21 @@ from tools.performance_tools import (
 # Setup logging
 logger = logging.getLogger("akc.analyst")
 logger.setLevel(logging.INFO)
+
+# 同一輪 LLM 回覆中的多個 tool calls 在 ToolNode 的 thread pool 上並行執行 (上限 RETRIEVER_TOOL_CONCURRENCY)；
+# 每個工具可能再分塊佔用多條連線，MYSQL_POOL_SIZE 需大於 並行數 × MYSQL_CHUNK_CONCURRENCY。
+TOOL_CONCURRENCY = int(os.getenv('RETRIEVER_TOOL_CONCURRENCY', 4))
+# 並行的 tool calls 共用同一份 state：data_store / resolved_entities 的合併需序列化。
+# 鎖屬於單次 data_retriever_v2_node 的 local state (不同請求互不阻擋)，經由 ContextVar 傳到 ToolNode 的 worker thread
+_state_lock_var: contextvars.ContextVar[Optional[threading.RLock]] = contextvars.ContextVar("retriever_state_lock", default=None)
+
+
+def _state_lock() -> threading.RLock:
+    """
+    目前這輪 retriever 的 state 鎖；不在 data_retriever_v2_node 內 (沒有並行的 tool calls) 時回傳新的鎖。
+    """
+    return _state_lock_var.get() or threading.RLock()
+
 if not logger.handlers:
     handler = logging.StreamHandler()
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -42,6 +63,7 @@ if not logger.handlers:
 RETRIEVER_TOOLS = [
     resolve_entity,
     id_finder,
+    query_budget_summary,
     query_campaign_basic,
     query_investment_budget,
     query_execution_budget,
@@ -97,6 +119,7 @@ RETRIEVER_SYSTEM_PROMPT = """你是 AKC 智能助手的數據檢索專家 (Data
    - Step 1: `resolve_entity` 取得 ID。
    - Step 2: **必須使用** `id_finder` 取得相關 IDs。
    - Step 3: 呼叫 `query_unified_performance(plaids=[...])`。
+   - ⚡️ 只查成效時可略過 Step 2：直接呼叫 `query_unified_performance(industry_ids=[...])`；產業 Benchmark 可用 `query_format_benchmark(industry_ids=[...])`。
 
 3. **問「有哪些...」 (探索清單)**:
    - ⚡️ **直接使用** `query_unified_dimensions(dimensions=['product_line'])`。
@@ -109,6 +132,8 @@ RETRIEVER_SYSTEM_PROMPT = """你是 AKC 智能助手的數據檢索專家 (Data
 2. **Step 2: 取得 IDs (關鍵)**
    - **優先使用** `id_finder(client_ids=[id], start_date=..., end_date=...)`。
    - 這會回傳該客戶在指定期間內的所有 `cue_list_id`, `campaign_id`, `plaid`。
+   - ⚡️ **只查預算/金額時可略過此步**: 直接呼叫 `query_budget_summary(client_ids=[id], start_date=..., end_date=...)`，
+     一次取得 Campaign × 格式 的進單金額與執行金額 (不需要 id_finder、query_investment_budget、query_execution_budget)。
 
 3. **Step 3: 根據需求分流**
    - **查預算/進單**:
@@ -117,6 +142,8 @@ RETRIEVER_SYSTEM_PROMPT = """你是 AKC 智能助手的數據檢索專家 (Data
      - `query_execution_budget(plaids=[...])`。
    - **查成效 (CTR/VTR)**:
      - `query_unified_performance(plaids=[...], group_by=['ad_format_type'])`。
+     - ⚡️ **只查成效時可略過 id_finder**: 直接呼叫 `query_unified_performance(client_ids=[id], start_date=..., end_date=..., group_by=[...])`
+       (agency_ids / industry_ids 亦同)，一次查詢完成。
    - **查受眾/設定**:
      - `query_targeting_segments(plaids=[...])`。
 
@@ -128,10 +155,19 @@ RETRIEVER_SYSTEM_PROMPT = """你是 AKC 智能助手的數據檢索專家 (Data
 
 ---
 
+**⚡️ 並行查詢**:
+- 取得 IDs 後，預算、執行、成效、受眾等查詢彼此獨立，請在**同一輪**一次送出所有需要的工具呼叫 (系統會同時執行)，不要一個一個等結果。
+- 使用者只要「大概」的全站排名 (例如「所有格式的 CTR 大概排名」) 時，`query_format_benchmark` / 全站 `query_unified_performance` 可加上 `approximate=True` (抽樣估計，附信賴區間)；需要精確數字時不要使用。
+
 **⚠️ ID 使用鐵律**:
 - ClickHouse 工具的 ID 參數為: `client_ids`, `product_line_ids`, `plaids` (對應 MySQL placement_id), `cmpids` (對應 MySQL campaign_id)。
 - 只要 `resolve_entity` 拿到 ID，就必須優先傳入 ID 參數，不要傳 Name。
 
+**⏱️ 查詢逾時處理**:
+- 若工具回傳 `error_type: "timeout"`，請縮小日期範圍或減少 ID 數量後**重試一次**；仍逾時則停止並說明。
+- 若工具回傳 `error_type: "cancelled"`，代表使用者已離開，請直接停止，不要重試。
+- 若工具回傳 `error_type: "cost_limit"`，代表查詢範圍太大 (例如多年份且沒有 ID 過濾)，請先用 id_finder 取得 plaids / cmpids 或縮小日期範圍後再查詢；只需大概排名時可改用 `approximate=True`。
+
 **結束條件**:
 -當必要的「成效面」與「金額面」數據都拿到後，請停止。
 """
@@ -173,27 +209,26 @@ def retriever_dynamic_prompt(request: ModelRequest) -> str:
 
     return base_prompt
 
-@wrap_tool_call
-def retriever_tool_middleware(request: Any, handler):
+def _before_tool_call(request: Any) -> threading.RLock:
     """
-    Middleware to handle:
-    1. Data storage in state['data_store']
-    2. Custom guidance for Entity Resolution and Campaign queries
-    3. Debug logging
-    4. Force Date Override
+    工具執行前：初始化 state 欄位並強制套用 routing_context 的日期 / 實體類型。
+    回傳這輪的 state 鎖 (sync / async 共用)。
     """
     tool_call = request.tool_call
     tool_name = tool_call["name"]
     args = tool_call["args"]
     state = request.state
     
+    state_lock = _state_lock()
+
     # Initialize state fields if needed
-    if "data_store" not in state or state["data_store"] is None:
-        state["data_store"] = {}
-    if "debug_logs" not in state or state["debug_logs"] is None:
-        state["debug_logs"] = []
-    if "resolved_entities" not in state or state["resolved_entities"] is None:
-        state["resolved_entities"] = []
+    with state_lock:
+        if "data_store" not in state or state["data_store"] is None:
+            state["data_store"] = {}
+        if "debug_logs" not in state or state["debug_logs"] is None:
+            state["debug_logs"] = []
+        if "resolved_entities" not in state or state["resolved_entities"] is None:
+            state["resolved_entities"] = []
 
     # Force Date Override
     if state.get("routing_context"):
@@ -227,56 +262,49 @@ def retriever_tool_middleware(request: Any, handler):
                 logger.warning(f"Force overriding end_date: {args['end_date']} -> {system_end}")
                 args["end_date"] = system_end
 
-    try:
-        # Execute tool
-        result = handler(request)
-        
-        # Extract raw data from result
-        raw_result = None
-        if isinstance(result, ToolMessage):
-            content = result.content
+    return state_lock
+
+def _after_tool_call(request: Any, result: Any, state_lock: threading.RLock):
+    """
+    工具執行後：解析結果、存入 data_store / resolved_entities，並轉為附帶提示的 JSON ToolMessage (sync / async 共用)。
+    """
+    tool_call = request.tool_call
+    tool_name = tool_call["name"]
+    state = request.state
+
+    # Extract raw data from result
+    raw_result = None
+    if isinstance(result, ToolMessage):
+        content = result.content
+        try:
+            raw_result = json.loads(content)
+        except:
             try:
-                raw_result = json.loads(content)
-            except:
-                try:
-                    import ast
-                    import re
-                    cleaned = re.sub(r"Decimal\('([^']+)'\)", r"\1", content)
-                    cleaned = re.sub(r"datetime\.date\((\d+), (\d+), (\d+)\)", r"'\1-\2-\3'", cleaned)
-                    cleaned = re.sub(r"datetime\.datetime\((\d+), (\d+), (\d+),? ?(\d+)?,? ?(\d+)?,? ?(\d+)?\)", 
-                                     lambda m: "'" + m.group(1) + "-" + m.group(2) + "-" + m.group(3) + "'", cleaned)
-                    
-                    raw_result = ast.literal_eval(cleaned)
-                except Exception as parse_e:
-                    logger.debug(f"Failed to parse content for {tool_name}: {parse_e}")
-        elif isinstance(result, dict):
-            raw_result = result
-            
-        if raw_result and isinstance(raw_result, dict):
+                import ast
+                import re
+                cleaned = re.sub(r"Decimal\('([^']+)'\)", r"\1", content)
+                cleaned = re.sub(r"datetime\.date\((\d+), (\d+), (\d+)\)", r"'\1-\2-\3'", cleaned)
+                cleaned = re.sub(r"datetime\.datetime\((\d+), (\d+), (\d+),? ?(\d+)?,? ?(\d+)?,? ?(\d+)?\)", 
+                                 lambda m: "'" + m.group(1) + "-" + m.group(2) + "-" + m.group(3) + "'", cleaned)
+                
+                raw_result = ast.literal_eval(cleaned)
+            except Exception as parse_e:
+                logger.debug(f"Failed to parse content for {tool_name}: {parse_e}")
+    elif isinstance(result, dict):
+        raw_result = result
+        
+    if raw_result and isinstance(raw_result, dict):
+        # 並行的 tool calls 以這輪的 state 鎖序列化對共用 state 的修改 (查詢本身不在鎖內)
+        with state_lock:
             # 1. Logic to store data (with Deduplication)
-            if "data" in raw_result:
-                data = raw_result.get("data")
-                if data and isinstance(data, list) and len(data) > 0:
-                    if tool_name not in state["data_store"]:
-                        state["data_store"][tool_name] = []
-
-                    # Deduplicate
-                    try:
-                        existing_data_str = {json.dumps(row, sort_keys=True, default=str) for row in state["data_store"][tool_name]}
-                        new_rows = []
-                        for row in data:
-                            row_str = json.dumps(row, sort_keys=True, default=str)
-                            if row_str not in existing_data_str:
-                                new_rows.append(row)
-                                existing_data_str.add(row_str)
-
-                        if new_rows:
-                            state["data_store"][tool_name].extend(new_rows)
-                            logger.info(f"Stored {len(new_rows)} rows in data_store for {tool_name}")
-                    except Exception as e:
-                        logger.error(f"Deduplication failed: {e}")
-                        state["data_store"][tool_name].extend(data)
-            
+            # 完整結果以 ColumnarDataset 併入 data_store (columnar 模式下預覽列只給 LLM 看)
+            try:
+                added = store_tool_result(state["data_store"], tool_name, raw_result)
+                if added:
+                    logger.info(f"Stored {added} rows in data_store for {tool_name} ({len(state['data_store'][tool_name])} total)")
+            except Exception as e:
+                logger.error(f"Failed to store {tool_name} result in data_store: {e}")
+        
             # 2. Handle Entity Resolution specifically for state update
             if tool_name == "resolve_entity":
                 status = raw_result.get("status")
@@ -292,34 +320,61 @@ def retriever_tool_middleware(request: Any, handler):
                     # Store ambiguity for QualityCheck to intercept
                     logger.info(f"Detected entity ambiguity ({status}). Storing for interception.")
                     state["ambiguity_status"] = raw_result
-                
+            
                 logger.info(f"Updated resolved_entities: {len(state['resolved_entities'])}")
 
-            # 3. Add guidance and convert to valid JSON
-            def json_default(obj):
-                import decimal
-                import datetime
-                if isinstance(obj, decimal.Decimal):
-                    return float(obj)
-                if isinstance(obj, (datetime.date, datetime.datetime)):
-                    return obj.isoformat()
-                return str(obj)
-
-            content = json.dumps(raw_result, ensure_ascii=False, default=json_default)
-            
-            if tool_name == "id_finder" and raw_result.get("data"):
-                rows = raw_result.get("data", [])
-                cue_list_ids = list(set(r['cue_list_id'] for r in rows if r.get('cue_list_id')))
-                plaids = list(set(r['plaid'] for r in rows if r.get('plaid')))
-                if plaids or cue_list_ids:
-                    content += f"\n\n✅ 已取得相關 IDs。CueLists: {len(cue_list_ids)}, Plaids: {len(plaids)}。\n👉 下一步: 請根據需求呼叫 `query_investment_budget` (預算) 或 `query_execution_budget` (執行) 或 `query_unified_performance` (成效)。"
-            
-            return ToolMessage(tool_call_id=tool_call["id"], content=content)
+        # 3. Add guidance and convert to valid JSON
+        def json_default(obj):
+            import decimal
+            import datetime
+            if isinstance(obj, decimal.Decimal):
+                return float(obj)
+            if isinstance(obj, (datetime.date, datetime.datetime)):
+                return obj.isoformat()
+            return str(obj)
+
+        content = json.dumps(raw_result, ensure_ascii=False, default=json_default)
+        
+        if tool_name == "id_finder" and raw_result.get("id_counts"):
+            id_counts = raw_result["id_counts"]
+            cue_list_count = id_counts.get("cue_list_id", 0)
+            plaid_count = id_counts.get("plaid", 0)
+            if plaid_count or cue_list_count:
+                content += f"\n\n✅ 已取得相關 IDs (見 ids)。CueLists: {cue_list_count}, Plaids: {plaid_count}。\n👉 下一步: 請根據需求在同一輪同時呼叫 `query_investment_budget` (預算)、`query_execution_budget` (執行)、`query_unified_performance` (成效)。"
+        
+        return ToolMessage(tool_call_id=tool_call["id"], content=content)
+
+    return result
+
+def _tool_error(request: Any, e: Exception) -> ToolMessage:
+    logger.error(f"Tool error: {e}")
+    return ToolMessage(tool_call_id=request.tool_call["id"], content=json.dumps({"error": str(e)}))
+
+class RetrieverToolMiddleware(AgentMiddleware):
+    """
+    Middleware to handle:
+    1. Data storage in state['data_store']
+    2. Custom guidance for Entity Resolution and Campaign queries
+    3. Debug logging
+    4. Force Date Override
+    同時提供 sync (invoke) 與 async (ainvoke，工具以 coroutine 執行) 兩種路徑。
+    """
+
+    def wrap_tool_call(self, request: Any, handler):
+        state_lock = _before_tool_call(request)
+        try:
+            return _after_tool_call(request, handler(request), state_lock)
+        except Exception as e:
+            return _tool_error(request, e)
 
-        return result
-    except Exception as e:
-        logger.error(f"Tool error: {e}")
-        return ToolMessage(tool_call_id=tool_call["id"], content=json.dumps({"error": str(e)}))
+    async def awrap_tool_call(self, request: Any, handler):
+        state_lock = _before_tool_call(request)
+        try:
+            return _after_tool_call(request, await handler(request), state_lock)
+        except Exception as e:
+            return _tool_error(request, e)
+
+retriever_tool_middleware = RetrieverToolMiddleware()
 
 # Create the agent
 retriever_agent = create_agent(
@@ -352,8 +407,11 @@ def _check_performance_tools_needed(state: ProjectAgentState, result: Dict[str,
             needs["needs_benchmark"] = not has_benchmark
     return needs
 
-def data_retriever_v2_node(state: ProjectAgentState) -> Dict[str, Any]:
-    initial_messages_count = len(state.get("messages", []))
+def _retriever_input(state: ProjectAgentState):
+    """
+    整理 retriever agent 的輸入 (sync / async node 共用)：重設 data_store 並將訊息轉為 LangChain message。
+    回傳 (local_state, initial_logs_count)。
+    """
     initial_logs_count = len(state.get("debug_logs", []))
     
     # Reset data_store for new turn
@@ -391,19 +449,48 @@ def data_retriever_v2_node(state: ProjectAgentState) -> Dict[str, Any]:
             
     local_state = state.copy()
     local_state["messages"] = sanitized_messages
-    result = retriever_agent.invoke(local_state)
-    final_messages = result.get("messages", [])
-    new_messages = final_messages[len(sanitized_messages):]
-    final_logs = result.get("debug_logs", [])
-    new_logs = final_logs[initial_logs_count:]
-    
+    return local_state, initial_logs_count
+
+@contextmanager
+def _retriever_state_lock():
+    """
+    同一輪的多個 tool calls 並行執行，總耗時約等於最慢的查詢；它們共用 local_state，以這輪專屬的鎖保護
+    """
+    lock_token = _state_lock_var.set(threading.RLock())
+    try:
+        yield
+    finally:
+        _state_lock_var.reset(lock_token)
+
+def _benchmark_params(state: ProjectAgentState, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    LLM 漏呼叫 query_format_benchmark 時，回傳自動補查的參數；不需要時回傳 None。
+    """
+    if "data_store" not in result:
+        result["data_store"] = {}
     needs = _check_performance_tools_needed(state, result)
+    if not needs.get("needs_benchmark"):
+        return None
+    logger.warning("Detected missing query_format_benchmark call. Auto-invoking...")
     routing_context = state.get("routing_context", {})
     start_date = routing_context.get("start_date", "2021-01-01")
     end_date = routing_context.get("end_date", datetime.now().strftime("%Y-%m-%d"))
-    
-    if "data_store" not in result:
-        result["data_store"] = {}
+    # Note: id_finder results are structural, hard to guess 'cmp_ids' for benchmark
+    # If we have id_finder data, maybe we can extract?
+    # For now, default to global benchmark if no specific IDs found
+    logger.warning("Auto-invoking benchmark for 全站查詢")
+    return {"start_date": start_date, "end_date": end_date}
+
+def _store_benchmark(result: Dict[str, Any], benchmark_result: Dict[str, Any]):
+    if benchmark_result.get("status") == "success" and benchmark_result.get("data"):
+        store_tool_result(result["data_store"], "query_format_benchmark", benchmark_result)
+        logger.info(f"Auto-invoked query_format_benchmark, got {benchmark_result.get('count', len(benchmark_result.get('data', [])))} rows")
+
+def _retriever_output(result: Dict[str, Any], input_messages_count: int, initial_logs_count: int) -> Dict[str, Any]:
+    final_messages = result.get("messages", [])
+    new_messages = final_messages[input_messages_count:]
+    final_logs = result.get("debug_logs", [])
+    new_logs = final_logs[initial_logs_count:]
 
     # [FIX] Manually extract ambiguity_status from messages if missing from result
     # This ensures propagation even if create_agent strips custom state keys
@@ -420,22 +507,6 @@ def data_retriever_v2_node(state: ProjectAgentState) -> Dict[str, Any]:
                 except:
                     pass
         
-    # Auto-invoke Benchmark
-    if needs.get("needs_benchmark"):
-        logger.warning("Detected missing query_format_benchmark call. Auto-invoking...")
-        try:
-            invoke_params = {"start_date": start_date, "end_date": end_date}
-            # Note: id_finder results are structural, hard to guess 'cmp_ids' for benchmark
-            # If we have id_finder data, maybe we can extract?
-            # For now, default to global benchmark if no specific IDs found
-            logger.warning("Auto-invoking benchmark for 全站查詢")
-            benchmark_result = query_format_benchmark.invoke(invoke_params)
-            if benchmark_result.get("status") == "success" and benchmark_result.get("data"):
-                result["data_store"]["query_format_benchmark"] = benchmark_result.get("data", [])
-                logger.info(f"Auto-invoked query_format_benchmark, got {len(benchmark_result.get('data', []))} rows")
-        except Exception as e:
-            logger.warning(f"Auto-invoke benchmark failed: {e}")
-
     output = {
         "messages": new_messages,
         "debug_logs": new_logs,
@@ -445,6 +516,40 @@ def data_retriever_v2_node(state: ProjectAgentState) -> Dict[str, Any]:
     }
     return output
 
+def data_retriever_v2_node(state: ProjectAgentState) -> Dict[str, Any]:
+    local_state, initial_logs_count = _retriever_input(state)
+    with _retriever_state_lock():
+        result = retriever_agent.invoke(local_state, config={"max_concurrency": TOOL_CONCURRENCY})
+
+    # Auto-invoke Benchmark
+    invoke_params = _benchmark_params(state, result)
+    if invoke_params:
+        try:
+            _store_benchmark(result, query_format_benchmark.invoke(invoke_params))
+        except Exception as e:
+            logger.warning(f"Auto-invoke benchmark failed: {e}")
+
+    return _retriever_output(result, len(local_state["messages"]), initial_logs_count)
+
+async def adata_retriever_v2_node(state: ProjectAgentState) -> Dict[str, Any]:
+    """
+    data_retriever_v2_node 的 async 版本 (LangServe 的 ainvoke 路徑)：
+    ToolNode 直接 await 工具的 coroutine，同一輪的 tool calls 在 event loop 上並行，不佔用 worker thread。
+    """
+    local_state, initial_logs_count = _retriever_input(state)
+    with _retriever_state_lock():
+        result = await retriever_agent.ainvoke(local_state, config={"max_concurrency": TOOL_CONCURRENCY})
+
+    # Auto-invoke Benchmark
+    invoke_params = _benchmark_params(state, result)
+    if invoke_params:
+        try:
+            _store_benchmark(result, await query_format_benchmark.ainvoke(invoke_params))
+        except Exception as e:
+            logger.warning(f"Auto-invoke benchmark failed: {e}")
+
+    return _retriever_output(result, len(local_state["messages"]), initial_logs_count)
+
 def quality_check_node(state: ProjectAgentState) -> Dict[str, Any]:
     """
     Check if the Analyst has fetched all necessary data before proceeding to Reporter.
@@ -502,16 +607,28 @@ def quality_check_node(state: ProjectAgentState) -> Dict[str, Any]:
     needs_performance = any(k in original_query for k in performance_keywords)
     
     has_ids = "id_finder" in data_store and len(data_store["id_finder"]) > 0
-    has_budget_data = "query_investment_budget" in data_store or "query_execution_budget" in data_store
+    has_budget_summary = "query_budget_summary" in data_store
+    has_budget_data = (
+        has_budget_summary
+        or "query_investment_budget" in data_store
+        or "query_execution_budget" in data_store
+    )
     has_performance_data = "query_unified_performance" in data_store
     
     resolved_entities = state.get("resolved_entities") or []
     has_resolved = len(resolved_entities) > 0
     
+    # 以實體過濾直接查詢 (query_budget_summary / query_unified_performance(client_ids=...)) 時不需要 id_finder
+    answered_without_ids = (
+        (has_budget_summary or has_performance_data)
+        and (has_budget_summary or not needs_budget)
+        and (has_performance_data or not needs_performance)
+    )
+
     feedback = None
     
     # Check 0: Resolved entities but forgot id_finder
-    if has_resolved and not has_ids:
+    if has_resolved and not has_ids and not answered_without_ids:
         feedback = "❌ 品質檢查未通過：你已經解析了實體，但尚未呼叫 `id_finder`。請務必先使用 `id_finder` 取得該實體在指定期間內的所有關聯 IDs (Plaids/Campaigns)，然後才能查詢數據。"
 
     # Check 1: Found IDs but no Budget (when budget needed)
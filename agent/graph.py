@@ -9,7 +9,9 @@ from langgraph.checkpoint.memory import MemorySaver # [NEW]
 from agent.state import AgentState
 from agent.router import intent_router_node
 from agent.analyst_graph import analyst_graph # [NEW] Import Subgraph
+from tools.columnar import export_data_store
 from langchain_core.messages import HumanMessage, BaseMessage
+from langchain_core.runnables import RunnableLambda
 from typing import Dict, Any
 
 
@@ -35,20 +37,11 @@ def input_adapter_node(state: AgentState) -> Dict[str, Any]:
     
     return {}
 
-def data_analyst_wrapper_node(state: AgentState) -> Dict[str, Any]:
+def _analyst_output(result: Dict[str, Any], initial_messages_count: int, initial_logs_count: int) -> Dict[str, Any]:
     """
-    Wraps the Analyst Subgraph to prevent message duplication.
-    Calculates the DIFF between input state and output state.
+    Calculates the DIFF between input state and subgraph output (sync / async wrapper 共用).
     """
-    # 1. Capture initial state counts
-    initial_messages_count = len(state.get("messages", []))
-    initial_logs_count = len(state.get("debug_logs", []))
-    
-    # 2. Invoke Subgraph
-    # We must pass the full state to the subgraph
-    result = analyst_graph.invoke(state)
-    
-    # 3. Calculate Diff (New Items Only)
+    # Calculate Diff (New Items Only)
     final_messages = result.get("messages", [])
     new_messages = final_messages[initial_messages_count:]
     
@@ -57,23 +50,46 @@ def data_analyst_wrapper_node(state: AgentState) -> Dict[str, Any]:
     
     print(f"DEBUG [AnalystWrapper] Input msgs: {initial_messages_count}, Output msgs: {len(final_messages)}, New: {len(new_messages)}")
     
-    # 4. Return update (Parent graph will append these)
+    # Return update (Parent graph will append these)
     return {
         "messages": new_messages,
         "debug_logs": new_logs,
-        "data_store": result.get("data_store"),
+        "data_store": export_data_store(result.get("data_store")),
         "resolved_entities": result.get("resolved_entities"),
         "analyst_data": result.get("analyst_data"),
         "final_response": result.get("final_response")
     }
 
+def data_analyst_wrapper_node(state: AgentState) -> Dict[str, Any]:
+    """
+    Wraps the Analyst Subgraph to prevent message duplication.
+    We must pass the full state to the subgraph.
+    """
+    # Capture initial state counts
+    initial_messages_count = len(state.get("messages", []))
+    initial_logs_count = len(state.get("debug_logs", []))
+    result = analyst_graph.invoke(state)
+    return _analyst_output(result, initial_messages_count, initial_logs_count)
+
+async def adata_analyst_wrapper_node(state: AgentState) -> Dict[str, Any]:
+    """
+    data_analyst_wrapper_node 的 async 版本：LangServe (ainvoke / astream) 經由此路徑 await 子圖，
+    工具以 coroutine 執行。
+    """
+    # Capture initial state counts
+    initial_messages_count = len(state.get("messages", []))
+    initial_logs_count = len(state.get("debug_logs", []))
+    result = await analyst_graph.ainvoke(state)
+    return _analyst_output(result, initial_messages_count, initial_logs_count)
+
 # Define the workflow
 workflow = StateGraph(AgentState)
 
 # Add Nodes
 workflow.add_node("InputAdapter", input_adapter_node)
 workflow.add_node("IntentRouter", intent_router_node)
-workflow.add_node("DataAnalyst", data_analyst_wrapper_node) # [UPDATED] Use Wrapper
+# sync (scripts/cli.py 的 invoke) 與 async (LangServe 的 ainvoke / astream) 各走自己的實作
+workflow.add_node("DataAnalyst", RunnableLambda(data_analyst_wrapper_node, afunc=adata_analyst_wrapper_node)) # [UPDATED] Use Wrapper
 
 # Add Edges
 # User input → Input Adapter → Intent Router
@@ -10,7 +10,9 @@ from typing import Dict, Any, List
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
 from config.llm import llm
 from agent.state import AgentState
-from tools.data_processing_tool import pandas_processor
+from tools.data_processing_tool import pandas_processor, process_data
+from tools.columnar import as_frame, store_tool_result
+from tools.approximate import typical_half_width
 import json
 import pandas as pd
 import re
@@ -47,11 +49,44 @@ REPORTER_SYSTEM_PROMPT = """你是 AKC 智能助手的資料報告專家 (Data R
 **目標**: 產出一張包含「{user_query_intent}」相關所有維度的寬表。
 """
 
+def _has_rows(df) -> bool:
+    return df is not None and len(df) > 0
+
+def _result_frame(res: Dict[str, Any], fallback):
+    """
+    process_data(return_frame=True) 成功時回傳 DataFrame，失敗時保留原本的資料。
+    """
+    if res.get("status") == "success" and isinstance(res.get("data"), pd.DataFrame):
+        return res["data"]
+    return fallback
+
+def _approximate_note(data_store: Dict[str, Any]) -> str:
+    """
+    近似模式 (抽樣) 的結果帶有 sample_rate 欄位；報表中標示數字為估計值與信賴區間寬度。
+    """
+    notes = []
+    for key, df in data_store.items():
+        if not _has_rows(df) or "sample_rate" not in df.columns:
+            continue
+        rate = float(df["sample_rate"].max())
+        half_width = typical_half_width(df)
+        detail = f"，CTR 95% 信賴區間約 ±{half_width:.3f} 個百分點" if half_width is not None else ""
+        if "sample_start_date" in df.columns:
+            detail += f"，抽樣資料自 {df['sample_start_date'].iloc[0]} 起 (更早的日期未計入)"
+        if "sample_end_date" in df.columns:
+            detail += f"，抽樣資料只到 {df['sample_end_date'].iloc[0]} (之後的日期未計入)"
+        notes.append(f"`{key}` 以 {rate:.0%} 抽樣資料估計{detail}")
+    if not notes:
+        return ""
+    return "⚠️ **以下數字為抽樣估計值 (近似模式)**：" + "；".join(notes) + "。加總已依抽樣比例放大，精確數字請關閉近似模式重新查詢。"
+
 def data_reporter_node(state: AgentState) -> Dict[str, Any]:
     """
     Auto-Drive Reporter: Programmatically merges data and lets LLM summarize.
     """
-    data_store = state.get("data_store", {})
+    # data_store 中的 ColumnarDataset 直接以 DataFrame 處理，不轉成 dict 列
+    data_store = {k: as_frame(v) for k, v in (state.get("data_store") or {}).items()}
+    data_store = {k: v for k, v in data_store.items() if v is not None}
     
     # --- Reconstruct data_store from messages if empty ---
     if not data_store:
@@ -59,6 +94,7 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
         from langchain_core.messages import ToolMessage
         
         tool_call_map = {}
+        reconstructed = {}
         for msg in state.get("messages", []):
             if hasattr(msg, "tool_calls") and msg.tool_calls:
                 for tc in msg.tool_calls:
@@ -85,26 +121,17 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
                         except:
                             continue
 
-                    if isinstance(result, dict) and "data" in result:
-                        data = result.get("data")
-                        if isinstance(data, list):
-                            if tool_name not in data_store:
-                                data_store[tool_name] = []
-                            
-                            if data:
-                                existing_data_str = {json.dumps(row, sort_keys=True, default=str) for row in data_store[tool_name]}
-                                for row in data:
-                                    row_str = json.dumps(row, sort_keys=True, default=str)
-                                    if row_str not in existing_data_str:
-                                        data_store[tool_name].append(row)
-                                        existing_data_str.add(row_str)
+                    if isinstance(result, dict):
+                        store_tool_result(reconstructed, tool_name, result)
                 except Exception as e:
                     print(f"DEBUG [Reporter] Error processing {tool_name}: {e}")
 
+        data_store = {k: as_frame(v) for k, v in reconstructed.items()}
+
     original_query = state.get("routing_context", {}).get("original_query", "")
     execution_logs = state.get("debug_logs", [])
 
-    has_actual_data = any(len(rows) > 0 for rows in data_store.values() if isinstance(rows, list))
+    has_actual_data = any(_has_rows(df) for df in data_store.values())
     
     if not data_store or not has_actual_data:
         msg = "抱歉，我在資料庫中沒有找到與「悠遊卡」相關的成效或預算數據。" if "悠遊卡" in original_query else "抱歉，我沒有找到相關數據。"
@@ -124,16 +151,17 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
         
         # 聚合至 Campaign + Format 層級，避免多個 CueList 導致重複
         groupby_keys = ["campaign_id", "format_name", "format_type_id", "client_name", "agency_name"]
-        if inv_data:
-            available_keys = [k for k in groupby_keys if k in inv_data[0]]
+        if _has_rows(inv_data):
+            available_keys = [k for k in groupby_keys if k in inv_data.columns]
             
-            res = pandas_processor.invoke({
-                "data": inv_data,
-                "operation": "groupby_sum",
-                "groupby_col": ",".join(available_keys),
-                "sum_col": "investment_amount",
-                "sort_col": "campaign_id"
-            })
+            res = process_data(
+                inv_data,
+                "groupby_sum",
+                groupby_col=",".join(available_keys),
+                sum_col="investment_amount",
+                sort_col="campaign_id",
+                return_frame=True
+            )
             
             if res.get("status") == "success":
                 data_store["query_investment_budget"] = res.get("data")
@@ -143,7 +171,11 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
     current_data = None
 
     # 1. Determine Anchor Table
-    if "query_execution_budget" in data_store:
+    if "query_budget_summary" in data_store:
+        # 單次查詢的預算彙總 (Campaign × 格式，已含進單與執行金額)
+        current_data = data_store["query_budget_summary"]
+        print("DEBUG [Reporter] Anchor: Budget Summary")
+    elif "query_execution_budget" in data_store:
         current_data = data_store["query_execution_budget"]
         print("DEBUG [Reporter] Anchor: Execution Budget")
     elif "query_investment_budget" in data_store:
@@ -165,21 +197,21 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
             current_data = data_store[key]
             print(f"DEBUG [Reporter] Anchor: Fallback to {key}")
     
-    if current_data:
-        print(f"DEBUG [Reporter] Anchor Cols: {list(current_data[0].keys())[:10]}")
+    if _has_rows(current_data):
+        print(f"DEBUG [Reporter] Anchor Cols: {list(current_data.columns)[:10]}")
 
         # Filter out Direct Client for Agency queries
         agency_keywords = ['代理商', '代理', '廣告代理', 'agency']
         is_agency_query = any(kw in original_query.lower() for kw in agency_keywords)
 
-        if is_agency_query and 'agency_name' in current_data[0]:
-            current_data = [row for row in current_data if row.get('agency_name') != 'Direct Client']
+        if is_agency_query and 'agency_name' in current_data.columns:
+            current_data = current_data[current_data['agency_name'] != 'Direct Client'].reset_index(drop=True)
 
     # 2. Process Segments (Flatten)
     if "query_targeting_segments" in data_store:
         # Check merge keys. Targeting usually has 'plaid' or 'campaign_id'
-        has_plaid = current_data and ("plaid" in current_data[0] or "placement_id" in current_data[0])
-        has_campaign = current_data and "campaign_id" in current_data[0]
+        has_plaid = _has_rows(current_data) and ("plaid" in current_data.columns or "placement_id" in current_data.columns)
+        has_campaign = _has_rows(current_data) and "campaign_id" in current_data.columns
         
         segments_data = data_store["query_targeting_segments"]
         
@@ -187,66 +219,69 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
         if has_plaid:
             print("DEBUG [Reporter] Merging Segments by Plaid...")
             # Normalize key
-            seg_key = "plaid" if "plaid" in segments_data[0] else "placement_id"
-            anchor_key = "plaid" if "plaid" in current_data[0] else "placement_id"
+            seg_key = "plaid" if "plaid" in segments_data.columns else "placement_id"
+            anchor_key = "plaid" if "plaid" in current_data.columns else "placement_id"
             
             # Rename segment key to match anchor if needed
-            if seg_key != anchor_key:
-                for row in segments_data:
-                    if seg_key in row: row[anchor_key] = row.pop(seg_key)
+            if seg_key != anchor_key and seg_key in segments_data.columns:
+                segments_data = segments_data.drop(columns=[anchor_key], errors="ignore").rename(columns={seg_key: anchor_key})
             
-            res = pandas_processor.invoke({
-                "data": segments_data,
-                "operation": "groupby_concat",
-                "groupby_col": anchor_key,
-                "concat_col": "segment_name",
-                "new_col": "targeting_segments"
-            })
+            res = process_data(
+                segments_data,
+                "groupby_concat",
+                groupby_col=anchor_key,
+                concat_col="segment_name",
+                new_col="targeting_segments",
+                return_frame=True
+            )
             
             if res.get("status") == "success":
-                current_data = pandas_processor.invoke({
-                    "data": current_data,
-                    "merge_data": res.get("data"),
-                    "merge_on": anchor_key,
-                    "operation": "merge",
-                    "merge_how": "left"
-                }).get("data")
+                current_data = _result_frame(process_data(
+                    current_data,
+                    "merge",
+                    merge_data=res.get("data"),
+                    merge_on=anchor_key,
+                    merge_how="left",
+                    return_frame=True
+                ), current_data)
                 
         elif has_campaign:
             print("DEBUG [Reporter] Merging Segments by Campaign ID...")
             # Segments data might have campaign_id
-            if "campaign_id" in segments_data[0]:
-                res = pandas_processor.invoke({
-                    "data": segments_data,
-                    "operation": "groupby_concat",
-                    "groupby_col": "campaign_id",
-                    "concat_col": "segment_name",
-                    "new_col": "targeting_segments"
-                })
+            if "campaign_id" in segments_data.columns:
+                res = process_data(
+                    segments_data,
+                    "groupby_concat",
+                    groupby_col="campaign_id",
+                    concat_col="segment_name",
+                    new_col="targeting_segments",
+                    return_frame=True
+                )
                 if res.get("status") == "success":
-                    current_data = pandas_processor.invoke({
-                        "data": current_data,
-                        "merge_data": res.get("data"),
-                        "merge_on": "campaign_id",
-                        "operation": "merge",
-                        "merge_how": "left"
-                    }).get("data")
+                    current_data = _result_frame(process_data(
+                        current_data,
+                        "merge",
+                        merge_data=res.get("data"),
+                        merge_on="campaign_id",
+                        merge_how="left",
+                        return_frame=True
+                    ), current_data)
 
     # 3. Merge Performance (The Inflation Fix)
-    if "query_unified_performance" in data_store and current_data != data_store["query_unified_performance"]:
+    if "query_unified_performance" in data_store and current_data is not None and current_data is not data_store["query_unified_performance"]:
         print("DEBUG [Reporter] Merging Unified Performance...")
         perf_data = data_store["query_unified_performance"]
         
         # Normalize Keys
-        for row in perf_data:
-            if "cmpid" in row: row["campaign_id"] = row["cmpid"]
+        if "cmpid" in perf_data.columns:
+            perf_data = perf_data.assign(campaign_id=perf_data["cmpid"])
             
         # Determine Join Key and Granularity
         # If Anchor is Investment Budget, it is aggregated (Campaign + Format).
         # If Anchor is Execution Budget, it is Plaid level.
         
-        has_plaid = "plaid" in current_data[0]
-        has_format = "format_name" in current_data[0]
+        has_plaid = "plaid" in current_data.columns
+        has_format = "format_name" in current_data.columns
         
         if has_plaid:
             # Join by Plaid (1:1 usually) - Ideal
@@ -259,73 +294,73 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
             
             join_key = "campaign_id"
             # Try to add Format to key
-            if has_format and "ad_format_type" in perf_data[0]:
+            if has_format and "ad_format_type" in perf_data.columns:
                 # Normalize format names logic could go here, but let's stick to campaign_id for safety first
                 # Or simplistic name matching
                 pass
 
             # Pre-aggregate Performance to prevent inflation
             print(f"DEBUG [Reporter] Pre-aggregating performance by {join_key}")
-            agg_res = pandas_processor.invoke({
-                "data": perf_data,
-                "operation": "groupby_sum",
-                "groupby_col": join_key,
-                "sum_col": "effective_impressions, clicks, total_q100_views, total_engagements",
-                "top_n": 0
-            })
-            if agg_res.get("status") == "success":
-                perf_data = agg_res.get("data")
+            agg_res = process_data(
+                perf_data,
+                "groupby_sum",
+                groupby_col=join_key,
+                sum_col="effective_impressions, clicks, total_q100_views, total_engagements",
+                top_n=0,
+                return_frame=True
+            )
+            perf_data = _result_frame(agg_res, perf_data)
             
         # Execute Merge
-        res = pandas_processor.invoke({
-            "data": current_data,
-            "merge_data": perf_data,
-            "merge_on": join_key,
-            "operation": "merge",
-            "merge_how": "left"
-        })
-        if res.get("status") == "success":
-            current_data = res.get("data")
+        res = process_data(
+            current_data,
+            "merge",
+            merge_data=perf_data,
+            merge_on=join_key,
+            merge_how="left",
+            return_frame=True
+        )
+        current_data = _result_frame(res, current_data)
 
     # 4. Merge Campaign Basic (Enrichment)
-    if "query_campaign_basic" in data_store and current_data != data_store["query_campaign_basic"]:
-        if current_data and "campaign_id" in current_data[0]:
+    if "query_campaign_basic" in data_store and current_data is not data_store["query_campaign_basic"]:
+        if _has_rows(current_data) and "campaign_id" in current_data.columns:
             print("DEBUG [Reporter] Enriching with Campaign Basic info...")
-            res = pandas_processor.invoke({
-                "data": current_data,
-                "merge_data": data_store["query_campaign_basic"],
-                "merge_on": "campaign_id",
-                "operation": "merge",
-                "merge_how": "left"
-            })
-            if res.get("status") == "success":
-                current_data = res.get("data")
+            res = process_data(
+                current_data,
+                "merge",
+                merge_data=data_store["query_campaign_basic"],
+                merge_on="campaign_id",
+                merge_how="left",
+                return_frame=True
+            )
+            current_data = _result_frame(res, current_data)
 
     # [NEW] Step 2: Dimension Enrichment (Universal)
     # If we have unified_dimensions (from Step 1 auto-invoke), merge it!
     # This solves the "Budget table missing Client/Industry name" problem.
-    if "query_unified_dimensions" in data_store and current_data != data_store["query_unified_dimensions"]:
+    if "query_unified_dimensions" in data_store and current_data is not data_store["query_unified_dimensions"]:
         print("DEBUG [Reporter] Enriching with Unified Dimensions...")
         dim_data = data_store["query_unified_dimensions"]
         
         # Normalize Keys
-        for row in dim_data:
-            if "cmpid" in row: row["campaign_id"] = row["cmpid"]
+        if "cmpid" in dim_data.columns:
+            dim_data = dim_data.assign(campaign_id=dim_data["cmpid"])
             
         # Determine Join Key
-        has_plaid = current_data and ("plaid" in current_data[0] or "placement_id" in current_data[0])
+        has_plaid = _has_rows(current_data) and ("plaid" in current_data.columns or "placement_id" in current_data.columns)
         
         if has_plaid:
             # Prefer Plaid merge (most granular)
-            join_key = "plaid" if "plaid" in current_data[0] else "placement_id"
+            join_key = "plaid" if "plaid" in current_data.columns else "placement_id"
             # Normalize dim_data key
-            if "plaid" not in dim_data[0]:
+            if "plaid" not in dim_data.columns:
                 print("WARN [Reporter] Unified Dimensions missing plaid, falling back to campaign_id")
                 join_key = "campaign_id"
         else:
             join_key = "campaign_id"
             
-        if join_key in dim_data[0] and join_key in current_data[0]:
+        if _has_rows(current_data) and join_key in dim_data.columns and join_key in current_data.columns:
             print(f"DEBUG [Reporter] Merging Dimensions on {join_key}...")
             # Deduplicate dimension data to prevent row explosion
             # We only want the dimension names, so we take the first row per key
@@ -336,21 +371,21 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
             # But if dim_data has multiple rows per key (unlikely for dimensions table but possible), it might explode.
             # Let's rely on processor's smart merge.
             
-            res = pandas_processor.invoke({
-                "data": current_data,
-                "merge_data": dim_data,
-                "merge_on": join_key,
-                "operation": "merge",
-                "merge_how": "left"
-            })
-            if res.get("status") == "success":
-                current_data = res.get("data")
+            res = process_data(
+                current_data,
+                "merge",
+                merge_data=dim_data,
+                merge_on=join_key,
+                merge_how="left",
+                return_frame=True
+            )
+            current_data = _result_frame(res, current_data)
         else:
             print(f"WARN [Reporter] Dimension Merge Failed: Common key '{join_key}' not found.")
 
     # 5. Schema Planning & Output
-    if current_data:
-        available_cols = list(current_data[0].keys())
+    if _has_rows(current_data):
+        available_cols = list(current_data.columns)
         print(f"DEBUG [Reporter] Planning Schema with cols: {available_cols}")
         
         # Load Mapping Config
@@ -481,7 +516,7 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
                 # If specific tools were called and returned data, we force those columns to be shown.
                 # This ensures that if the Analyst decided to fetch data, the Reporter MUST show it,
                 # even if the LLM Planning step accidentally missed it.
-                if "query_targeting_segments" in data_store and data_store["query_targeting_segments"]:
+                if _has_rows(data_store.get("query_targeting_segments")):
                     col_en = "targeting_segments"
                     col_cn = "受眾標籤"
                     
@@ -520,19 +555,19 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
                         sum_cols_en.append(base_col)
 
                 # Execute Final Aggregation
-                final_result = pandas_processor.invoke({
-                    "data": current_data,
-                    "operation": "groupby_sum",
-                    "rename_map": plan.get("rename_map", {}),
-                    "groupby_col": ",".join(groupby_cols_en),
-                    "sum_col": ",".join(sum_cols_en),
-                    "concat_col": concat_col_en,
-                    "select_columns": plan.get("display_columns", []),
-                    "sort_col": plan.get("sort_col"),
-                    "percentage_config": perc_config, # [NEW] Pass percentage config
-                    "ascending": False,
-                    "top_n": plan.get("limit", 0)
-                })
+                final_result = process_data(
+                    current_data,
+                    "groupby_sum",
+                    rename_map=plan.get("rename_map", {}),
+                    groupby_col=",".join(groupby_cols_en),
+                    sum_col=",".join(sum_cols_en),
+                    concat_col=concat_col_en,
+                    select_columns=plan.get("display_columns", []),
+                    sort_col=plan.get("sort_col"),
+                    percentage_config=perc_config, # [NEW] Pass percentage config
+                    ascending=False,
+                    top_n=int(plan.get("limit") or 0)
+                )
 
             else:
                 raise ValueError("No valid JSON found in LLM response")
@@ -540,13 +575,13 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
         except Exception as e:
             print(f"DEBUG [Reporter] Planning failed ({e}). Fallback to simple top_n.")
             fallback_select = [c for c in available_cols if not c.lower().endswith('id')]
-            final_result = pandas_processor.invoke({
-                "data": current_data,
-                "operation": "top_n", 
-                "top_n": 100,
-                "select_columns": fallback_select[:7], 
-                "sort_col": available_cols[0]
-            })
+            final_result = process_data(
+                current_data,
+                "top_n",
+                top_n=100,
+                select_columns=fallback_select[:7],
+                sort_col=available_cols[0]
+            )
     else:
         final_result = {"markdown": ""}
 
@@ -595,6 +630,9 @@ def data_reporter_node(state: AgentState) -> Dict[str, Any]:
         opening_text = "抱歉，無法從數據中生成報表。"
 
     final_response = opening_text + "\n\n" + final_table
+    approximate_note = _approximate_note(data_store)
+    if final_table and approximate_note:
+        final_response += "\n\n" + approximate_note
     if suggestions_text:
         final_response += "\n\n" + suggestions_text
 
@@ -39,8 +39,9 @@ class AgentState(BaseAgentState, total=False):
     debug_logs: Annotated[List[Dict[str, Any]], operator.add]
 
     # Shared Data Store (Retriever -> Reporter)
-    # Stores raw datasets from SQL queries. Key: "dataset_name" (or tool name), Value: List of records
-    data_store: Optional[Dict[str, List[Dict[str, Any]]]]
+    # Stores raw datasets from SQL queries. Key: "dataset_name" (or tool name),
+    # Value: tools.columnar.ColumnarDataset (columnar rows + schema + row count)
+    data_store: Optional[Dict[str, Any]]
 
     # Quality Check & Retry Logic
     retry_count: Optional[int]
@@ -1,6 +1,10 @@
 # server.py
+import asyncio
 import os
 import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Set
 
 # Fix import path for agent module
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -9,34 +13,116 @@ if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from langchain_core.callbacks import AsyncCallbackHandler
 from langserve import add_routes
 from agent.graph import app as langgraph_app
+from services.warmup import start_warmup, readiness
+from config.query_control import SCOPE_CONFIG_KEY, open_scope, close_scope
+from services.result_cache import get_result_cache
 import uvicorn
 import os
 
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """
+    啟動時在背景平行預熱 SSH Tunnel / MySQL / ClickHouse / Qdrant / Embedding 模型，不阻塞啟動。
+    """
+    start_warmup()
+    yield
+
+
 fastapi_app = FastAPI(
     title="Text-to-SQL Agent API",
     version="1.0",
-    description="API for accessing the LangGraph SQL Agent"
+    description="API for accessing the LangGraph SQL Agent",
+    lifespan=_lifespan
 )
 
-def _inject_thread_id(config: dict, request: Request) -> dict:
+# 進行中的斷線監控 task；event loop 只保留 task 的弱參照，需自行持有直到完成
+_scope_watchers: Set[asyncio.Task] = set()
+
+
+@fastapi_app.get("/ready")
+def ready():
+    """
+    Readiness probe: 所有必要依賴都預熱完成才回 200，否則回 503 (含各依賴狀態與耗時)。
+    """
+    report = readiness()
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
+
+
+@fastapi_app.get("/cache/stats")
+def cache_stats():
+    """
+    MySQL 模板結果快取的 hit / miss / eviction 統計與目前佔用的位元組數。
+    """
+    return get_result_cache().stats()
+
+
+async def _watch_disconnect(request: Request, scope) -> None:
+    """
+    Client 斷線 (例如前端 300 秒逾時放棄) 時取消該請求所有進行中的查詢，釋放連線池。
+    請求執行完成時此 task 會被 _ScopeCloser 取消 (回應送出後的斷線不會誤取消已完成的請求)；
+    最晚在 QUERY_SCOPE_TTL 後結束並關閉 scope。
+    """
+    interval = float(os.getenv("DISCONNECT_POLL_INTERVAL", 1))
+    deadline = time.monotonic() + float(os.getenv("QUERY_SCOPE_TTL", 900))
+    try:
+        while time.monotonic() < deadline:
+            if await request.is_disconnected():
+                await asyncio.to_thread(scope.cancel)
+                break
+            await asyncio.sleep(interval)
+    finally:
+        close_scope(scope.id)
+
+
+class _ScopeCloser(AsyncCallbackHandler):
+    """
+    請求的 root run 結束 (成功或失敗) 時停止斷線監控，監控 task 的 finally 會關閉 scope。
+    """
+    run_inline = True
+
+    def __init__(self, watcher: asyncio.Task):
+        self._watcher = watcher
+
+    async def on_chain_end(self, outputs, *, run_id, parent_run_id=None, **kwargs) -> None:
+        if parent_run_id is None:
+            self._watcher.cancel()
+
+    async def on_chain_error(self, error, *, run_id, parent_run_id=None, **kwargs) -> None:
+        if parent_run_id is None:
+            self._watcher.cancel()
+
+
+async def _inject_thread_id(config: dict, request: Request) -> dict:
     """
     Middleware to ensure thread_id exists in the config.
     If the client provided it, it should already be in 'config'.
     If not, we inject a default one to prevent Checkpointer errors.
+    Also opens a QueryScope so in-flight SQL can be cancelled when the client disconnects.
     """
     configurable = config.get("configurable", {})
     if "thread_id" not in configurable:
         print(f"⚠️  WARNING: thread_id missing in request config. Injecting default.")
         configurable["thread_id"] = "default_thread_id"
-        config["configurable"] = configurable
     else:
         print(f"✅ Received thread_id: {configurable['thread_id']}")
+
+    scope = open_scope()
+    configurable[SCOPE_CONFIG_KEY] = scope.id
+    config["configurable"] = configurable
+    watcher = asyncio.get_running_loop().create_task(_watch_disconnect(request, scope))
+    _scope_watchers.add(watcher)
+    watcher.add_done_callback(_scope_watchers.discard)
+    config["callbacks"] = list(config.get("callbacks") or []) + [_ScopeCloser(watcher)]
     return config
 
 # 將 LangGraph 註冊為 API 路由
 # 自動生成 /agent/invoke, /agent/stream, /agent/playground 等端點
+# LangServe 的端點走 ainvoke / astream：DataAnalyst / DataRetriever 節點與 MySQL 工具都有 async 實作，
+# 查詢等待期間不佔用 worker thread
 add_routes(
     fastapi_app,
     langgraph_app,
@@ -0,0 +1,72 @@
+"""
+Thread-safe ClickHouse Client Pool
+
+clickhouse_connect 的 Client 物件不適合跨執行緒共用 (session 狀態、進行中的查詢)。
+這裡維護一組 checkout 式的 Client (上限 max_size)，所有 Client 共用同一個 urllib3 HTTP 連線池，
+並關閉自動產生的 session_id，讓每個查詢透過 settings 帶自己的參數，互不干擾。
+"""
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator
+
+from clickhouse_connect.driver import httputil
+
+
+class ClickHouseClientPool:
+    def __init__(self, client_factory: Callable[..., Any], max_size: int = 8, checkout_timeout: float = 30):
+        self._client_factory = client_factory
+        self._max_size = max_size
+        self._checkout_timeout = checkout_timeout
+
+        # 所有 Client 共用同一個 HTTP 連線池 (TLS handshake 只需做一次)
+        self.pool_mgr = httputil.get_pool_manager(verify=False, maxsize=max_size, num_pools=1)
+
+        self._idle: "queue.LifoQueue[Any]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._checked_out = 0
+
+    def _new_client(self):
+        client = self._client_factory(pool_mgr=self.pool_mgr, autogenerate_session_id=False)
+        with self._lock:
+            self._created += 1
+        return client
+
+    @contextmanager
+    def client(self) -> Iterator[Any]:
+        """
+        借出一個 Client；pool 已滿時最多等待 checkout_timeout 秒。
+        """
+        if not self._slots.acquire(timeout=self._checkout_timeout):
+            raise ValueError(
+                f"Error: ClickHouse client pool exhausted ({self._max_size} clients in use)."
+            )
+        try:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                client = self._new_client()
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._checked_out += 1
+        try:
+            yield client
+        finally:
+            with self._lock:
+                self._checked_out -= 1
+            self._idle.put(client)
+            self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "max_size": self._max_size,
+                "created": self._created,
+                "checked_out": self._checked_out,
+                "idle": self._idle.qsize(),
+            }
@@ -1,12 +1,15 @@
 import os
-import time
+import threading
 import traceback
 import paramiko
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, event, exc, MetaData, text
+from sqlalchemy.ext.asyncio import create_async_engine
 from langchain_community.utilities import SQLDatabase
 from dotenv import load_dotenv
 import clickhouse_connect
-from sshtunnel import SSHTunnelForwarder, BaseSSHTunnelForwarderError
+from config.ssh_tunnel import SSHTunnelPool
+from config.clickhouse_pool import ClickHouseClientPool
+from config.schema_snapshot import load_latest_snapshot, refresh_snapshot_in_background
 
 if not hasattr(paramiko, "DSSKey"):
     paramiko.DSSKey = paramiko.RSAKey
@@ -14,99 +17,204 @@ if not hasattr(paramiko, "DSSKey"):
 load_dotenv()
 
 _mysql_db_instance = None
+_mysql_async_engine = None
 _ssh_tunnel = None
+_mysql_init_lock = threading.Lock()
+
+
+def _mysql_pool_settings():
+    """
+    連線池設定 (sync / async engine 共用)，可透過環境變數調整。
+    """
+    return {
+        "pool_size": int(os.getenv('MYSQL_POOL_SIZE', 10)),
+        "max_overflow": int(os.getenv('MYSQL_MAX_OVERFLOW', 10)),
+        "pool_timeout": float(os.getenv('MYSQL_POOL_TIMEOUT', 30)),
+        "pool_recycle": 3600,  # Recycle connections every hour
+        "pool_pre_ping": True,  # Check connection before usage (Auto-reconnect)
+    }
+
+
+def _get_mysql_endpoint():
+    """
+    Returns the (host, port) MySQL should be reached at, establishing the SSH tunnel on first use.
+    """
+    global _ssh_tunnel
+
+    db_host = os.getenv('DB_HOST')
+    db_port = int(os.getenv('DB_PORT', 3306))
+
+    # Check if SSH Tunnel is enabled (Default to True for backward compatibility)
+    use_ssh_tunnel = os.getenv('USE_SSH_TUNNEL', 'True').lower() == 'true'
+
+    if not use_ssh_tunnel:
+        print(f"🚀 Skipping SSH Tunnel. Connecting directly to MySQL at {db_host}:{db_port}...")
+        return db_host, db_port
+
+    if _ssh_tunnel is not None:
+        return _ssh_tunnel.local_address
+
+    # SSH Connection details
+    ssh_host = os.getenv('SSH_HOST')
+    ssh_port = int(os.getenv('SSH_PORT', 22))
+    ssh_user = os.getenv('SSH_USER')
+    ssh_password = os.getenv('SSH_PASSWORD')
+
+    print(f"🛡️  Establishing SSH Tunnel to {ssh_host}...")
+
+    ssh_args = {
+        "ssh_address_or_host": (ssh_host, ssh_port),
+        "ssh_username": ssh_user,
+        "remote_bind_address": (db_host, db_port),
+        "ssh_password": ssh_password,
+        "set_keepalive": 30.0, # Send keepalive packets every 30 seconds
+    }
+
+    # 建立受監控的 Tunnel Pool：背景執行緒會探測存活並在斷線時自動重建
+    pool = create_tunnel_pool(ssh_args)
+    local_address = pool.start()
+    _ssh_tunnel = pool
+    return local_address
+
+
+def create_tunnel_pool(ssh_args, channels=None, policy=None):
+    """
+    SSH_TUNNEL_CHANNELS 條獨立的 SSH Tunnel (預設 1)，新連線依 SSH_TUNNEL_POLICY
+    (round_robin / least_connections / random) 分散到各 Tunnel。
+    """
+    channels = channels or int(os.getenv('SSH_TUNNEL_CHANNELS', 1))
+    policy = policy or os.getenv('SSH_TUNNEL_POLICY', 'round_robin')
+    if channels > 1:
+        print(f"🛡️  Using {channels} SSH tunnel channels (policy: {policy})")
+    return SSHTunnelPool(ssh_args, channels=channels, policy=policy)
+
+
+def _route_through_tunnel(engine, pool=None):
+    """
+    讓 Engine 的每條新連線都連到 Tunnel Pool 挑選出的 Tunnel「目前」的本地 port。
+    Tunnel 重建後 port 會改變：每條連線記錄自己的 (tunnel index, generation)，
+    checkout 時只淘汰屬於已重建 Tunnel 舊世代的連線，其他 Tunnel 的連線照常使用。
+    請求端不需要重建 Engine，也不會因為重建過程而被阻塞 (僅新連線最多等待 SSH_TUNNEL_CONNECT_WAIT 秒)。
+    """
+    pool = pool or _ssh_tunnel
+    if pool is None:
+        return
+
+    connect_wait = float(os.getenv('SSH_TUNNEL_CONNECT_WAIT', 10))
+    # detach 後的連線不再有 connection record，改以 DBAPI 連線物件的 id 保存 tag，直到 close_detached
+    detached_tags = {}
+    detached_lock = threading.Lock()
+
+    @event.listens_for(engine, "do_connect")
+    def _use_current_tunnel(dialect, conn_rec, cargs, cparams):
+        if not pool.wait_until_up(connect_wait):
+            raise ValueError("Error: SSH Tunnel is down and is being rebuilt.")
+        tag, (host, port) = pool.acquire()
+        conn_rec.info["ssh_tunnel"] = tag
+        cparams["host"], cparams["port"] = host, port
+
+    def _release_tunnel(dbapi_connection, conn_rec, *args):
+        # invalidate 之後通常還會觸發 close；pop 確保每條連線只扣一次
+        tag = conn_rec.info.pop("ssh_tunnel", None)
+        if tag is not None:
+            pool.release(tag)
+
+    def _detach_tunnel(dbapi_connection, conn_rec):
+        tag = conn_rec.info.pop("ssh_tunnel", None)
+        if tag is not None:
+            with detached_lock:
+                detached_tags[id(dbapi_connection)] = tag
+
+    def _release_detached(dbapi_connection):
+        with detached_lock:
+            tag = detached_tags.pop(id(dbapi_connection), None)
+        if tag is not None:
+            pool.release(tag)
+
+    @event.listens_for(engine, "checkout")
+    def _reject_stale_tunnel(dbapi_connection, conn_rec, conn_proxy):
+        # DisconnectionError 讓連線池 invalidate 這條連線並改用 (或新建) 另一條，呼叫端不會看到錯誤
+        tag = conn_rec.info.get("ssh_tunnel")
+        if tag is not None and not pool.is_current(tag):
+            raise exc.DisconnectionError(f"SSH tunnel {tag[0]} was rebuilt; dropping connection to the old port.")
+
+    event.listen(engine, "close", _release_tunnel)
+    event.listen(engine, "invalidate", _release_tunnel)
+    event.listen(engine, "detach", _detach_tunnel)
+    event.listen(engine, "close_detached", _release_detached)
+
+
+def get_tunnel_stats():
+    """
+    SSH Tunnel 狀態與計數器 (tunnel_up, reconnects, failed_attempts...)，供 health check 使用。
+    """
+    if _ssh_tunnel is None:
+        return {"enabled": False}
+    return {"enabled": True, **_ssh_tunnel.stats()}
+
+
+def _build_mysql_uri(driver, host, port):
+    db_user = os.getenv('DB_USER')
+    db_password = os.getenv('DB_PASSWORD')
+    db_name = os.getenv('DB_NAME')
+    return (
+        f"mysql+{driver}://{db_user}:{db_password}"
+        f"@{host}:{port}/{db_name}"
+    )
+
+
+def _schema_reflection_mode():
+    """
+    MYSQL_SCHEMA_REFLECTION:
+      - snapshot (預設): 載入本機 schema 快照，背景比對 hash 並更新
+      - full: 啟動時完整 MetaData.reflect (舊行為)
+      - none: 不反射 (工具只執行手寫模板時使用)，由 lazy_table_reflection 按需載入
+    """
+    return os.getenv('MYSQL_SCHEMA_REFLECTION', 'snapshot').lower()
+
+
+def _load_schema_metadata(engine):
+    mode = _schema_reflection_mode()
+    if mode == "full":
+        metadata = MetaData()
+        metadata.reflect(bind=engine, resolve_fks=False)
+        return metadata
+    if mode == "snapshot":
+        return load_latest_snapshot(os.getenv('DB_NAME')) or MetaData()
+    return MetaData()
 
 
 def get_mysql_db():
     global _mysql_db_instance, _ssh_tunnel
-    if _mysql_db_instance is None:
+    if _mysql_db_instance is not None:
+        return _mysql_db_instance
+
+    # Startup warm-up 與第一個請求可能同時呼叫，只允許一個執行緒建立 Tunnel / Engine
+    with _mysql_init_lock:
+        if _mysql_db_instance is not None:
+            return _mysql_db_instance
+
         print("🔌 Initializing MySQL connection...")
-        
-        db_user = os.getenv('DB_USER')
-        db_password = os.getenv('DB_PASSWORD')
-        db_name = os.getenv('DB_NAME')
-        db_host = os.getenv('DB_HOST')
-        db_port = int(os.getenv('DB_PORT', 3306))
-
-        # Check if SSH Tunnel is enabled (Default to True for backward compatibility)
-        use_ssh_tunnel = os.getenv('USE_SSH_TUNNEL', 'True').lower() == 'true'
-
-        current_host = db_host
-        current_port = db_port
-
-        if use_ssh_tunnel:
-            # SSH Connection details
-            ssh_host = os.getenv('SSH_HOST')
-            ssh_port = int(os.getenv('SSH_PORT', 22))
-            ssh_user = os.getenv('SSH_USER')
-            ssh_password = os.getenv('SSH_PASSWORD')
-
-            print(f"🛡️  Establishing SSH Tunnel to {ssh_host}...")
-
-            ssh_args = {
-                "ssh_address_or_host": (ssh_host, ssh_port),
-                "ssh_username": ssh_user,
-                "remote_bind_address": (db_host, db_port),
-                "ssh_password": ssh_password,
-                "set_keepalive": 30.0, # Send keepalive packets every 30 seconds
-            }
-
-            # Retry mechanism for SSH connection
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    if _ssh_tunnel:
-                        _ssh_tunnel.stop()
-                    
-                    _ssh_tunnel = SSHTunnelForwarder(**ssh_args)
-                    _ssh_tunnel.start()
-                    
-                    # Verify tunnel is active
-                    if _ssh_tunnel.is_active:
-                        break
-                except BaseSSHTunnelForwarderError as e:
-                    print(f"⚠️ SSH Tunnel connection failed (Attempt {attempt + 1}/{max_retries}): {e}")
-                    if attempt < max_retries - 1:
-                        time.sleep(5) # Wait before retry
-                    else:
-                        print("❌ Detailed Error Traceback:")
-                        traceback.print_exc()
-                        raise ValueError("Error: Could not establish SSH Tunnel after multiple attempts.") from e
-                except Exception as e:
-                    print("❌ Detailed Error Traceback:")
-                    traceback.print_exc()
-                    raise ValueError(f"Error: Unexpected error during SSH connection: {e}") from e
-
-            if _ssh_tunnel and _ssh_tunnel.is_active:
-                print(f"✅ SSH Tunnel established! Local bind port: {_ssh_tunnel.local_bind_port}")
-                # Override host and port to use the tunnel
-                current_host = "127.0.0.1"
-                current_port = _ssh_tunnel.local_bind_port
-            else:
-                 raise ValueError("Error: SSH Tunnel is not active.")
-        else:
-            print(f"🚀 Skipping SSH Tunnel. Connecting directly to MySQL at {current_host}:{current_port}...")
 
-        db_uri = (
-            f"mysql+mysqlconnector://{db_user}:{db_password}"
-            f"@{current_host}:{current_port}/{db_name}"
-        )
+        current_host, current_port = _get_mysql_endpoint()
+        db_uri = _build_mysql_uri("mysqlconnector", current_host, current_port)
 
         try:
             # Add connection pooling settings
             engine = create_engine(
                 db_uri,
-                pool_recycle=3600,  # Recycle connections every hour
-                pool_pre_ping=True,  # Check connection before usage (Auto-reconnect)
+                **_mysql_pool_settings(),
                 connect_args={'consume_results': True} # Ensure previous results are consumed
             )
-            metadata = MetaData()
-            metadata.reflect(bind=engine, resolve_fks=False)
+            _route_through_tunnel(engine)
+            metadata = _load_schema_metadata(engine)
             _mysql_db_instance = SQLDatabase(
                 engine=engine,
                 metadata=metadata,
                 lazy_table_reflection=True
             )
+            if _schema_reflection_mode() == "snapshot":
+                refresh_snapshot_in_background(_mysql_db_instance, os.getenv('DB_NAME'))
         except Exception as e:
             print("❌ Database Engine Creation Failed:")
             traceback.print_exc()
@@ -114,31 +222,122 @@ def get_mysql_db():
                 _ssh_tunnel.stop()
                 _ssh_tunnel = None
             raise ValueError("Error: Could not create MySQL Engine.") from e
-             
+
     return _mysql_db_instance
 
+
+def get_mysql_db_async():
+    """
+    Async 版本的 MySQL Engine (aiomysql)，與 get_mysql_db 共用同一條 SSH Tunnel。
+    查詢等待 I/O 時不佔用 worker thread，適合高併發的 chat sessions。
+    """
+    global _mysql_async_engine
+    if _mysql_async_engine is not None:
+        return _mysql_async_engine
+
+    with _mysql_init_lock:
+        if _mysql_async_engine is not None:
+            return _mysql_async_engine
+
+        print("🔌 Initializing async MySQL engine...")
+
+        current_host, current_port = _get_mysql_endpoint()
+        db_uri = _build_mysql_uri("aiomysql", current_host, current_port)
+
+        try:
+            _mysql_async_engine = create_async_engine(db_uri, **_mysql_pool_settings())
+            _route_through_tunnel(_mysql_async_engine.sync_engine)
+        except Exception as e:
+            print("❌ Async Database Engine Creation Failed:")
+            traceback.print_exc()
+            raise ValueError("Error: Could not create async MySQL Engine.") from e
+
+    return _mysql_async_engine
+
 # ClickHouse Connection
+_ch_pool = None
+_ch_pool_lock = threading.Lock()
 _ch_db_instance = None
 
 
+def _create_clickhouse_client(**kwargs):
+    try:
+        return clickhouse_connect.get_client(
+            host=os.getenv('CH_DB_HOST'),
+            port=int(os.getenv('CH_DB_PORT')),
+            secure=True,
+            verify=False,
+            username=os.getenv('CH_DB_USER'),
+            password=os.getenv('CH_DB_PASSWORD'),
+            database=os.getenv('CH_DB_NAME'),
+            **kwargs
+        )
+    except Exception as e:
+        raise ValueError(
+            f"Error: Could not establish ClickHouse HTTPS connection: {e}"
+        )
+
+
+def get_clickhouse_pool():
+    """
+    執行緒安全的 ClickHouse Client Pool (上限 CH_POOL_SIZE，共用同一個 HTTP 連線池)。
+    """
+    global _ch_pool
+    if _ch_pool is None:
+        with _ch_pool_lock:
+            if _ch_pool is None:
+                print("🔌 Initializing ClickHouse HTTPS client pool...")
+                _ch_pool = ClickHouseClientPool(
+                    _create_clickhouse_client,
+                    max_size=int(os.getenv('CH_POOL_SIZE', 8)),
+                    checkout_timeout=float(os.getenv('CH_POOL_TIMEOUT', 30)),
+                )
+    return _ch_pool
+
+
+def clickhouse_client():
+    """
+    借出一個 ClickHouse Client，用法: `with clickhouse_client() as client: ...`
+    """
+    return get_clickhouse_pool().client()
+
+
+def clickhouse_query_settings(**overrides):
+    """
+    單次查詢的 ClickHouse settings。Client 不使用 session，所有設定都隨查詢帶上，
+    避免不同對話 session 之間互相覆蓋設定。
+    """
+    settings = {}
+    if os.getenv('CH_MAX_THREADS'):
+        settings["max_threads"] = int(os.getenv('CH_MAX_THREADS'))
+    settings.update({k: v for k, v in overrides.items() if v is not None})
+    return settings
+
+
+def kill_mysql_query(connection_id: int) -> None:
+    """
+    以另一條連線對指定的 MySQL connection 送出 KILL QUERY (只中斷查詢，連線保留在連線池)。
+    """
+    with get_mysql_db()._engine.connect() as connection:
+        connection.execute(text(f"KILL QUERY {int(connection_id)}"))
+
+
+def kill_clickhouse_query(query_id: str) -> None:
+    with clickhouse_client() as client:
+        client.command(
+            "KILL QUERY WHERE query_id = {query_id:String} ASYNC",
+            parameters={"query_id": query_id}
+        )
+
+
 def get_clickhouse_db():
+    """
+    單一共用 Client (僅供 scripts / 連線測試使用)；工具請改用 clickhouse_client()。
+    """
     global _ch_db_instance
     if _ch_db_instance is None:
         print("🔌 Initializing ClickHouse HTTPS connection...")
-        try:
-            _ch_db_instance = clickhouse_connect.get_client(
-                host=os.getenv('CH_DB_HOST'),
-                port=int(os.getenv('CH_DB_PORT')),
-                secure=True,
-                verify=False,
-                username=os.getenv('CH_DB_USER'),
-                password=os.getenv('CH_DB_PASSWORD'),
-                database=os.getenv('CH_DB_NAME'),
-            )
-        except Exception as e:
-            raise ValueError(
-                f"Error: Could not establish ClickHouse HTTPS connection: {e}"
-            )
+        _ch_db_instance = _create_clickhouse_client(pool_mgr=get_clickhouse_pool().pool_mgr)
     return _ch_db_instance
 
 
@@ -0,0 +1,233 @@
+"""
+Query Deadlines & Cancellation
+
+- 每個模板有自己的執行時限 (MySQL MAX_EXECUTION_TIME / ClickHouse max_execution_time)
+- 每個 API 請求對應一個 QueryScope，記錄進行中的查詢 (MySQL connection id / ClickHouse query_id)
+- Client 斷線時 QueryScope.cancel() 對所有進行中的查詢送出 KILL QUERY
+- 逾時 / 被取消 / 超過讀取上限的查詢轉成結構化錯誤 (error_type: timeout / cancelled / cost_limit)，讓 Agent 可以據此調整
+"""
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from sqlalchemy import text
+
+from tools.template_registry import get_registry
+
+# configurable 中攜帶 QueryScope id 的 key (由 backend per_req_config_modifier 注入)
+SCOPE_CONFIG_KEY = "query_scope_id"
+
+# MySQL: 3024 = 超過 MAX_EXECUTION_TIME, 1317 = 被 KILL QUERY 中斷
+# ClickHouse: 159 = TIMEOUT_EXCEEDED, 394 = QUERY_WAS_CANCELLED
+_TIMEOUT_CODES = {3024, 159}
+_CANCEL_CODES = {1317, 394}
+# ClickHouse: 158 = TOO_MANY_ROWS, 307 = TOO_MANY_BYTES (max_rows_to_read / max_bytes_to_read)
+_READ_LIMIT_CODES = {158, 307}
+
+
+def query_timeout(template_name: Optional[str] = None) -> float:
+    """
+    模板的執行時限 (秒)：template_index.yaml 的 timeout，未設定時使用 QUERY_TIMEOUT_DEFAULT；
+    皆需小於前端 300 秒的請求逾時。環境變數 QUERY_TIMEOUT_<TEMPLATE> (例如 QUERY_TIMEOUT_ID_FINDER) 可覆寫。
+    """
+    default = float(os.getenv('QUERY_TIMEOUT_DEFAULT', 60))
+    if not template_name:
+        return default
+    # 接受索引名稱 (id_finder) 或檔名 (id_finder.sql)
+    name = os.path.splitext(os.path.basename(template_name))[0]
+    override = os.getenv(f'QUERY_TIMEOUT_{name.upper()}')
+    if override:
+        return float(override)
+    try:
+        timeout = get_registry().get(name).timeout
+    except ValueError:
+        return default
+    return timeout if timeout is not None else default
+
+
+class QueryScope:
+    """
+    單一 API 請求內所有進行中的查詢；cancel() 後新查詢不會再送出，進行中的查詢會被 KILL。
+    """
+
+    def __init__(self, scope_id: Optional[str] = None):
+        self.id = scope_id or uuid.uuid4().hex
+        self.created_at = time.monotonic()
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Tuple[str, Any]] = {}
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def register(self, backend: str, ident: Any) -> str:
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._inflight[token] = (backend, ident)
+        return token
+
+    def unregister(self, token: str) -> None:
+        with self._lock:
+            self._inflight.pop(token, None)
+
+    def cancel(self) -> int:
+        """
+        標記取消並 KILL 所有進行中的查詢，回傳送出的 KILL 數量。
+        """
+        from config.database import kill_clickhouse_query, kill_mysql_query
+
+        self._cancelled.set()
+        with self._lock:
+            inflight = list(self._inflight.values())
+
+        killed = 0
+        for backend, ident in inflight:
+            try:
+                if backend == "mysql":
+                    kill_mysql_query(ident)
+                else:
+                    kill_clickhouse_query(ident)
+                killed += 1
+            except Exception as e:
+                print(f"⚠️ Failed to kill {backend} query {ident}: {e}")
+        if killed:
+            print(f"🛑 Cancelled {killed} in-flight queries for scope {self.id}")
+        return killed
+
+
+_scopes: Dict[str, QueryScope] = {}
+_scopes_lock = threading.Lock()
+
+
+def open_scope() -> QueryScope:
+    scope = QueryScope()
+    with _scopes_lock:
+        _scopes[scope.id] = scope
+    return scope
+
+
+def close_scope(scope_id: str) -> None:
+    with _scopes_lock:
+        _scopes.pop(scope_id, None)
+
+
+def current_scope() -> Optional[QueryScope]:
+    """
+    從目前 Runnable config 取出 QueryScope。
+    LangChain 以 ContextVar 傳遞 config，ToolNode 的 worker thread 也拿得到。
+    """
+    try:
+        from langchain_core.runnables.config import ensure_config
+        scope_id = ensure_config().get("configurable", {}).get(SCOPE_CONFIG_KEY)
+    except Exception:
+        return None
+    if not scope_id:
+        return None
+    with _scopes_lock:
+        return _scopes.get(scope_id)
+
+
+class QueryCancelledError(Exception):
+    pass
+
+
+@contextmanager
+def track_query(backend: str, ident: Any) -> Iterator[Optional[QueryScope]]:
+    """
+    在目前的 QueryScope 登記一個進行中的查詢；請求已取消時直接拋出 QueryCancelledError。
+    """
+    scope = current_scope()
+    if scope is None:
+        yield None
+        return
+    if scope.cancelled:
+        raise QueryCancelledError("Query was cancelled because the client disconnected.")
+    token = scope.register(backend, ident)
+    try:
+        yield scope
+    finally:
+        scope.unregister(token)
+
+
+# ----------------------------------------------------------------------
+# MySQL session helpers
+# ----------------------------------------------------------------------
+# 連線的 connection id 與目前的 MAX_EXECUTION_TIME 快取在 connection.info
+# (跟著 DBAPI 連線的生命週期，連線被 invalidate 重建時自動清空)，大多數查詢不需額外 round-trip。
+_SET_TIMEOUT_SQL = "SET SESSION MAX_EXECUTION_TIME = {ms}"
+_CONNECTION_ID_SQL = text("SELECT CONNECTION_ID()")
+
+
+def prepare_mysql_session(connection, timeout: float) -> int:
+    """
+    設定連線的 MAX_EXECUTION_TIME 並回傳 MySQL connection id (供 KILL QUERY 使用)。
+    """
+    info = connection.info
+    if "mysql_connection_id" not in info:
+        info["mysql_connection_id"] = connection.execute(_CONNECTION_ID_SQL).scalar()
+    ms = int(timeout * 1000)
+    if info.get("mysql_max_execution_time") != ms:
+        connection.execute(text(_SET_TIMEOUT_SQL.format(ms=ms)))
+        info["mysql_max_execution_time"] = ms
+    return info["mysql_connection_id"]
+
+
+async def prepare_mysql_session_async(connection, timeout: float) -> int:
+    info = connection.info
+    if "mysql_connection_id" not in info:
+        info["mysql_connection_id"] = (await connection.execute(_CONNECTION_ID_SQL)).scalar()
+    ms = int(timeout * 1000)
+    if info.get("mysql_max_execution_time") != ms:
+        await connection.execute(text(_SET_TIMEOUT_SQL.format(ms=ms)))
+        info["mysql_max_execution_time"] = ms
+    return info["mysql_connection_id"]
+
+
+# ----------------------------------------------------------------------
+# Error classification
+# ----------------------------------------------------------------------
+def _error_code(e: Exception) -> Optional[int]:
+    # SQLAlchemy 包裝的 DBAPI 例外: mysql-connector 有 errno，pymysql/aiomysql 放在 args[0]
+    orig = getattr(e, "orig", None) or e
+    code = getattr(orig, "errno", None)
+    if code is None and orig.args and isinstance(orig.args[0], int):
+        code = orig.args[0]
+    if code is None:
+        # clickhouse_connect: "... Code: 159. DB::Exception: Timeout exceeded ..."
+        match = re.search(r"Code: (\d+)\.", str(e))
+        code = int(match.group(1)) if match else None
+    return code
+
+
+def query_error(e: Exception, generated_sql: Optional[str], timeout: float, label: Optional[str] = None) -> Dict[str, Any]:
+    """
+    將查詢例外轉成工具回傳格式；逾時 / 取消會帶 error_type 與給 Agent 的建議。
+    """
+    code = _error_code(e)
+    scope = current_scope()
+    result: Dict[str, Any] = {"status": "error", "generated_sql": generated_sql}
+
+    if isinstance(e, QueryCancelledError) or (scope and scope.cancelled) or code in _CANCEL_CODES:
+        result["error_type"] = "cancelled"
+        result["message"] = "Query was cancelled because the client disconnected. Do not retry."
+    elif code in _TIMEOUT_CODES:
+        result["error_type"] = "timeout"
+        result["timeout_seconds"] = timeout
+        result["message"] = (
+            f"Query exceeded the {timeout:.0f}s execution limit. "
+            "Narrow the date range or add filters (e.g. fewer IDs) and retry once."
+        )
+    elif code in _READ_LIMIT_CODES:
+        result["error_type"] = "cost_limit"
+        result["message"] = (
+            "Query read more data than the scan budget allows. "
+            "Add plaids or cmpids (from id_finder), filter by format or category, or narrow the date range, then retry."
+        )
+    else:
+        result["message"] = f"{label}: {e}" if label else str(e)
+    return result
@@ -0,0 +1,115 @@
+"""
+MySQL Schema Snapshot Cache
+
+完整的 MetaData.reflect 需要對每張表各查一次 information_schema，經過 SSH Tunnel 時冷啟動會非常慢。
+這裡將反射結果序列化到本機檔案 (以 DB 名稱 + schema hash 為 key)，之後啟動直接載入，
+並在背景比對 schema hash，有變動時才重新反射並更新快照。
+"""
+import glob
+import hashlib
+import os
+import pickle
+import threading
+import traceback
+from typing import Optional
+
+from sqlalchemy import MetaData, text
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNAPSHOT_DIR = os.getenv('SCHEMA_SNAPSHOT_DIR', os.path.join(PROJECT_ROOT, ".cache", "schema"))
+
+_SCHEMA_FINGERPRINT_SQL = text("""
+    SELECT table_name, column_name, column_type, is_nullable, column_key
+    FROM information_schema.columns
+    WHERE table_schema = DATABASE()
+    ORDER BY table_name, ordinal_position
+""")
+
+
+def compute_schema_hash(engine) -> str:
+    """
+    以單一 information_schema 查詢計算整個 schema 的指紋 (比完整反射便宜得多)。
+    """
+    digest = hashlib.sha256()
+    with engine.connect() as connection:
+        for row in connection.execute(_SCHEMA_FINGERPRINT_SQL):
+            digest.update("|".join(str(v) for v in row).encode("utf-8"))
+            digest.update(b"\n")
+    return digest.hexdigest()[:16]
+
+
+def snapshot_path(db_name: str, schema_hash: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{db_name}-{schema_hash}.pickle")
+
+
+def _snapshot_files(db_name: str):
+    return glob.glob(os.path.join(SNAPSHOT_DIR, f"{db_name}-*.pickle"))
+
+
+def load_latest_snapshot(db_name: str) -> Optional[MetaData]:
+    """
+    載入該 DB 最新的快照；沒有快照或檔案損毀時回傳 None。
+    """
+    files = sorted(_snapshot_files(db_name), key=os.path.getmtime, reverse=True)
+    for path in files:
+        try:
+            with open(path, "rb") as f:
+                metadata = pickle.load(f)
+            print(f"📦 Loaded schema snapshot {os.path.basename(path)} ({len(metadata.tables)} tables)")
+            return metadata
+        except Exception as e:
+            print(f"⚠️ Failed to load schema snapshot {path}: {e}")
+    return None
+
+
+def save_snapshot(db_name: str, schema_hash: str, metadata: MetaData) -> str:
+    """
+    寫入新快照 (先寫暫存檔再 rename，避免其他 process 讀到半份檔案)，並清除同 DB 的舊快照。
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    path = snapshot_path(db_name, schema_hash)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(metadata, f)
+    os.replace(tmp_path, path)
+
+    for old in _snapshot_files(db_name):
+        if old != path:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return path
+
+
+def refresh_snapshot(db, db_name: str) -> None:
+    """
+    比對 schema hash，快照過期或不存在時重新反射並寫入快照，同時替換 SQLDatabase 的 metadata。
+    """
+    engine = db._engine
+    schema_hash = compute_schema_hash(engine)
+    path = snapshot_path(db_name, schema_hash)
+
+    if os.path.exists(path):
+        print(f"✅ Schema snapshot is up to date ({schema_hash})")
+        return
+
+    print(f"🔄 Schema changed or no snapshot found ({schema_hash}). Reflecting in background...")
+    metadata = MetaData()
+    metadata.reflect(bind=engine, resolve_fks=False)
+    save_snapshot(db_name, schema_hash, metadata)
+    db._metadata = metadata
+    print(f"✅ Schema snapshot refreshed: {len(metadata.tables)} tables")
+
+
+def refresh_snapshot_in_background(db, db_name: str) -> threading.Thread:
+    def _run():
+        try:
+            refresh_snapshot(db, db_name)
+        except Exception as e:
+            print(f"⚠️ Background schema snapshot refresh failed: {e}")
+            traceback.print_exc()
+
+    thread = threading.Thread(target=_run, name="schema-snapshot-refresh", daemon=True)
+    thread.start()
+    return thread
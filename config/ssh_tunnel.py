@@ -0,0 +1,382 @@
+"""
+Supervised SSH Tunnel
+
+將 SSHTunnelForwarder 包裝成可自我修復的 Tunnel：
+- 背景執行緒定期探測 Tunnel 是否存活 (SSH transport + 本地 bind port 實際連線)
+- 斷線時自動重建 Forwarder，並通知已註冊的 listener (例如 Engine 丟棄舊連線池)
+- 提供 tunnel-up / reconnect 等計數器供監控使用
+- SSHTunnelPool: 多條 Tunnel (各自的 SSH transport) 平行分擔查詢流量
+"""
+import itertools
+import os
+import random
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sshtunnel import SSHTunnelForwarder, BaseSSHTunnelForwarderError
+
+
+class SupervisedSSHTunnel:
+    def __init__(
+        self,
+        ssh_args: Dict[str, Any],
+        probe_interval: Optional[float] = None,
+        name: str = "ssh-tunnel",
+    ):
+        self._ssh_args = ssh_args
+        self._probe_interval = probe_interval or float(os.getenv('SSH_TUNNEL_PROBE_INTERVAL', 15))
+        self._max_backoff = float(os.getenv('SSH_TUNNEL_MAX_BACKOFF', 60))
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._forwarder: Optional[SSHTunnelForwarder] = None
+        self._local_address: Optional[Tuple[str, int]] = None
+        self._up = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[], None]] = []
+
+        self._stats = {
+            "tunnel_up": False,
+            "connects": 0,
+            "reconnects": 0,
+            "failed_attempts": 0,
+            "probes": 0,
+            "last_probe_at": None,
+            "last_reconnect_at": None,
+            "last_error": None,
+        }
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def start(self, max_retries: int = 3, retry_delay: float = 5) -> Tuple[str, int]:
+        """
+        建立第一條 Tunnel (阻塞，失敗會重試)，成功後啟動背景監控執行緒。
+        """
+        for attempt in range(max_retries):
+            try:
+                self._connect()
+                break
+            except BaseSSHTunnelForwarderError as e:
+                print(f"⚠️ SSH Tunnel connection failed (Attempt {attempt + 1}/{max_retries}): {e}")
+                if attempt < max_retries - 1:
+                    time.sleep(retry_delay) # Wait before retry
+                else:
+                    print("❌ Detailed Error Traceback:")
+                    traceback.print_exc()
+                    raise ValueError("Error: Could not establish SSH Tunnel after multiple attempts.") from e
+            except Exception as e:
+                print("❌ Detailed Error Traceback:")
+                traceback.print_exc()
+                raise ValueError(f"Error: Unexpected error during SSH connection: {e}") from e
+
+        if not self._up.is_set():
+            raise ValueError("Error: SSH Tunnel is not active.")
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._supervise, name=f"{self.name}-supervisor", daemon=True)
+            self._thread.start()
+
+        return self.local_address
+
+    def stop(self) -> None:
+        # 與 _connect 在同一把鎖下設定 / 檢查停止旗標：stop() 之後 supervisor 不會再裝上新的 forwarder
+        with self._lock:
+            self._stopping.set()
+            self._up.clear()
+            self._stats["tunnel_up"] = False
+            if self._forwarder:
+                try:
+                    self._forwarder.stop()
+                except Exception:
+                    pass
+                self._forwarder = None
+
+    @property
+    def local_address(self) -> Tuple[str, int]:
+        with self._lock:
+            if self._local_address is None:
+                raise ValueError("Error: SSH Tunnel is not active.")
+            return self._local_address
+
+    @property
+    def is_up(self) -> bool:
+        return self._up.is_set()
+
+    def wait_until_up(self, timeout: Optional[float] = None) -> bool:
+        """
+        Tunnel 重建期間，新連線最多等待 timeout 秒；其餘情況立即返回。
+        """
+        return self._up.wait(timeout)
+
+    def add_reconnect_listener(self, callback: Callable[[], None]) -> None:
+        """
+        註冊 Tunnel 重建後的 callback (例如讓 Engine 丟棄指向舊 port 的連線)
+        """
+        self._listeners.append(callback)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["local_bind_port"] = self._local_address[1] if self._local_address else None
+        return snapshot
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _connect(self) -> bool:
+        """
+        建立新的 forwarder 並取代舊的；stop() 已被呼叫時丟棄新建的 forwarder 並回傳 False。
+        """
+        with self._lock:
+            if self._stopping.is_set():
+                return False
+        forwarder = SSHTunnelForwarder(**self._ssh_args)
+        forwarder.start()
+        if not forwarder.is_active:
+            forwarder.stop()
+            raise BaseSSHTunnelForwarderError("SSH transport is not active after start()")
+
+        with self._lock:
+            # 建立期間 stop() 可能已被呼叫
+            stopped = self._stopping.is_set()
+            if not stopped:
+                old = self._forwarder
+                self._forwarder = forwarder
+                self._local_address = ("127.0.0.1", forwarder.local_bind_port)
+                self._stats["connects"] += 1
+                self._stats["tunnel_up"] = True
+                self._stats["last_error"] = None
+                self._up.set()
+        if stopped:
+            try:
+                forwarder.stop()
+            except Exception:
+                pass
+            return False
+
+        if old is not None:
+            try:
+                old.stop()
+            except Exception:
+                pass
+
+        print(f"✅ SSH Tunnel established! Local bind port: {forwarder.local_bind_port}")
+        return True
+
+    def _probe(self) -> bool:
+        with self._lock:
+            forwarder = self._forwarder
+            self._stats["probes"] += 1
+            self._stats["last_probe_at"] = datetime.now().isoformat(timespec="seconds")
+        if forwarder is None or not forwarder.is_active:
+            return False
+        try:
+            # 實際對本地 bind port 建立連線，確認轉發到遠端 DB 仍然可用
+            forwarder.check_tunnels()
+            return all(forwarder.tunnel_is_up.values())
+        except Exception:
+            return False
+
+    def _supervise(self) -> None:
+        backoff = 1.0
+        while not self._stopping.wait(self._probe_interval if self._up.is_set() else backoff):
+            if self._up.is_set() and self._probe():
+                continue
+
+            if self._up.is_set():
+                print(f"⚠️ [{self.name}] Tunnel probe failed. Rebuilding forwarder...")
+                self._up.clear()
+                with self._lock:
+                    self._stats["tunnel_up"] = False
+
+            try:
+                if not self._connect():
+                    break
+            except Exception as e:
+                with self._lock:
+                    self._stats["failed_attempts"] += 1
+                    self._stats["last_error"] = str(e)
+                print(f"⚠️ [{self.name}] Reconnect failed: {e}. Retrying in {backoff:.0f}s")
+                backoff = min(backoff * 2, self._max_backoff)
+                continue
+
+            backoff = 1.0
+            with self._lock:
+                self._stats["reconnects"] += 1
+                self._stats["last_reconnect_at"] = datetime.now().isoformat(timespec="seconds")
+            for callback in self._listeners:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"⚠️ [{self.name}] Reconnect listener failed: {e}")
+
+
+# ----------------------------------------------------------------------
+# Multi-channel Tunnel Pool
+# ----------------------------------------------------------------------
+# 分流策略：輸入 (candidates, open_connections) 回傳要使用的 tunnel index。
+# candidates 為存活中的 tunnel index，open_connections 為每條 tunnel 目前的連線數。
+TunnelPolicy = Callable[[List[int], List[int]], int]
+
+
+def _round_robin_policy():
+    counter = itertools.count()
+
+    def _choose(candidates: List[int], open_connections: List[int]) -> int:
+        return candidates[next(counter) % len(candidates)]
+
+    return _choose
+
+
+def _least_connections_policy():
+    def _choose(candidates: List[int], open_connections: List[int]) -> int:
+        return min(candidates, key=lambda i: open_connections[i])
+
+    return _choose
+
+
+def _random_policy():
+    def _choose(candidates: List[int], open_connections: List[int]) -> int:
+        return random.choice(candidates)
+
+    return _choose
+
+
+# name -> policy factory (每個 pool 會建立自己的 policy 實例，例如各自的 round-robin 計數器)
+TUNNEL_POLICIES: Dict[str, Callable[[], TunnelPolicy]] = {
+    "round_robin": _round_robin_policy,
+    "least_connections": _least_connections_policy,
+    "random": _random_policy,
+}
+
+
+def register_tunnel_policy(name: str, factory: Callable[[], TunnelPolicy]) -> None:
+    TUNNEL_POLICIES[name] = factory
+
+
+class SSHTunnelPool:
+    """
+    N 條獨立的 SupervisedSSHTunnel (各自的 SSH transport 與本地 bind port)，
+    由可替換的 policy 將 Engine 的新連線分散到不同 Tunnel 上。
+    """
+
+    def __init__(self, ssh_args: Dict[str, Any], channels: int = 1, policy: str = "round_robin"):
+        if policy not in TUNNEL_POLICIES:
+            raise ValueError(f"Error: Unknown SSH tunnel policy '{policy}'. Available: {list(TUNNEL_POLICIES)}")
+
+        self.tunnels = [
+            SupervisedSSHTunnel(ssh_args, name=f"ssh-tunnel-{i}")
+            for i in range(max(1, channels))
+        ]
+        self.policy_name = policy
+        self._policy = TUNNEL_POLICIES[policy]()
+        self._lock = threading.Lock()
+        self._open_connections = [0] * len(self.tunnels)
+        # 每次重置連線數時 +1；release 只計入同一代開啟的連線，舊連線稍後關閉不會扣到新連線的計數
+        self._generations = [0] * len(self.tunnels)
+
+        for index, tunnel in enumerate(self.tunnels):
+            tunnel.add_reconnect_listener(lambda i=index: self._reset_connections(i))
+
+    def start(self) -> Tuple[str, int]:
+        """
+        平行建立所有 Tunnel；任一條失敗即視為啟動失敗。
+        """
+        with ThreadPoolExecutor(max_workers=len(self.tunnels)) as executor:
+            futures = [executor.submit(tunnel.start) for tunnel in self.tunnels]
+            try:
+                for future in futures:
+                    future.result()
+            except Exception:
+                self.stop()
+                raise
+        return self.tunnels[0].local_address
+
+    def stop(self) -> None:
+        for tunnel in self.tunnels:
+            tunnel.stop()
+
+    @property
+    def local_address(self) -> Tuple[str, int]:
+        for tunnel in self.tunnels:
+            if tunnel.is_up:
+                return tunnel.local_address
+        raise ValueError("Error: No SSH Tunnel is available.")
+
+    @property
+    def is_up(self) -> bool:
+        return any(t.is_up for t in self.tunnels)
+
+    def wait_until_up(self, timeout: Optional[float] = None) -> bool:
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            if self.is_up:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # 任一條 Tunnel 恢復即可
+            self.tunnels[0].wait_until_up(min(remaining, 0.5))
+
+    def acquire(self) -> Tuple[Tuple[int, int], Tuple[str, int]]:
+        """
+        依 policy 挑選一條存活的 Tunnel，並計入一條開啟中的連線。
+        回傳 (tag, local_address)；tag = (tunnel index, generation)，連線關閉時以同一個 tag 呼叫 release。
+        """
+        with self._lock:
+            candidates = [i for i, t in enumerate(self.tunnels) if t.is_up]
+            if not candidates:
+                raise ValueError("Error: No SSH Tunnel is available.")
+            index = self._policy(candidates, self._open_connections)
+            self._open_connections[index] += 1
+            tag = (index, self._generations[index])
+        return tag, self.tunnels[index].local_address
+
+    def release(self, tag: Tuple[int, int]) -> None:
+        """
+        扣除 acquire 計入的連線；tag 屬於已重置的世代時忽略 (該連線已不在計數中)。
+        """
+        index, generation = tag
+        with self._lock:
+            if self._generations[index] == generation and self._open_connections[index] > 0:
+                self._open_connections[index] -= 1
+
+    def _reset_connections(self, index: int) -> None:
+        # Tunnel 重建後，指向該 Tunnel 舊 port 的連線都已失效；其他 Tunnel 不受影響
+        with self._lock:
+            self._open_connections[index] = 0
+            self._generations[index] += 1
+
+    def is_current(self, tag: Tuple[int, int]) -> bool:
+        """
+        tag 所屬的 Tunnel 在 acquire 之後是否沒有重建過 (連線仍指向目前的 port)。
+        """
+        index, generation = tag
+        with self._lock:
+            return self._generations[index] == generation
+
+    def add_reconnect_listener(self, callback: Callable[[int], None]) -> None:
+        """
+        註冊 Tunnel 重建後的 callback，參數為重建的 tunnel index (此時該 Tunnel 已進入新世代)。
+        """
+        for index, tunnel in enumerate(self.tunnels):
+            tunnel.add_reconnect_listener(lambda i=index: callback(i))
+
+    def stats(self) -> Dict[str, Any]:
+        tunnels = [t.stats() for t in self.tunnels]
+        with self._lock:
+            for tunnel_stats, open_count in zip(tunnels, self._open_connections):
+                tunnel_stats["open_connections"] = open_count
+        return {
+            "channels": len(self.tunnels),
+            "policy": self.policy_name,
+            "tunnel_up": all(t["tunnel_up"] for t in tunnels),
+            "reconnects": sum(t["reconnects"] for t in tunnels),
+            "tunnels": tunnels,
+        }
@@ -0,0 +1,146 @@
+"""
+Monthly Rollup Backfill
+
+建立並回填成效的月彙總表 (templates/ddl/clickhouse/ad_format_events_monthly.sql)。
+每個月份先 DROP 該月分區再 INSERT ... SELECT，重複執行不會重複計算；
+只回填已關帳的月份 (月底早於今天 - PERF_CACHE_SETTLE_DAYS 天)，未關帳月份的查詢一律讀每日 view。
+--target sampled 改為建立 / 回填近似模式的抽樣表 (ad_format_events_sampled.sql，以月分區的每日資料)，
+回填到當月為止，每日排程以 --refresh-recent 重建最近幾個月。
+
+Usage:
+    python scripts/backfill_rollup.py --create --from 2020-01                # 建表並回填 2020-01 ~ 最近關帳月份
+    python scripts/backfill_rollup.py --refresh-recent 2                     # 每日排程：重建最近兩個關帳月份 (補上遲到資料)
+    python scripts/backfill_rollup.py --from 2025-01 --to 2025-06 --dry-run
+    python scripts/backfill_rollup.py --target sampled --create --from 2020-01  # 抽樣表 (近似模式)
+    python scripts/backfill_rollup.py --target sampled --refresh-recent 2      # 每日排程：重建當月與上個月
+"""
+import argparse
+import calendar
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from jinja2 import Template
+
+from tools.template_registry import PROJECT_ROOT
+
+DDL_DIR = os.path.join(PROJECT_ROOT, "templates", "ddl", "clickhouse")
+# target -> (建表 DDL, 單月回填 SQL)
+TARGETS = {
+    "monthly": ("ad_format_events_monthly.sql", "ad_format_events_monthly_backfill.sql"),
+    "sampled": ("ad_format_events_sampled.sql", "ad_format_events_sampled_backfill.sql"),
+}
+
+
+def load_sql(filename: str, table: str) -> str:
+    with open(os.path.join(DDL_DIR, filename), encoding="utf-8") as f:
+        return Template(f.read()).render(rollup_table=table, sample_table=table).strip().rstrip(";")
+
+
+def parse_month(value: str) -> date:
+    year, month = value.split("-")[:2]
+    return date(int(year), int(month), 1)
+
+
+def month_end(month: date) -> date:
+    return month.replace(day=calendar.monthrange(month.year, month.month)[1])
+
+
+def last_closed_month(today: date) -> date:
+    """
+    最近的關帳月份：與 partition cache 相同，月底早於 今天 - PERF_CACHE_SETTLE_DAYS 天。
+    """
+    cutoff = today - timedelta(days=int(os.getenv('PERF_CACHE_SETTLE_DAYS', 2)))
+    # cutoff 所在的月份一定尚未關帳，上一個月即為最近的關帳月份
+    return (cutoff.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+
+def months_between(first: date, last: date):
+    month = first
+    while month <= last:
+        yield month
+        month = month_end(month) + timedelta(days=1)
+
+
+def main():
+    load_dotenv()
+    from tools.approximate import sample_table
+    from tools.performance_rollup import rollup_table
+
+    parser = argparse.ArgumentParser(description="Create and backfill the monthly ClickHouse performance rollup (or the sampled table)")
+    parser.add_argument("--target", choices=sorted(TARGETS), default="monthly",
+                        help="monthly rollup or the sampled table used by approximate queries")
+    parser.add_argument("--create", action="store_true", help="Create the target table if it does not exist")
+    parser.add_argument("--from", dest="first", help="First month to backfill (YYYY-MM)")
+    parser.add_argument("--to", dest="last", help="Last month to backfill (YYYY-MM, default: latest closed month, current month for sampled)")
+    parser.add_argument("--refresh-recent", type=int, default=0,
+                        help="Rebuild the N most recent months (closed months for monthly; for a daily schedule)")
+    parser.add_argument("--table", default=None, help="Target table (default: PERF_ROLLUP_TABLE / CH_SAMPLE_TABLE)")
+    parser.add_argument("--dry-run", action="store_true", help="Print the statements without executing them")
+    args = parser.parse_args()
+
+    if args.target == "sampled":
+        # 抽樣表保存每日資料，可回填到當月 (--refresh-recent 重建時補上遲到資料)
+        table = args.table or sample_table()
+        latest = date.today().replace(day=1)
+    else:
+        table = args.table or rollup_table()
+        latest = last_closed_month(date.today())
+    if args.refresh_recent:
+        months = list(months_between(latest, latest))
+        for _ in range(args.refresh_recent - 1):
+            months.insert(0, (months[0] - timedelta(days=1)).replace(day=1))
+    elif args.first:
+        last = min(parse_month(args.last), latest) if args.last else latest
+        months = list(months_between(parse_month(args.first), last))
+    else:
+        months = []
+
+    if not args.create and not months:
+        parser.error("nothing to do: pass --create, --from or --refresh-recent")
+
+    create_file, backfill_file = TARGETS[args.target]
+    create_sql = load_sql(create_file, table)
+    backfill_sql = load_sql(backfill_file, table)
+
+    if args.dry_run:
+        if args.create:
+            print(create_sql + ";\n")
+        for month in months:
+            print(f"ALTER TABLE {table} DROP PARTITION {month:%Y%m};")
+            print(f"-- month_start={month} month_end={month_end(month)}")
+            print(backfill_sql + ";\n")
+        return
+
+    from config.database import clickhouse_client, clickhouse_query_settings
+
+    settings = clickhouse_query_settings(max_execution_time=int(os.getenv('ROLLUP_BACKFILL_TIMEOUT', 1800)))
+    with clickhouse_client() as client:
+        if args.create:
+            client.command(create_sql, settings=settings)
+            print(f"✅ Table {table} ready")
+
+        for month in months:
+            started = time.perf_counter()
+            client.command(f"ALTER TABLE {table} DROP PARTITION {month:%Y%m}", settings=settings)
+            summary = client.command(
+                backfill_sql,
+                parameters={"month_start": month.isoformat(), "month_end": month_end(month).isoformat()},
+                settings=settings,
+            )
+            written = getattr(summary, "written_rows", None)
+            print(f"✅ {month:%Y-%m}: {written if written is not None else '?'} rows "
+                  f"({time.perf_counter() - started:.1f}s)")
+
+    if months:
+        print(f"\n📦 Backfilled {len(months)} months into {table} "
+              f"(queries pick it up within PERF_ROLLUP_COVERAGE_TTL seconds)")
+
+
+if __name__ == "__main__":
+    main()
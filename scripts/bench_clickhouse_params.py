@@ -0,0 +1,126 @@
+"""
+ClickHouse Parameter Binding Benchmark
+
+比較 unified_performance 在「ID 清單內嵌進 SQL 文字」、「server-side 參數 ({plaids:Array(UInt64)})」
+與「external data table」三種方式下，不同 ID 數量的：
+- SQL 文字大小
+- parse 時間 (以 EXPLAIN AST 量測，只做 parse 不執行)
+- 完整查詢時間 (client 端 wall time 中位數)
+
+Usage:
+    python scripts/bench_clickhouse_params.py --sizes 10 100 1000 10000 --repeat 5
+    python scripts/bench_clickhouse_params.py --start-date 2025-07-01 --end-date 2025-12-31
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from config.database import clickhouse_client, clickhouse_query_settings
+from tools.performance_tools import _externalize_large_lists, _prepare_clickhouse_query
+
+_PARAM_RE = re.compile(r"\{(\w+):([^}]+)\}")
+
+
+def _inline_literal(value, type_name: str) -> str:
+    if isinstance(value, (list, tuple)):
+        if type_name.startswith("Array(String"):
+            return "(" + ", ".join("'" + str(v).replace("'", "\\'") + "'" for v in value) + ")"
+        return "(" + ",".join(str(v) for v in value) + ")"
+    return f"'{value}'"
+
+
+def inline_parameters(sql: str, parameters: dict) -> str:
+    """
+    還原成舊版模板的寫法：把參數直接內嵌進 SQL 文字 (僅供比較用)。
+    """
+    return _PARAM_RE.sub(lambda m: _inline_literal(parameters[m.group(1)], m.group(2)), sql)
+
+
+def _timed(func, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def run_size(size: int, args) -> dict:
+    plaids = random.sample(range(1, max(size * 20, 1000)), size)
+    context = {
+        "start_date": args.start_date,
+        "end_date": args.end_date,
+        "dimensions": ["ad_format_type"],
+        "plaids": plaids,
+        "limit": 100,
+    }
+    bound_sql, parameters = _prepare_clickhouse_query("unified_performance", context)
+    inline_sql = inline_parameters(bound_sql, parameters)
+    external_sql, external_params, external_data = _externalize_large_lists(bound_sql, parameters, threshold=0)
+    settings = clickhouse_query_settings()
+
+    with clickhouse_client() as client:
+        result = {
+            "size": size,
+            "inline_sql_kb": len(inline_sql.encode("utf-8")) / 1024,
+            "bound_sql_kb": len(bound_sql.encode("utf-8")) / 1024,
+            "inline_parse_ms": _timed(lambda: client.query(f"EXPLAIN AST {inline_sql}", settings=settings), args.repeat),
+            "bound_parse_ms": _timed(
+                lambda: client.query(f"EXPLAIN AST {bound_sql}", parameters=parameters, settings=settings), args.repeat
+            ),
+            "inline_total_ms": _timed(lambda: client.query(inline_sql, settings=settings), args.repeat),
+            "bound_total_ms": _timed(
+                lambda: client.query(bound_sql, parameters=parameters, settings=settings), args.repeat
+            ),
+            "external_total_ms": _timed(
+                lambda: client.query(
+                    external_sql, parameters=external_params, settings=settings, external_data=external_data
+                ),
+                args.repeat
+            ),
+        }
+    return result
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark inlined vs server-side bound ID lists in ClickHouse")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (median is reported)")
+    parser.add_argument("--start-date", default="2025-07-01")
+    parser.add_argument("--end-date", default="2025-12-31")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        print(f"\n🚀 Running with {size} plaids...")
+        results.append(run_size(size, args))
+
+    print("\n=== ClickHouse Parameter Binding Benchmark (unified_performance) ===")
+    print(f"Date range: {args.start_date} ~ {args.end_date}, Repeat: {args.repeat} (median)\n")
+    print(
+        f"{'ids':>7} {'sql KB (inline/bound)':>22} {'parse ms (inline/bound)':>24} "
+        f"{'total ms (inline/bound/external)':>33} {'speedup':>8}"
+    )
+    for r in results:
+        best = min(r["bound_total_ms"], r["external_total_ms"])
+        speedup = r["inline_total_ms"] / best if best else 0
+        print(
+            f"{r['size']:>7} {r['inline_sql_kb']:>11.1f} / {r['bound_sql_kb']:<8.1f} "
+            f"{r['inline_parse_ms']:>12.1f} / {r['bound_parse_ms']:<9.1f} "
+            f"{r['inline_total_ms']:>10.1f} / {r['bound_total_ms']:<8.1f} / {r['external_total_ms']:<9.1f} "
+            f"{speedup:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
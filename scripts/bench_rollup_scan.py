@@ -0,0 +1,115 @@
+"""
+Monthly Rollup Scan Benchmark
+
+比較 unified_performance / format_benchmark 在「只讀每日 view」與「完整月份改讀月彙總表」兩種來源下的：
+- 讀取的 bytes / rows (ClickHouse query summary 的 read_bytes / read_rows)
+- 完整查詢時間 (client 端 wall time 中位數)
+並確認兩種來源的指標加總一致。
+
+Usage:
+    python scripts/bench_rollup_scan.py                                  # 全部時間 / 最近 12 個月 / 最近 3 個月
+    python scripts/bench_rollup_scan.py --ranges 2020-01-01:2025-12-31 2025-01-01:2025-06-30 --repeat 5
+    python scripts/bench_rollup_scan.py --templates unified_performance --dimensions ad_format_type client_company
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from config.database import clickhouse_client, clickhouse_query_settings
+from tools.performance_rollup import plan_rollup
+from tools.performance_tools import _prepare_clickhouse_query
+
+# 比對兩種來源結果時加總的欄位
+TOTAL_COLUMNS = {
+    "unified_performance": ["clicks", "effective_impressions", "total_q100_views", "total_engagements"],
+    "format_benchmark": ["total_clicks", "total_impressions", "total_q100", "total_engagements"],
+}
+
+
+def default_ranges(today: date):
+    return [
+        ("2020-01-01", today.isoformat()),
+        ((today - timedelta(days=365)).isoformat(), today.isoformat()),
+        ((today - timedelta(days=90)).isoformat(), today.isoformat()),
+    ]
+
+
+def build_context(template: str, start_date: str, end_date: str, args) -> dict:
+    context = {"start_date": start_date, "end_date": end_date}
+    if template == "unified_performance":
+        context.update(dimensions=args.dimensions, limit=args.limit)
+    return context
+
+
+def run_variant(client, template: str, context: dict, repeat: int) -> dict:
+    rendered_sql, parameters = _prepare_clickhouse_query(template, context)
+    settings = clickhouse_query_settings()
+    samples, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = client.query(rendered_sql, parameters=parameters, settings=settings)
+        samples.append((time.perf_counter() - started) * 1000)
+    summary = result.summary or {}
+    columns = result.column_names
+    totals = {
+        col: sum(float(row[columns.index(col)] or 0) for row in result.result_rows)
+        for col in TOTAL_COLUMNS[template] if col in columns
+    }
+    return {
+        "read_bytes": int(summary.get("read_bytes", 0)),
+        "read_rows": int(summary.get("read_rows", 0)),
+        "total_ms": statistics.median(samples),
+        "totals": totals,
+    }
+
+
+def _mb(value: int) -> str:
+    return f"{value / 1024 / 1024:,.1f}MB"
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Compare scan bytes of the daily source against the monthly rollup")
+    parser.add_argument("--ranges", nargs="+", help="Date ranges as START:END (default: all time, last 12 / 3 months)")
+    parser.add_argument("--templates", nargs="+", default=["unified_performance", "format_benchmark"])
+    parser.add_argument("--dimensions", nargs="+", default=["ad_format_type"])
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ranges = [tuple(r.split(":")) for r in args.ranges] if args.ranges else default_ranges(date.today())
+
+    print(f"{'template':<22} {'range':<24} {'daily read':>12} {'rollup read':>12} {'ratio':>7} "
+          f"{'daily ms':>9} {'rollup ms':>9}  totals")
+    with clickhouse_client() as client:
+        for template in args.templates:
+            for start_date, end_date in ranges:
+                context = build_context(template, start_date, end_date, args)
+                plan = plan_rollup(context)
+                label = f"{start_date}~{end_date}"
+                daily = run_variant(client, template, context, args.repeat)
+                if not plan:
+                    print(f"{template:<22} {label:<24} {_mb(daily['read_bytes']):>12} {'(no rollup)':>12}")
+                    continue
+                rollup = run_variant(client, template, dict(context, **plan), args.repeat)
+                ratio = daily["read_bytes"] / rollup["read_bytes"] if rollup["read_bytes"] else float("inf")
+                # 浮點加總容許極小誤差；不一致通常表示回填後來源資料又有變動
+                matches = all(
+                    abs(daily["totals"][k] - rollup["totals"].get(k, 0)) <= max(1.0, abs(daily["totals"][k]) * 1e-9)
+                    for k in daily["totals"]
+                )
+                print(f"{template:<22} {label:<24} {_mb(daily['read_bytes']):>12} {_mb(rollup['read_bytes']):>12} "
+                      f"{ratio:>6.1f}x {daily['total_ms']:>9.0f} {rollup['total_ms']:>9.0f}  "
+                      f"{'✅ match' if matches else '❌ differ'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+SSH Tunnel Pool Benchmark
+
+比較「單一 SSH Tunnel」與「多條 Tunnel (SSHTunnelPool)」在併發查詢下的總吞吐量。
+每種設定都會建立獨立的 Tunnel Pool 與 Engine，以 N 個執行緒同時重複執行同一個查詢。
+
+Usage:
+    python scripts/bench_tunnel_pool.py --channels 1 4 --concurrency 12 --queries 10
+    python scripts/bench_tunnel_pool.py --sql "SELECT * FROM pre_campaign ORDER BY id DESC LIMIT 5000"
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+
+from config.database import _build_mysql_uri, _route_through_tunnel, create_tunnel_pool
+
+# 預設查詢：回傳足量資料，讓 SSH transport 的頻寬成為瓶頸
+DEFAULT_SQL = "SELECT * FROM pre_campaign ORDER BY id DESC LIMIT 5000"
+
+
+def _ssh_args():
+    return {
+        "ssh_address_or_host": (os.getenv('SSH_HOST'), int(os.getenv('SSH_PORT', 22))),
+        "ssh_username": os.getenv('SSH_USER'),
+        "remote_bind_address": (os.getenv('DB_HOST'), int(os.getenv('DB_PORT', 3306))),
+        "ssh_password": os.getenv('SSH_PASSWORD'),
+        "set_keepalive": 30.0,
+    }
+
+
+def run_benchmark(channels: int, policy: str, sql: str, concurrency: int, queries: int):
+    pool = create_tunnel_pool(_ssh_args(), channels=channels, policy=policy)
+    host, port = pool.start()
+    engine = create_engine(
+        _build_mysql_uri("mysqlconnector", host, port),
+        pool_size=concurrency,
+        max_overflow=0,
+        pool_pre_ping=True,
+        connect_args={'consume_results': True}
+    )
+    _route_through_tunnel(engine, pool)
+
+    def _worker(_):
+        rows = 0
+        latencies = []
+        for _ in range(queries):
+            started = time.perf_counter()
+            with engine.connect() as connection:
+                rows += len(connection.execute(text(sql)).fetchall())
+            latencies.append(time.perf_counter() - started)
+        return rows, latencies
+
+    try:
+        # Warm-up: 先把連線池填滿，避免把建立連線的成本算進吞吐量
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda _: engine.connect().close(), range(concurrency)))
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(_worker, range(concurrency)))
+        elapsed = time.perf_counter() - started
+    finally:
+        engine.dispose()
+        pool.stop()
+
+    total_rows = sum(r for r, _ in results)
+    latencies = sorted(l for _, ls in results for l in ls)
+    total_queries = len(latencies)
+    return {
+        "channels": channels,
+        "queries": total_queries,
+        "elapsed_s": elapsed,
+        "qps": total_queries / elapsed if elapsed else 0,
+        "rows_per_s": total_rows / elapsed if elapsed else 0,
+        "p50_ms": latencies[total_queries // 2] * 1000,
+        "p95_ms": latencies[min(total_queries - 1, int(total_queries * 0.95))] * 1000,
+    }
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Benchmark MySQL throughput over 1..N SSH tunnels")
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--policy", default="round_robin")
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--queries", type=int, default=10, help="Queries per worker")
+    parser.add_argument("--sql", default=DEFAULT_SQL)
+    args = parser.parse_args()
+
+    results = []
+    for channels in args.channels:
+        print(f"\n🚀 Running with {channels} tunnel channel(s)...")
+        results.append(run_benchmark(channels, args.policy, args.sql, args.concurrency, args.queries))
+
+    baseline = results[0]["qps"] or 1
+    print("\n=== SSH Tunnel Pool Benchmark ===")
+    print(f"SQL: {args.sql}")
+    print(f"Concurrency: {args.concurrency}, Queries/worker: {args.queries}, Policy: {args.policy}\n")
+    print(f"{'channels':>8} {'queries':>8} {'elapsed(s)':>11} {'qps':>8} {'rows/s':>10} {'p50(ms)':>9} {'p95(ms)':>9} {'speedup':>8}")
+    for r in results:
+        print(
+            f"{r['channels']:>8} {r['queries']:>8} {r['elapsed_s']:>11.2f} {r['qps']:>8.2f} "
+            f"{r['rows_per_s']:>10.0f} {r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['qps'] / baseline:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+ID Bridge Dictionary Setup
+
+在 ClickHouse 建立 plaid_hierarchy dictionary (templates/ddl/clickhouse/plaid_hierarchy_dictionary.sql)，
+鏡像 MySQL 的 cue_lists / one_campaigns / pre_campaign 階層，供 CH_ID_BRIDGE=true 時成效查詢直接以
+client / agency / industry 過濾。可選擇與 MySQL 的 id_finder 結果比對 plaid 集合。
+
+Usage:
+    python scripts/create_id_bridge.py                                   # 以 mysql_gspadmin (MySQL database engine) 為來源
+    python scripts/create_id_bridge.py --mysql-collection akc_mysql       # 以 MySQL named collection 為來源
+    python scripts/create_id_bridge.py --replace --verify-client 123 --start-date 2025-01-01 --end-date 2025-06-30
+    python scripts/create_id_bridge.py --dry-run
+"""
+import argparse
+import os
+import sys
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from jinja2 import Template
+
+from tools.template_registry import PROJECT_ROOT
+
+DDL_FILE = os.path.join(PROJECT_ROOT, "templates", "ddl", "clickhouse", "plaid_hierarchy_dictionary.sql")
+
+
+def render_ddl(dictionary: str, mysql_collection: str = None, mysql_database: str = None,
+               lifetime_min: int = 300, lifetime_max: int = 900) -> str:
+    with open(DDL_FILE, encoding="utf-8") as f:
+        template = Template(f.read())
+    return template.render(
+        dictionary=dictionary,
+        mysql_collection=mysql_collection,
+        # MySQL named collection 已指定資料庫；CLICKHOUSE source 需以 MySQL database engine 的名稱限定表名
+        table_prefix="" if mysql_collection else f"{mysql_database}.",
+        lifetime_min=lifetime_min,
+        lifetime_max=lifetime_max,
+    ).strip().rstrip(";")
+
+
+def verify_client(client, dictionary: str, client_id: int, start_date: str, end_date: str) -> bool:
+    """
+    比對 dictionary 與 MySQL 對同一客戶解析出的 plaid 集合 (MySQL 端含日期條件，因此只檢查是否為子集合)。
+    """
+    from tools.id_bridge import _plaids_from_mysql
+
+    mysql_plaids = set(_plaids_from_mysql(start_date, end_date, {"client_ids": [client_id]}))
+    result = client.query(
+        f"SELECT plaid FROM dictionary('{dictionary}') WHERE client_id = {{client_id:UInt64}}",
+        parameters={"client_id": client_id},
+    )
+    bridge_plaids = {row[0] for row in result.result_rows}
+    missing = mysql_plaids - bridge_plaids
+    print(f"🔍 client {client_id}: MySQL {len(mysql_plaids)} plaids in range, dictionary {len(bridge_plaids)} plaids total")
+    if missing:
+        print(f"❌ {len(missing)} plaids missing from the dictionary (e.g. {sorted(missing)[:10]}); "
+              "it may not have reloaded yet")
+        return False
+    print("✅ Dictionary covers every plaid MySQL returns")
+    return True
+
+
+def main():
+    load_dotenv()
+    from tools.id_bridge import bridge_dictionary
+
+    parser = argparse.ArgumentParser(description="Create the ClickHouse dictionary that mirrors the MySQL campaign hierarchy")
+    parser.add_argument("--dictionary", default=None, help="Dictionary name (default: CH_ID_BRIDGE_DICTIONARY)")
+    parser.add_argument("--mysql-collection", default=os.getenv('CH_ID_BRIDGE_MYSQL_COLLECTION'),
+                        help="MySQL named collection configured on the ClickHouse server")
+    parser.add_argument("--mysql-database", default=os.getenv('CH_ID_BRIDGE_MYSQL_DATABASE', 'mysql_gspadmin'),
+                        help="ClickHouse MySQL-engine database to read from when no collection is given")
+    parser.add_argument("--lifetime-min", type=int, default=300)
+    parser.add_argument("--lifetime-max", type=int, default=900)
+    parser.add_argument("--replace", action="store_true", help="Drop and recreate the dictionary")
+    parser.add_argument("--verify-client", type=int, help="Compare plaids for this client_id against MySQL")
+    parser.add_argument("--start-date", default="2025-01-01")
+    parser.add_argument("--end-date", default="2025-12-31")
+    parser.add_argument("--dry-run", action="store_true", help="Print the DDL without executing it")
+    args = parser.parse_args()
+
+    dictionary = args.dictionary or bridge_dictionary()
+    ddl = render_ddl(dictionary, args.mysql_collection, args.mysql_database, args.lifetime_min, args.lifetime_max)
+    if args.dry_run:
+        print(ddl + ";")
+        return
+
+    from config.database import clickhouse_client
+
+    with clickhouse_client() as client:
+        if args.replace:
+            client.command(f"DROP DICTIONARY IF EXISTS {dictionary}")
+        client.command(ddl)
+        client.command(f"SYSTEM RELOAD DICTIONARY {dictionary}")
+        count = client.query(f"SELECT count() FROM dictionary('{dictionary}')").result_rows[0][0]
+        print(f"✅ Dictionary {dictionary} loaded with {count} plaids")
+
+        ok = True
+        if args.verify_client:
+            ok = verify_client(client, dictionary, args.verify_client, args.start_date, args.end_date)
+
+    if ok:
+        print("👉 Set CH_ID_BRIDGE=true to let performance queries filter by client / agency / industry in ClickHouse")
+    else:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
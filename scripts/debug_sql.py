@@ -1,44 +1,55 @@
 import os
 import sys
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-
-# Setup Jinja2 Environment
-TEMPLATE_DIR = os.path.join(os.getcwd(), "templates", "sql")
-env = Environment(
-    loader=FileSystemLoader(TEMPLATE_DIR),
-    autoescape=select_autoescape(['sql'])
-)
-
-def debug_industry_format_budget():
-    print("\n=== Debugging industry_format_budget.sql rendering ===")
-    
-    # Context mimicking the failing call
-    context = {
-        "dimension": "industry",
-        "split_by_format": True,  # Boolean True
-        "primary_view": "format",
-        "start_date": "2025-07-02",
-        "end_date": "2026-01-02",
-        "limit": 50
-    }
+import json
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.template_registry import get_registry
+
+# 每個模板的範例參數 (可用第二個參數傳入 JSON 覆寫)
+SAMPLE_CONTEXTS = {
+    "id_finder": {"start_date": "2025-07-01", "end_date": "2025-12-31", "client_ids": [1], "page_size": 50},
+    "campaign_basic": {"campaign_ids": [1, 2]},
+    "budget_summary": {"start_date": "2025-01-01", "end_date": "2025-12-31", "client_ids": [1]},
+    "investment_budget": {"cue_list_ids": [1, 2]},
+    "execution_budget": {"plaids": [1, 2]},
+    "targeting_segments": {"plaids": [1, 2]},
+    "unified_performance": {
+        "start_date": "2025-07-01", "end_date": "2025-12-31",
+        "dimensions": ["ad_format_type"], "plaids": [1, 2], "limit": 50
+    },
+    "unified_dimensions": {"start_date": "2025-07-01", "end_date": "2025-12-31", "dimensions": ["product_line"]},
+    "format_benchmark": {"start_date": "2025-07-01", "end_date": "2025-12-31"},
+}
+
+
+def debug_template(name, context=None):
+    print(f"\n=== Debugging {name} rendering ===")
+    registry = get_registry()
+    context = context if context is not None else SAMPLE_CONTEXTS.get(name, {})
 
     try:
-        template = env.get_template("industry_format_budget.sql")
-        rendered_sql = template.render(**context)
-        
+        spec = registry.get(name)
+        render = registry.renderer(name)
+        print(f"Signature: {render.__name__}{spec.signature}")
+        rendered_sql = render(**context)
+
+        print(f"File: {spec.file}")
         print(f"Context: {context}")
         print("-" * 20)
-        # Check the SELECT clause (First ~500 chars)
-        print(rendered_sql[:500])
+        print(rendered_sql)
         print("-" * 20)
-        
-        if "'All Formats' AS format_name" in rendered_sql:
-            print("❌ FAILURE: Rendered SQL contains 'All Formats' despite split_by_format=True")
-        else:
-            print("✅ SUCCESS: Rendered SQL correctly selects format names")
+        print("✅ SUCCESS: Template rendered")
 
     except Exception as e:
         print(f"Error: {e}")
 
+
 if __name__ == "__main__":
-    debug_industry_format_budget()
+    # Usage: python scripts/debug_sql.py [template_name] ['{"start_date": "..."}']
+    if len(sys.argv) > 1:
+        debug_template(sys.argv[1], json.loads(sys.argv[2]) if len(sys.argv) > 2 else None)
+    else:
+        for template_name in get_registry().names():
+            debug_template(template_name)
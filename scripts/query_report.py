@@ -0,0 +1,157 @@
+"""
+Query Log Report
+
+讀取 services/query_log.py 記錄的 SQLite 查詢紀錄，輸出：
+- 每個模板的執行次數、錯誤數、p50 / p95 / max 耗時、平均回傳列數
+- 最慢的 SQL fingerprints (依 p95 排序)，附上參數基數的最大值與 SQL 形狀
+用來決定哪些查詢該加 index、放進快取或預先彙總。
+
+Usage:
+    python scripts/query_report.py                       # 最近 7 天
+    python scripts/query_report.py --since-hours 24 --top 20
+    python scripts/query_report.py --template id_finder --backend mysql
+    python scripts/query_report.py --db /path/to/query_log.sqlite --json report.json
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import defaultdict
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from services.query_log import log_path
+
+
+def percentile(values, pct: float) -> float:
+    """
+    線性內插的百分位數 (values 需已排序)。
+    """
+    if not values:
+        return 0.0
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def load_entries(db_path: str, since: float, template=None, backend=None):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        sql = ("SELECT template, backend, fingerprint, sql_shape, param_cardinalities, row_count, duration_ms, error "
+               "FROM query_log WHERE ts >= ?")
+        params = [since]
+        if template:
+            sql += " AND template = ?"
+            params.append(template)
+        if backend:
+            sql += " AND backend = ?"
+            params.append(backend)
+        columns = ["template", "backend", "fingerprint", "sql_shape", "param_cardinalities", "rows", "duration_ms", "error"]
+        return [dict(zip(columns, row)) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def _stats(entries) -> dict:
+    durations = sorted(e["duration_ms"] for e in entries)
+    rows = [e["rows"] for e in entries if e["rows"] is not None]
+    return {
+        "count": len(entries),
+        "errors": sum(1 for e in entries if e["error"]),
+        "p50_ms": round(percentile(durations, 50), 1),
+        "p95_ms": round(percentile(durations, 95), 1),
+        "max_ms": round(durations[-1], 1) if durations else 0.0,
+        "total_s": round(sum(durations) / 1000, 1),
+        "avg_rows": round(sum(rows) / len(rows), 1) if rows else 0.0,
+    }
+
+
+def template_report(entries) -> list:
+    grouped = defaultdict(list)
+    for e in entries:
+        grouped[(e["template"], e["backend"])].append(e)
+    report = [dict(template=t, backend=b, **_stats(group)) for (t, b), group in grouped.items()]
+    return sorted(report, key=lambda r: r["p95_ms"], reverse=True)
+
+
+def fingerprint_report(entries, top: int, min_count: int) -> list:
+    grouped = defaultdict(list)
+    for e in entries:
+        grouped[e["fingerprint"]].append(e)
+
+    report = []
+    for fingerprint, group in grouped.items():
+        if len(group) < min_count:
+            continue
+        # 每個參數在這個 fingerprint 下出現過的最大基數 (例如 plaids 最多帶了幾個 ID)
+        max_cardinality = {}
+        for e in group:
+            for k, v in json.loads(e["param_cardinalities"] or "{}").items():
+                max_cardinality[k] = max(max_cardinality.get(k, 0), v)
+        report.append(dict(
+            fingerprint=fingerprint,
+            template=group[0]["template"],
+            backend=group[0]["backend"],
+            max_param_cardinality=max_cardinality,
+            sql_shape=group[0]["sql_shape"],
+            **_stats(group),
+        ))
+    return sorted(report, key=lambda r: r["p95_ms"], reverse=True)[:top]
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Summarize the query log: latency per template and slowest SQL fingerprints")
+    parser.add_argument("--db", default=None, help="Path to the SQLite query log (default: QUERY_LOG_PATH)")
+    parser.add_argument("--since-hours", type=float, default=24 * 7)
+    parser.add_argument("--template", help="Only this template")
+    parser.add_argument("--backend", choices=["mysql", "clickhouse"])
+    parser.add_argument("--top", type=int, default=10, help="Number of slow fingerprints to show")
+    parser.add_argument("--min-count", type=int, default=1, help="Ignore fingerprints executed fewer times")
+    parser.add_argument("--sql-width", type=int, default=160, help="Characters of SQL shape to print")
+    parser.add_argument("--json", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    db_path = args.db or log_path()
+    if not os.path.exists(db_path):
+        print(f"❌ Query log {db_path} not found (QUERY_LOG_ENABLED / QUERY_LOG_PATH)")
+        sys.exit(1)
+
+    entries = load_entries(db_path, time.time() - args.since_hours * 3600, args.template, args.backend)
+    if not entries:
+        print(f"⚠️ No queries recorded in the last {args.since_hours:g} hours")
+        return
+
+    templates = template_report(entries)
+    fingerprints = fingerprint_report(entries, args.top, args.min_count)
+
+    print(f"📊 {len(entries)} queries in the last {args.since_hours:g} hours ({db_path})\n")
+    print(f"{'template':<32} {'backend':<10} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'max ms':>9} {'total s':>8} {'avg rows':>9}")
+    for r in templates:
+        print(f"{r['template']:<32} {r['backend']:<10} {r['count']:>6} {r['errors']:>6} {r['p50_ms']:>9.1f} "
+              f"{r['p95_ms']:>9.1f} {r['max_ms']:>9.1f} {r['total_s']:>8.1f} {r['avg_rows']:>9.1f}")
+
+    print(f"\n🐢 Top {len(fingerprints)} slow fingerprints (by p95)")
+    for r in fingerprints:
+        print(f"\n{r['fingerprint']}  {r['template']} ({r['backend']})  count={r['count']} errors={r['errors']} "
+              f"p50={r['p50_ms']:.1f}ms p95={r['p95_ms']:.1f}ms max={r['max_ms']:.1f}ms avg_rows={r['avg_rows']:.1f}")
+        if r["max_param_cardinality"]:
+            print(f"    params: {r['max_param_cardinality']}")
+        shape = r["sql_shape"] or ""
+        print(f"    sql: {shape[:args.sql_width]}{'…' if len(shape) > args.sql_width else ''}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"templates": templates, "fingerprints": fingerprints}, f, ensure_ascii=False, indent=2)
+        print(f"\n📝 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
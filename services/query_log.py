@@ -0,0 +1,218 @@
+"""
+Query Log
+
+每一次 MySQL / ClickHouse 查詢都記錄到本機 SQLite (QUERY_LOG_PATH)：
+- 模板名稱、渲染後 SQL 的 fingerprint (常數 / 綁定參數 / IN 清單正規化後的雜湊)
+- 參數基數 (ID 清單的長度，純量為 1)
+- 回傳列數、耗時 (含串流讀取)、錯誤訊息
+寫入由背景 thread 批次處理，查詢路徑上只有一次 queue.put，不會阻塞 event loop。
+scripts/query_report.py 依此產生每個模板的 p50 / p95 與最慢的 fingerprints，
+作為決定加 index、快取或預先彙總的依據。
+"""
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_LOG_PATH = os.path.join(PROJECT_ROOT, ".cache", "query_log.sqlite")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    backend TEXT NOT NULL,
+    template TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    sql_shape TEXT,
+    param_cardinalities TEXT,
+    row_count INTEGER,
+    duration_ms REAL NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_query_log_template_ts ON query_log (template, ts);
+CREATE INDEX IF NOT EXISTS idx_query_log_fingerprint ON query_log (fingerprint);
+"""
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_CH_PARAM_RE = re.compile(r"\{\w+:[^}]+\}")
+_BIND_PARAM_RE = re.compile(r"(?<![:\w]):\w+")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def query_log_enabled() -> bool:
+    return os.getenv('QUERY_LOG_ENABLED', 'true').lower() == 'true'
+
+
+def log_path() -> str:
+    return os.getenv('QUERY_LOG_PATH', DEFAULT_LOG_PATH)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    SQL 的「形狀」：去掉註解、常數與綁定參數換成 ?、IN 清單收斂成 (?+)、空白壓縮。
+    同一模板在不同日期 / ID 下產生相同的形狀，只有 Jinja 分支不同時才會不同。
+    """
+    shape = _COMMENT_RE.sub(" ", sql or "")
+    shape = _STRING_RE.sub("?", shape)
+    shape = _CH_PARAM_RE.sub("?", shape)
+    shape = _BIND_PARAM_RE.sub("?", shape)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _IN_LIST_RE.sub("(?+)", shape)
+    return _SPACE_RE.sub(" ", shape).strip().lower()
+
+
+def sql_fingerprint(sql: str) -> str:
+    return hashlib.sha1(normalize_sql(sql).encode("utf-8")).hexdigest()[:16]
+
+
+def param_cardinalities(params: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    每個參數的基數：清單為長度，其他 (非 None) 為 1。
+    """
+    cardinalities = {}
+    for k, v in (params or {}).items():
+        if v is None:
+            continue
+        cardinalities[k] = len(v) if isinstance(v, (list, tuple, set)) else 1
+    return cardinalities
+
+
+class QueryLog:
+    """
+    SQLite 查詢紀錄；record() 只放進 queue，由背景 thread 批次寫入。
+    """
+
+    def __init__(self, path: str, retention_days: float = 30):
+        self.path = path
+        self.retention_days = retention_days
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=int(os.getenv('QUERY_LOG_QUEUE_SIZE', 10000)))
+        self._dropped = 0
+        self._writer = threading.Thread(target=self._run, name="query-log-writer", daemon=True)
+        self._writer.start()
+
+    def record(self, backend: str, template: str, sql: Optional[str], params: Optional[Dict[str, Any]],
+               rows: Optional[int], duration_ms: float, error: Optional[str] = None) -> None:
+        shape = normalize_sql(sql) if sql else ""
+        fingerprint = hashlib.sha1(shape.encode("utf-8")).hexdigest()[:16]
+        entry = (
+            time.time(), backend, template, fingerprint, shape[:4000],
+            json.dumps(param_cardinalities(params), sort_keys=True), rows, round(duration_ms, 2),
+            error[:1000] if error else None,
+        )
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            # 寫入跟不上時寧可丟紀錄，也不拖慢查詢
+            self._dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """
+        等待 queue 中的紀錄寫入 (供 scripts / 結束前使用)。
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        if self.retention_days:
+            conn.execute("DELETE FROM query_log WHERE ts < ?", (time.time() - self.retention_days * 86400,))
+        conn.commit()
+        return conn
+
+    def _run(self) -> None:
+        try:
+            conn = self._connect()
+        except Exception as e:
+            print(f"⚠️ Query log disabled, cannot open {self.path}: {e}")
+            conn = None
+
+        while True:
+            batch: List[tuple] = [self._queue.get()]
+            # 一次取出目前累積的紀錄，單一 transaction 寫入
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if conn is not None:
+                    conn.executemany(
+                        "INSERT INTO query_log (ts, backend, template, fingerprint, sql_shape, param_cardinalities, "
+                        "row_count, duration_ms, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        batch,
+                    )
+                    conn.commit()
+            except Exception as e:
+                print(f"⚠️ Failed to write {len(batch)} query log entries: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+_query_log: Optional[QueryLog] = None
+_query_log_lock = threading.Lock()
+
+
+def get_query_log() -> QueryLog:
+    global _query_log
+    if _query_log is None:
+        with _query_log_lock:
+            if _query_log is None:
+                _query_log = QueryLog(log_path(), retention_days=float(os.getenv('QUERY_LOG_RETENTION_DAYS', 30)))
+    return _query_log
+
+
+class _Execution:
+    """
+    log_query() 產生的紀錄；呼叫端在查詢完成後設定 rows (以及實際送出的 sql)。
+    """
+
+    def __init__(self, sql: Optional[str]):
+        self.sql = sql
+        self.rows: Optional[int] = None
+
+
+@contextmanager
+def log_query(backend: str, template: str, params: Optional[Dict[str, Any]] = None,
+              sql: Optional[str] = None) -> Iterator[_Execution]:
+    """
+    記錄 with 區塊內的一次查詢 (耗時、列數；拋出例外時記錄錯誤後繼續拋出)。
+
+        with log_query("mysql", template_name, db_params, rendered_sql) as execution:
+            ...
+            execution.rows = result["count"]
+    """
+    execution = _Execution(sql)
+    if not query_log_enabled():
+        yield execution
+        return
+
+    started = time.perf_counter()
+    error = None
+    try:
+        yield execution
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        try:
+            name = os.path.splitext(os.path.basename(template))[0]
+            get_query_log().record(backend, name, execution.sql, params, execution.rows, duration_ms, error)
+        except Exception as e:
+            print(f"⚠️ Failed to record query log entry: {e}")
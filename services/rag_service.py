@@ -1,5 +1,6 @@
 import re
 import os
+import threading
 import traceback
 from typing import List, Dict, Any, Optional, Union
 from qdrant_client import QdrantClient
@@ -14,16 +15,25 @@ load_dotenv()
 
 class RagService:
     _instance = None
+    # Startup warm-up 與第一個請求可能同時初始化，避免重複連線 / 重複載入模型
+    _init_lock = threading.RLock()
+    # 模型載入需要數十秒，使用獨立的 lock，不阻塞 RagService() 建構 (warm-up / /ready)
+    _model_lock = threading.Lock()
 
     def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(RagService, cls).__new__(cls)
-            cls._instance._initialized = False
+        with cls._init_lock:
+            if cls._instance is None:
+                cls._instance = super(RagService, cls).__new__(cls)
+                cls._instance._initialized = False
         return cls._instance
 
     def __init__(self):
-        if self._initialized:
-            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            self._initialize()
+
+    def _initialize(self):
 
         self.host = os.getenv("QDRANT_HOST")
         self.port = int(os.getenv("QDRANT_PORT"))
@@ -44,11 +54,17 @@ class RagService:
         self._model = None
         self._initialized = True
 
+    @property
+    def is_connected(self) -> bool:
+        return self._is_connected
+
     @property
     def model(self):
         if self._model is None:
-            print("🧠 Loading Embedding Model (intfloat/multilingual-e5-base)...")
-            self._model = SentenceTransformer('intfloat/multilingual-e5-base')
+            with self._model_lock:
+                if self._model is None:
+                    print("🧠 Loading Embedding Model (intfloat/multilingual-e5-base)...")
+                    self._model = SentenceTransformer('intfloat/multilingual-e5-base')
         return self._model
 
     @staticmethod
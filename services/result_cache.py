@@ -0,0 +1,148 @@
+"""
+Template Result Cache
+
+合約 / 預算資料變動很慢，同一位分析師常在短時間內重複詢問相同客戶與期間。
+這裡在 MySQL 模板執行前加一層 process 內快取：
+- Key: 模板名稱 + 正規化後的參數 (ID 清單排序去重、日期統一為 YYYY-MM-DD、忽略 None)
+- 每個模板各自的 TTL (template_index.yaml 的 cache_ttl，0 / 未設定表示不快取)
+- 以估計的位元組大小做 LRU 淘汰 (RESULT_CACHE_MAX_BYTES)
+- hit / miss / eviction 計數，依模板分別統計
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+_DATE_RE = re.compile(r"^(\d{4})[-/](\d{1,2})[-/](\d{1,2})$")
+
+
+def _canonical_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str):
+        value = value.strip()
+        match = _DATE_RE.match(value)
+        if match:
+            y, m, d = (int(g) for g in match.groups())
+            return f"{y:04d}-{m:02d}-{d:02d}"
+        return value
+    if isinstance(value, (list, tuple, set)):
+        items = {json.dumps(_canonical_value(v), sort_keys=True, default=str) for v in value}
+        return sorted(items)
+    return value
+
+
+def canonical_key(template_name: str, context: Dict[str, Any]) -> str:
+    """
+    以模板名稱 + 正規化參數組成快取 key；[3, 1, 1] 與 [1, 3]、'2025/1/5' 與 '2025-01-05' 視為相同。
+    """
+    name = os.path.splitext(os.path.basename(template_name))[0]
+    params = {k: _canonical_value(v) for k, v in context.items() if v is not None and v != []}
+    return f"{name}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+def _estimate_bytes(value: Any) -> int:
+    if hasattr(value, "memory_usage"):
+        # pandas DataFrame (例如 performance partition cache 的部分彙總)
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, dict) and any(hasattr(v, "memory_usage") for v in value.values()):
+        # 含 DataFrame 的模板結果 (columnar 模式的 "frame")
+        return sum(_estimate_bytes(v) for v in value.values())
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(str(value))
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> (expires_at, size, value)
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+        self._by_template: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, key: str, field: str) -> None:
+        self._stats[field] += 1
+        template = key.split(":", 1)[0]
+        per_template = self._by_template.setdefault(template, {"hits": 0, "misses": 0})
+        if field in per_template:
+            per_template[field] += 1
+
+    def _drop(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._count(key, "misses")
+                return None
+            if entry[0] <= now:
+                self._drop(key)
+                self._stats["expirations"] += 1
+                self._count(key, "misses")
+                return None
+            self._entries.move_to_end(key)
+            self._count(key, "hits")
+            return entry[2]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        size = _estimate_bytes(value)
+        with self._lock:
+            if size > self.max_bytes:
+                # 單筆結果就超過整個快取容量，直接略過
+                self._stats["rejected"] += 1
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "templates": {name: dict(counts) for name, counts in self._by_template.items()},
+            }
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def cache_enabled() -> bool:
+    return os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(max_bytes=int(os.getenv('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+    return _cache
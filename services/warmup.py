@@ -0,0 +1,142 @@
+"""
+Startup Warm-up & Readiness
+
+部署後第一個請求原本要依序付出 SSH Tunnel 建立、MySQL schema 載入、ClickHouse TLS handshake、
+Qdrant 連線與 Embedding 模型載入的成本。這裡把這些 warm-up 註冊成獨立任務，
+在啟動時於背景平行執行，並記錄每個依賴的狀態與耗時，供 /ready 端點回報。
+"""
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+# 狀態: pending -> warming -> ready / failed
+_tasks: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+_started = False
+
+
+def register_warmup(name: str, required: bool = True):
+    """
+    註冊 warm-up 任務 (decorator)。
+    required=False 的依賴失敗時不會讓服務維持 not-ready (例如 RAG 可降級停用)。
+    """
+    def _decorator(func: Callable[[], None]) -> Callable[[], None]:
+        with _lock:
+            _tasks[name] = {
+                "func": func,
+                "required": required,
+                "status": "pending",
+                "duration_ms": None,
+                "started_at": None,
+                "error": None,
+            }
+        return func
+    return _decorator
+
+
+def _skipped() -> set:
+    if os.getenv('WARMUP_ENABLED', 'true').lower() != 'true':
+        return set(_tasks)
+    return {s.strip() for s in os.getenv('WARMUP_SKIP', '').split(',') if s.strip()}
+
+
+def _run_task(name: str) -> None:
+    with _lock:
+        task = _tasks[name]
+        task["status"] = "warming"
+        task["started_at"] = datetime.now().isoformat(timespec="seconds")
+    started = time.perf_counter()
+    try:
+        task["func"]()
+        status, error = "ready", None
+        print(f"🔥 Warm-up [{name}] ready in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        status, error = "failed", str(e)
+        print(f"⚠️ Warm-up [{name}] failed: {e}")
+        traceback.print_exc()
+    with _lock:
+        task["status"] = status
+        task["error"] = error
+        task["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+
+def start_warmup() -> None:
+    """
+    每個 warm-up 任務各自一條 daemon thread 平行執行，不阻塞 server 啟動。
+    WARMUP_SKIP 可用逗號列出要跳過的依賴名稱；WARMUP_ENABLED=false 則全部跳過 (維持延遲初始化)。
+    """
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+        skipped = _skipped()
+        names = []
+        for name, task in _tasks.items():
+            if name in skipped:
+                task["status"] = "skipped"
+            else:
+                names.append(name)
+
+    print(f"🔥 Starting warm-up: {names}")
+    for name in names:
+        threading.Thread(target=_run_task, args=(name,), name=f"warmup-{name}", daemon=True).start()
+
+
+def readiness() -> Dict[str, Any]:
+    """
+    回傳整體 ready 狀態與每個依賴的狀態 / warm-up 耗時。
+    所有任務都跑完、且 required 任務皆成功時才算 ready。
+    """
+    with _lock:
+        dependencies = {
+            name: {k: v for k, v in task.items() if k != "func"}
+            for name, task in _tasks.items()
+        }
+    ready = _started and all(
+        dep["status"] in ("ready", "skipped") or (dep["status"] == "failed" and not dep["required"])
+        for dep in dependencies.values()
+    )
+    return {"ready": ready, "dependencies": dependencies}
+
+
+# ----------------------------------------------------------------------
+# Built-in warm-ups
+# ----------------------------------------------------------------------
+@register_warmup("mysql")
+def _warm_mysql() -> None:
+    from sqlalchemy import text
+    from config.database import get_mysql_db
+
+    # 建立 SSH Tunnel、載入 schema snapshot，並實際開一條連線進連線池
+    db = get_mysql_db()
+    with db._engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+@register_warmup("clickhouse")
+def _warm_clickhouse() -> None:
+    from config.database import clickhouse_client
+
+    # 完成 TLS handshake，之後的 Client 共用同一個 HTTP 連線池
+    with clickhouse_client() as client:
+        client.query("SELECT 1")
+
+
+@register_warmup("qdrant", required=False)
+def _warm_qdrant() -> None:
+    from services.rag_service import RagService
+
+    if not RagService().is_connected:
+        raise ConnectionError("Qdrant is unreachable; RAG features are disabled.")
+
+
+@register_warmup("embedding_model", required=False)
+def _warm_embedding_model() -> None:
+    from services.rag_service import RagService
+
+    # 載入模型並跑一次 encode，讓第一個查詢不必付出初始化成本
+    RagService().model.encode("warm-up")
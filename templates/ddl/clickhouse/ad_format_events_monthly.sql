@@ -0,0 +1,36 @@
+-- Monthly rollup of kafka.summing_ad_format_events_view (one row per month × placement × format)
+--
+-- 長區間的成效查詢 (例如「全部時間」2020-01-01 ~ 今天) 不必再掃過每日資料：
+-- tools/performance_rollup.py 會把查詢範圍中「完整且已回填」的月份改讀這張表，其餘 (近期 / 不滿一個月) 仍讀每日 view。
+--
+-- - 欄位名稱與型別沿用來源 view (CREATE ... AS SELECT ... WHERE 0)，模板可以直接 UNION ALL 兩邊
+-- - 指標欄位轉為 UInt64，SummingMergeTree 在 merge 時依排序鍵加總
+-- - 所有非指標欄位都必須在排序鍵中，否則 merge 時會任意保留其中一列的值
+-- - ad_type 是排序鍵的一部分：multiIf(ad_type = 'dsp-creative', cv, impression) 在月彙總上仍然正確
+-- - 以月分區，scripts/backfill_rollup.py 以 DROP PARTITION + INSERT 重建單月 (可重複執行)
+--
+-- Usage: python scripts/backfill_rollup.py --create
+
+CREATE TABLE IF NOT EXISTS {{ rollup_table }}
+ENGINE = SummingMergeTree
+PARTITION BY toYYYYMM(month)
+ORDER BY (month, cmpid, plaid, ad_format_type_id, pid, ad_type, ad_format_type, campaign_name, one_category, one_sub_category)
+AS SELECT
+    toStartOfMonth(day_local) AS month,
+    cmpid,
+    plaid,
+    pid,
+    ad_format_type_id,
+    ad_format_type,
+    campaign_name,
+    ad_type,
+    one_category,
+    one_sub_category,
+    toUInt64(bannerClick) AS bannerClick,
+    toUInt64(videoClick) AS videoClick,
+    toUInt64(impression) AS impression,
+    toUInt64(cv) AS cv,
+    toUInt64(q100) AS q100,
+    toUInt64(eng) AS eng
+FROM kafka.summing_ad_format_events_view
+WHERE 0
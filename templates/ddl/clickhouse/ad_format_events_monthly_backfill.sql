@@ -0,0 +1,25 @@
+-- 回填單一月份 ({month_start:Date} ~ {month_end:Date}) 到月彙總表
+-- 執行前 scripts/backfill_rollup.py 會先 DROP 該月分區，重複執行不會重複計算
+
+INSERT INTO {{ rollup_table }}
+SELECT
+    toStartOfMonth(day_local) AS month,
+    cmpid,
+    plaid,
+    pid,
+    ad_format_type_id,
+    ad_format_type,
+    campaign_name,
+    ad_type,
+    one_category,
+    one_sub_category,
+    SUM(bannerClick) AS bannerClick,
+    SUM(videoClick) AS videoClick,
+    SUM(impression) AS impression,
+    SUM(cv) AS cv,
+    SUM(q100) AS q100,
+    SUM(eng) AS eng
+FROM kafka.summing_ad_format_events_view
+WHERE day_local >= {month_start:Date}
+  AND day_local <= {month_end:Date}
+GROUP BY month, cmpid, plaid, pid, ad_format_type_id, ad_format_type, campaign_name, ad_type, one_category, one_sub_category
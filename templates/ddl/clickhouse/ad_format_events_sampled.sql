@@ -0,0 +1,37 @@
+-- Sampled copy of kafka.summing_ad_format_events_view for approximate queries (SAMPLE)
+--
+-- view 無法直接 SAMPLE；這張表以每日彙總保存同樣的欄位，並以 sample_key = cityHash64(plaid, day_local) 抽樣：
+--   FROM kafka.ad_format_events_sampled SAMPLE 0.1
+-- 只讀取約 10% 的 (版位 × 日) 資料，tools/approximate.py 依抽樣結果計算 CTR / VTR / ER 的 95% 信賴區間。
+--
+-- - 欄位名稱與型別沿用來源 view (CREATE ... AS SELECT ... WHERE 0)，模板不需修改外層的 SUM / multiIf
+-- - sample_key 必須在排序鍵中；其餘非指標欄位也都在排序鍵中 (SummingMergeTree 依排序鍵加總)
+-- - 以月分區，scripts/backfill_rollup.py --target sampled 以 DROP PARTITION + INSERT 重建 (含當月)
+--
+-- Usage: python scripts/backfill_rollup.py --target sampled --create --from 2020-01
+
+CREATE TABLE IF NOT EXISTS {{ sample_table }}
+ENGINE = SummingMergeTree
+PARTITION BY toYYYYMM(day_local)
+ORDER BY (day_local, sample_key, cmpid, plaid, ad_format_type_id, pid, ad_type, ad_format_type, campaign_name, one_category, one_sub_category)
+SAMPLE BY sample_key
+AS SELECT
+    toDate(day_local) AS day_local,
+    cityHash64(plaid, toDate(day_local)) AS sample_key,
+    cmpid,
+    plaid,
+    pid,
+    ad_format_type_id,
+    ad_format_type,
+    campaign_name,
+    ad_type,
+    one_category,
+    one_sub_category,
+    toUInt64(bannerClick) AS bannerClick,
+    toUInt64(videoClick) AS videoClick,
+    toUInt64(impression) AS impression,
+    toUInt64(cv) AS cv,
+    toUInt64(q100) AS q100,
+    toUInt64(eng) AS eng
+FROM kafka.summing_ad_format_events_view
+WHERE 0
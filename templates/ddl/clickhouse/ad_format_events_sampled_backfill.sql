@@ -0,0 +1,26 @@
+-- 回填單一月份 ({month_start:Date} ~ {month_end:Date}) 到抽樣表
+-- 執行前 scripts/backfill_rollup.py 會先 DROP 該月分區，重複執行不會重複計算
+
+INSERT INTO {{ sample_table }}
+SELECT
+    toDate(day_local) AS day_local,
+    cityHash64(plaid, toDate(day_local)) AS sample_key,
+    cmpid,
+    plaid,
+    pid,
+    ad_format_type_id,
+    ad_format_type,
+    campaign_name,
+    ad_type,
+    one_category,
+    one_sub_category,
+    SUM(bannerClick) AS bannerClick,
+    SUM(videoClick) AS videoClick,
+    SUM(impression) AS impression,
+    SUM(cv) AS cv,
+    SUM(q100) AS q100,
+    SUM(eng) AS eng
+FROM kafka.summing_ad_format_events_view
+WHERE day_local >= {month_start:Date}
+  AND day_local <= {month_end:Date}
+GROUP BY day_local, sample_key, cmpid, plaid, pid, ad_format_type_id, ad_format_type, campaign_name, ad_type, one_category, one_sub_category
@@ -0,0 +1,50 @@
+-- Plaid → CueList / Campaign / Client / Agency / Industry dictionary (MySQL ID bridge)
+--
+-- 讓 ClickHouse 自己解析 client / agency / industry 過濾，不必先從 MySQL 把 plaids 拉回 Python 再塞進成效查詢：
+--   AND plaid IN (SELECT plaid FROM dictionary('plaid_hierarchy') WHERE client_id IN {client_ids:Array(UInt64)})
+-- 過濾條件與 id_finder.sql 相同 (pre_campaign.trash = 0、one_campaigns.status != 'deleted')。
+--
+-- 來源 (擇一，由 scripts/create_id_bridge.py 依環境變數渲染):
+--   - mysql_collection: ClickHouse 上設定好的 MySQL named collection，dictionary 直接連 MySQL
+--   - mysql_database:   ClickHouse 中既有的 MySQL database engine (例如 mysql_gspadmin)，以 CLICKHOUSE source 查詢
+-- LIFETIME 內自動重新載入；新建立的 Campaign 最多延遲 LIFETIME MAX 秒才查得到。
+--
+-- Usage: python scripts/create_id_bridge.py
+
+CREATE DICTIONARY IF NOT EXISTS {{ dictionary }}
+(
+    plaid UInt64,
+    cue_list_id UInt64,
+    campaign_id UInt64,
+    client_id UInt64,
+    agency_id UInt64,
+    industry_id UInt64,
+    sub_industry_id UInt64,
+    product_line_id UInt64,
+    ad_format_type_id UInt64
+)
+PRIMARY KEY plaid
+{%- set source_query -%}
+    SELECT
+        pc.id AS plaid,
+        cl.id AS cue_list_id,
+        oc.id AS campaign_id,
+        cl.client_id AS client_id,
+        COALESCE(cl.agency_id, 0) AS agency_id,
+        COALESCE(pc.category_id, 0) AS industry_id,
+        COALESCE(pc.sub_category_id, 0) AS sub_industry_id,
+        COALESCE(cl.product_line_id, 0) AS product_line_id,
+        COALESCE(pc.ad_format_type_id, 0) AS ad_format_type_id
+    FROM {{ table_prefix }}pre_campaign pc
+    JOIN {{ table_prefix }}one_campaigns oc ON pc.one_campaign_id = oc.id
+    JOIN {{ table_prefix }}cue_lists cl ON oc.cue_list_id = cl.id
+    WHERE pc.trash = 0
+      AND oc.status != ''deleted''
+{%- endset %}
+{%- if mysql_collection %}
+SOURCE(MYSQL(NAME {{ mysql_collection }} QUERY '{{ source_query }}'))
+{%- else %}
+SOURCE(CLICKHOUSE(QUERY '{{ source_query }}'))
+{%- endif %}
+LAYOUT(HASHED())
+LIFETIME(MIN {{ lifetime_min }} MAX {{ lifetime_max }})
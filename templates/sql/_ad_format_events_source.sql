@@ -0,0 +1,32 @@
+{#
+  Partial: _ad_format_events_source.sql
+  Description: 成效模板的 FROM 來源。一般情況為每日 view；帶有 sample_rate 時讀抽樣表的部分資料；帶有 rollup_from 時 (tools/performance_rollup.py)，
+               完整且已回填的月份改讀月彙總表，其餘日期仍讀每日 view，兩邊以 UNION ALL 接起來。
+               月彙總列的 day_local 為該月 1 號，欄位名稱與每日 view 相同，外層的 SUM / multiIf 不需修改。
+  Parameters (internal):
+    - rollup_table: str - 月彙總表名稱
+    - rollup_from / rollup_to: str - 讀月彙總的第一個 / 最後一個月份 (月初日期)
+    - rollup_until: str - rollup_to 月份的最後一天 (每日 view 排除此區間)
+    - sample_table / sample_rate: 近似模式 (tools/approximate.py) 改讀抽樣表並 SAMPLE 該比例，不與月彙總混用
+#}
+{%- if sample_rate %}{{ sample_table }} SAMPLE {{ sample_rate }}
+{%- elif rollup_from %}(
+        SELECT
+            month AS day_local, cmpid, plaid, pid, ad_format_type_id, ad_format_type, campaign_name,
+            ad_type, one_category, one_sub_category, bannerClick, videoClick, impression, cv, q100, eng
+        FROM {{ rollup_table }}
+        WHERE month >= {rollup_from:Date} AND month <= {rollup_to:Date}
+
+        UNION ALL
+
+        SELECT
+            toDate(day_local) AS day_local, cmpid, plaid, pid, ad_format_type_id, ad_format_type, campaign_name,
+            ad_type, one_category, one_sub_category,
+            toUInt64(bannerClick) AS bannerClick, toUInt64(videoClick) AS videoClick, toUInt64(impression) AS impression,
+            toUInt64(cv) AS cv, toUInt64(q100) AS q100, toUInt64(eng) AS eng
+        FROM kafka.summing_ad_format_events_view
+        WHERE day_local >= {start_date:Date} AND day_local <= {end_date:Date}
+          AND NOT (day_local >= {rollup_from:Date} AND day_local <= {rollup_until:Date})
+    )
+{%- else %}kafka.summing_ad_format_events_view
+{%- endif %}
@@ -0,0 +1,27 @@
+{#
+  Partial: _id_bridge_filter.sql
+  Description: ID Bridge (tools/id_bridge.py)。client / agency / industry 過濾直接在 ClickHouse 以
+               plaid_hierarchy dictionary (MySQL 階層的鏡像) 解析成 plaid 集合，不經過 Python 傳遞 ID 清單。
+               未啟用 bridge 時這些過濾已先在 MySQL 解析成 plaids，此片段不輸出任何內容。
+  Parameters (internal):
+    - bridge_dictionary: str - dictionary 名稱
+    - client_ids / agency_ids / industry_ids / sub_industry_ids: List[int] (optional)
+#}
+{%- if bridge_dictionary and (client_ids or agency_ids or industry_ids or sub_industry_ids) %}
+    AND plaid IN (
+        SELECT plaid FROM dictionary('{{ bridge_dictionary }}')
+        WHERE 1=1
+            {%- if client_ids %}
+            AND client_id IN {client_ids:Array(UInt64)}
+            {%- endif %}
+            {%- if agency_ids %}
+            AND agency_id IN {agency_ids:Array(UInt64)}
+            {%- endif %}
+            {%- if industry_ids %}
+            AND industry_id IN {industry_ids:Array(UInt64)}
+            {%- endif %}
+            {%- if sub_industry_ids %}
+            AND sub_industry_id IN {sub_industry_ids:Array(UInt64)}
+            {%- endif %}
+    )
+{%- endif %}
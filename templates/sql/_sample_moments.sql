@@ -0,0 +1,17 @@
+{#
+  Partial: _sample_moments.sql
+  Description: 抽樣查詢 (sample_rate) 外層額外輸出的動差欄位，tools/approximate.py 以 ratio estimator 計算
+               CTR / VTR / ER 的信賴區間後移除。x = 分母 (曝光)，y = 點擊 / Q100 / 互動，
+               每列為內層 (_sample_units.sql) 彙總出的一個抽樣單位 (維度 × plaid × day_local)。
+  Returns (internal): sample_rows, sample_factor, sample_imp_sq, sample_click_sq, sample_click_imp,
+                      sample_q100_sq, sample_q100_imp, sample_eng_sq, sample_eng_imp
+#}
+    count() AS sample_rows,
+    any(unit_factor) AS sample_factor,
+    SUM(pow(toFloat64(unit_impressions), 2)) AS sample_imp_sq,
+    SUM(pow(toFloat64(unit_clicks), 2)) AS sample_click_sq,
+    SUM(toFloat64(unit_clicks) * unit_impressions) AS sample_click_imp,
+    SUM(pow(toFloat64(unit_q100), 2)) AS sample_q100_sq,
+    SUM(toFloat64(unit_q100) * unit_impressions) AS sample_q100_imp,
+    SUM(pow(toFloat64(unit_engagements), 2)) AS sample_eng_sq,
+    SUM(toFloat64(unit_engagements) * unit_impressions) AS sample_eng_imp
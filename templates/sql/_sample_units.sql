@@ -0,0 +1,11 @@
+{#
+  Partial: _sample_units.sql
+  Description: 近似模式的內層欄位。抽樣表以 SAMPLE BY cityHash64(plaid, day_local) 抽出 (版位 × 日) 群集，
+               內層查詢依 維度 × plaid × day_local 彙總，每列即一個抽樣單位；外層以 _sample_moments.sql 對抽樣單位計算動差。
+  Returns (internal): unit_clicks, unit_impressions, unit_q100, unit_engagements, unit_factor
+#}
+    SUM(bannerClick + videoClick) AS unit_clicks,
+    SUM(multiIf(ad_type = 'dsp-creative', cv, impression)) AS unit_impressions,
+    SUM(q100) AS unit_q100,
+    SUM(eng) AS unit_engagements,
+    any(_sample_factor) AS unit_factor
@@ -0,0 +1,131 @@
+{#
+  Template: budget_summary.sql
+  Description: 單次查詢完成「id_finder → investment_budget → execution_budget」：
+               直接以客戶 / 代理商 / 產業 / 格式 / 期間過濾，回傳 Campaign × 格式 的進單與執行金額。
+  Returns: campaign_id, campaign_name, client_name, agency_name, format_type_id, format_name,
+           investment_amount, investment_gift, execution_amount, execution_gift
+  Parameters:
+    - start_date: str (required)
+    - end_date: str (required)
+    - client_ids / agency_ids / ad_format_type_ids / industry_ids / sub_industry_ids / product_line_ids: List[int] (optional)
+    - row_limit: int (optional, default 5000)
+  Notes:
+    - 進單金額綁在 CueList 上 (一個 CueList 可有多個 Campaign)，為避免金額膨脹，
+      每個 CueList 的進單金額只歸屬到其代表 Campaign (符合條件的最小 campaign_id)。
+    - 執行金額以 Pre-Campaign 加總到 Campaign × 格式。
+#}
+
+WITH matched AS (
+    -- 與 id_finder.sql 相同的過濾條件
+    SELECT DISTINCT
+        cl.id AS cue_list_id,
+        oc.id AS campaign_id,
+        pc.id AS plaid
+    FROM cue_lists cl
+    JOIN one_campaigns oc ON oc.cue_list_id = cl.id
+    JOIN pre_campaign pc ON pc.one_campaign_id = oc.id
+    WHERE 1=1
+        AND pc.trash = 0
+        AND oc.status != 'deleted'
+        AND STR_TO_DATE(pc.end_date, '%Y/%m/%d') >= :start_date
+        AND STR_TO_DATE(pc.start_date, '%Y/%m/%d') <= :end_date
+
+        {% if client_ids %}
+        AND cl.client_id IN :client_ids
+        {% endif %}
+
+        {% if agency_ids %}
+        AND cl.agency_id IN :agency_ids
+        {% endif %}
+
+        {% if ad_format_type_ids %}
+        AND pc.ad_format_type_id IN :ad_format_type_ids
+        {% endif %}
+
+        {% if product_line_ids %}
+        AND cl.product_line_id IN :product_line_ids
+        {% endif %}
+
+        {% if industry_ids %}
+        AND pc.category_id IN :industry_ids
+        {% endif %}
+
+        {% if sub_industry_ids %}
+        AND pc.sub_category_id IN :sub_industry_ids
+        {% endif %}
+),
+
+representative AS (
+    -- 每個 CueList 的代表 Campaign (進單金額只算一次)
+    SELECT cue_list_id, MIN(campaign_id) AS campaign_id
+    FROM matched
+    GROUP BY cue_list_id
+),
+
+investment AS (
+    -- 進單金額 (同 investment_budget.sql 的定義)
+    SELECT
+        rep.campaign_id,
+        aft.id AS format_type_id,
+        MAX(COALESCE(aft.title, aft.name, 'Unspecified')) AS format_name,
+        SUM(clb.budget) AS investment_amount,
+        SUM(clb.budget_gift) AS investment_gift
+    FROM representative rep
+    JOIN cue_lists cl ON cl.id = rep.cue_list_id
+    JOIN cue_list_product_lines clpl ON clpl.cue_list_id = cl.id
+    JOIN cue_list_ad_formats claf ON claf.cue_list_product_line_id = clpl.id
+    JOIN cue_list_budgets clb ON clb.cue_list_ad_format_id = claf.id
+    JOIN ad_format_types aft ON claf.ad_format_type_id = aft.id
+    WHERE cl.status IN ('converted', 'requested')
+        AND aft.title NOT LIKE '%已退役%'
+        AND aft.name NOT LIKE '%已退役%'
+    GROUP BY rep.campaign_id, aft.id
+),
+
+execution AS (
+    -- 執行金額 (同 execution_budget.sql 的定義)
+    SELECT
+        pc.one_campaign_id AS campaign_id,
+        pc.ad_format_type_id AS format_type_id,
+        MAX(COALESCE(aft.title, aft.name, 'Unknown Format')) AS format_name,
+        SUM(pc.budget) AS execution_amount,
+        SUM(pc.onead_gift) AS execution_gift
+    FROM matched m
+    JOIN pre_campaign pc ON pc.id = m.plaid
+    LEFT JOIN ad_format_types aft ON pc.ad_format_type_id = aft.id
+    WHERE pc.status IN ('oncue', 'close')
+    GROUP BY pc.one_campaign_id, pc.ad_format_type_id
+),
+
+combined AS (
+    -- MySQL 沒有 FULL OUTER JOIN：兩邊以 UNION ALL 疊起來再加總
+    SELECT campaign_id, format_type_id, format_name,
+           investment_amount, investment_gift, 0 AS execution_amount, 0 AS execution_gift
+    FROM investment
+    UNION ALL
+    SELECT campaign_id, format_type_id, format_name,
+           0, 0, execution_amount, execution_gift
+    FROM execution
+)
+
+SELECT
+    c.campaign_id,
+    MAX(oc.name) AS campaign_name,
+    MAX(COALESCE(cli.advertiser_name, cli.company)) AS client_name,
+    MAX(COALESCE(ag.agencyname, 'Direct Client')) AS agency_name,
+    c.format_type_id,
+    MAX(c.format_name) AS format_name,
+    SUM(c.investment_amount) AS investment_amount,
+    SUM(c.investment_gift) AS investment_gift,
+    SUM(c.execution_amount) AS execution_amount,
+    SUM(c.execution_gift) AS execution_gift
+
+FROM combined c
+JOIN one_campaigns oc ON oc.id = c.campaign_id
+JOIN cue_lists cl ON cl.id = oc.cue_list_id
+JOIN clients cli ON cli.id = cl.client_id
+LEFT JOIN agency ag ON ag.id = cl.agency_id
+
+GROUP BY c.campaign_id, c.format_type_id
+ORDER BY investment_amount DESC, execution_amount DESC
+LIMIT {{ row_limit|default(5000) }}
@@ -4,6 +4,7 @@
   Returns: campaign_id, client_name, brand, contract_name, campaign_name, start_date, end_date, agency_name, plaids (comma-separated)
   Parameters:
     - campaign_ids: List[int] (required)
+    - row_limit: int (optional, default 1000) - 單次查詢筆數上限 (大型 ID 清單會分塊執行)
 #}
 
 SELECT
@@ -37,4 +38,4 @@ WHERE 1=1
 
 GROUP BY oc.id
 ORDER BY oc.start_date DESC
-LIMIT 100
\ No newline at end of file
+LIMIT {{ row_limit|default(1000) }}
\ No newline at end of file
@@ -6,6 +6,7 @@
   Returns: plaid, execution_amount
   Parameters:
     - plaids: List[int] (required) - 指定 Pre-Campaign IDs
+    - row_limit: int (optional, default 5000) - 單次查詢筆數上限 (大型 ID 清單會分塊執行)
 #}
 
 SELECT
@@ -36,4 +37,4 @@ WHERE 1=1
     {% endif %}
 
 ORDER BY pc.id
-LIMIT 5000
\ No newline at end of file
+LIMIT {{ row_limit|default(5000) }}
\ No newline at end of file
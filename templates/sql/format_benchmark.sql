@@ -0,0 +1,95 @@
+{#
+  Template: format_benchmark.sql
+  Description: 格式成效基準 (Benchmark)，以廣告格式彙總 CTR / VTR / ER 並排名。使用 ClickHouse View。
+  Returns: ad_format_type, ad_format_type_id, total_clicks, total_impressions, total_q100, total_engagements, ctr, vtr, er, ctr_rank, vtr_rank
+  Merge Key: ad_format_type_id
+  Binding: 日期 / ID 以 ClickHouse server-side 參數 ({name:Type}) 帶入
+  Parameters:
+    - start_date: str (required) - 開始日期 (YYYY-MM-DD)
+    - end_date: str (required) - 結束日期 (YYYY-MM-DD)
+    - cmp_ids: List[int] (optional) - Campaign ID 過濾 (特定產業 / 客戶群的 Benchmark)
+    - format_ids: List[int] (optional) - 廣告格式 ID 過濾
+    - plaids: List[int] (optional) - Placement ID 過濾 (ID Bridge 未啟用時由 client / agency / industry 過濾解析而來)
+    - client_ids / agency_ids / industry_ids / sub_industry_ids: List[int] (optional) - ID Bridge 啟用時由 ClickHouse 解析 (見 _id_bridge_filter.sql)，否則先在 MySQL 解析成 plaids
+    - bridge_dictionary (internal) - ID Bridge dictionary 名稱
+    - rollup_table / rollup_from / rollup_to / rollup_until (internal) - 長區間改讀月彙總表的月份 (見 _ad_format_events_source.sql)
+    - sample_table / sample_rate (internal) - 近似模式：SAMPLE 抽樣表，內層依 格式 × plaid × day_local 彙總成抽樣單位 (見 _sample_units.sql)，
+      外層輸出動差欄位 (見 _sample_moments.sql)，加總欄位為抽樣值
+#}
+
+SELECT
+    ad_format_type,
+    ad_format_type_id,
+
+    -- 基礎指標
+    {%- if sample_rate %}
+    SUM(unit_clicks) AS total_clicks,
+    SUM(unit_impressions) AS total_impressions,
+    SUM(unit_q100) AS total_q100,
+    SUM(unit_engagements) AS total_engagements,
+    {%- else %}
+    (SUM(bannerClick) + SUM(videoClick)) AS total_clicks,
+    SUM(multiIf(ad_type = 'dsp-creative', cv, impression)) AS total_impressions,
+    SUM(q100) AS total_q100,
+    SUM(eng) AS total_engagements,
+    {%- endif %}
+
+    -- 計算指標 (Calculated Metrics)
+    if(total_impressions > 0, (total_clicks / total_impressions) * 100, 0) AS ctr,
+    if(total_impressions > 0, (total_q100 / total_impressions) * 100, 0) AS vtr,
+    if(total_impressions > 0, (total_engagements / total_impressions) * 100, 0) AS er,
+
+    -- 排名
+    rank() OVER (ORDER BY ctr DESC) AS ctr_rank,
+    rank() OVER (ORDER BY vtr DESC) AS vtr_rank
+    {%- if sample_rate %},
+
+    -- 抽樣動差 (Approximate Mode)
+    {% include "_sample_moments.sql" %}
+    {%- endif %}
+
+{%- if sample_rate %}
+
+FROM (
+    SELECT
+        ad_format_type,
+        ad_format_type_id,
+        {% include "_sample_units.sql" %}
+    FROM {% include "_ad_format_events_source.sql" %}
+{%- else %}
+
+FROM {% include "_ad_format_events_source.sql" %}
+{%- endif %}
+
+WHERE 1=1
+    -- 時間範圍
+    AND day_local >= {start_date:Date}
+    AND day_local <= {end_date:Date}
+
+    {% if cmp_ids %}
+    AND cmpid IN {cmp_ids:Array(UInt64)}
+    {% endif %}
+
+    {% if plaids %}
+    AND plaid IN {plaids:Array(UInt64)}
+    {% endif %}
+
+    -- Client / Agency / Industry 過濾 (ID Bridge：由 ClickHouse dictionary 解析成 plaids)
+    {% include "_id_bridge_filter.sql" %}
+
+    {% if format_ids %}
+    AND ad_format_type_id IN {format_ids:Array(Int64)}
+    {% endif %}
+{%- if sample_rate %}
+
+    GROUP BY ad_format_type, ad_format_type_id, plaid, day_local
+)
+{%- endif %}
+
+GROUP BY
+    ad_format_type,
+    ad_format_type_id
+
+HAVING total_impressions > 0
+
+ORDER BY ctr DESC
@@ -11,9 +11,18 @@
     - industry_ids: List[int] (optional)
     - sub_industry_ids: List[int] (optional)
     - product_line_ids: List[int] (optional)
-    - limit: int (default 5000)
+    - page_size: int (default 5000) 單頁列數
+    - after_cue_list_id / after_campaign_id / after_plaid: keyset 游標 (上一頁最後一列，首頁不傳)
+    - count_only: bool (只回傳符合條件的總列數 total_count)
+    - plaids_only: bool (只回傳相異的 plaid，不排序、不分頁；tools/id_bridge.py 的 MySQL fallback 使用)
 #}
 
+{% if count_only %}
+SELECT COUNT(*) AS total_count FROM (
+{% endif %}
+{% if plaids_only %}
+SELECT DISTINCT pc.id AS plaid
+{% else %}
 SELECT DISTINCT
     cl.id AS cue_list_id,
     oc.id AS campaign_id,
@@ -23,6 +32,7 @@ SELECT DISTINCT
     -- cl.campaign_name AS contract_name,
     -- oc.name AS campaign_name,
     -- pc.ad_format_type_id
+{% endif %}
 
 FROM cue_lists cl
 JOIN one_campaigns oc ON oc.cue_list_id = cl.id
@@ -63,5 +73,19 @@ WHERE 1=1
     AND pc.sub_category_id IN ({{ sub_industry_ids|join(',') }})
     {% endif %}
 
+    -- Keyset 分頁：從上一頁最後一列 (cl.id, oc.id, pc.id) 之後繼續
+    -- (展開成 OR 條件而非 row constructor，讓 MySQL 能使用 cl.id 的 range scan)
+    {% if after_cue_list_id is defined and after_cue_list_id is not none %}
+    AND (
+        cl.id > :after_cue_list_id
+        OR (cl.id = :after_cue_list_id AND oc.id > :after_campaign_id)
+        OR (cl.id = :after_cue_list_id AND oc.id = :after_campaign_id AND pc.id > :after_plaid)
+    )
+    {% endif %}
+
+{% if count_only %}
+) AS matched_ids
+{% elif not plaids_only %}
 ORDER BY cl.id, oc.id, pc.id
-LIMIT {{ limit|default(5000) }}
+LIMIT {{ page_size|default(5000) }}
+{% endif %}
@@ -6,6 +6,7 @@
   Returns: cue_list_id, campaign_id, format_name, investment_amount
   Parameters:
     - cue_list_ids: List[int] (required)
+    - row_limit: int (optional, default 5000) - 單次查詢筆數上限 (大型 ID 清單會分塊執行)
 #}
 
 SELECT
@@ -52,4 +53,4 @@ WHERE 1=1
 -- 修正：我們應該 GROUP BY cue_list_id, format_type_id，並只取一個 representative campaign_id
 GROUP BY cl.id, aft.id, clb.id
 ORDER BY cl.id DESC
-LIMIT 5000
\ No newline at end of file
+LIMIT {{ row_limit|default(5000) }}
\ No newline at end of file
@@ -4,6 +4,7 @@
   Returns: plaid, segment_name, segment_category
   Parameters:
     - plaids: List[int] (required) - 指定 Pre-Campaign IDs
+    - row_limit: int (optional, default 5000) - 單次查詢筆數上限 (大型 ID 清單會分塊執行)
 #}
 
 SELECT
@@ -31,4 +32,4 @@ WHERE ctp.source_id = pre.id
     AND pre.trash = 0
 
 ORDER BY pre.id, ts.description
-LIMIT 5000
+LIMIT {{ row_limit|default(5000) }}
@@ -3,6 +3,7 @@
   Description: 維度探索查詢 (Direct Metadata Table)，用於快速查詢「有哪些...」的問題。
   Returns: dimensions (dynamic)
   Merge Key: N/A
+  Binding: ID / 類別以 ClickHouse server-side 參數 ({name:Type}) 帶入
   Parameters:
     - dimensions: List[str] (required) - 欲查詢的維度，支援 ['client_company', 'product_line', 'one_category', 'one_sub_category', 'ad_format_type', 'campaign_name', 'publisher', 'placement_name', 'client_id', 'product_line_id', 'ad_format_type_id', 'plaid', 'cmpid']
     - client_ids: List[int] (optional)
@@ -27,40 +28,32 @@ FROM mysql_gspadmin.view_pid_attributes
 WHERE 1=1
     -- ID Filters
     {% if plaids %}
-    AND plaid IN ({{ plaids | join(',') }})
+    AND plaid IN {plaids:Array(UInt64)}
     {% endif %}
 
     {% if cmpids %}
-    AND cmpid IN ({{ cmpids | join(',') }})
+    AND cmpid IN {cmpids:Array(UInt64)}
     {% endif %}
 
     {% if client_ids %}
-    AND client_id IN ({{ client_ids | join(',') }})
+    AND client_id IN {client_ids:Array(Int64)}
     {% endif %}
 
     {% if product_line_ids %}
-    AND product_line_id IN ({{ product_line_ids | join(',') }})
+    AND product_line_id IN {product_line_ids:Array(Int64)}
     {% endif %}
 
     {% if ad_format_type_ids %}
-    AND ad_format_type_id IN ({{ ad_format_type_ids | join(',') }})
+    AND ad_format_type_id IN {ad_format_type_ids:Array(Int64)}
     {% endif %}
 
     -- String Filters
     {% if one_categories %}
-    AND one_category IN (
-        {%- for cat in one_categories -%}
-        '{{ cat }}'{% if not loop.last %}, {% endif %}
-        {%- endfor -%}
-    )
+    AND one_category IN {one_categories:Array(String)}
     {% endif %}
 
     {% if one_sub_categories %}
-    AND one_sub_category IN (
-        {%- for sub in one_sub_categories -%}
-        '{{ sub }}'{% if not loop.last %}, {% endif %}
-        {%- endfor -%}
-    )
+    AND one_sub_category IN {one_sub_categories:Array(String)}
     {% endif %}
 
 LIMIT {{ limit | default(100) }}
@@ -3,6 +3,7 @@
   Description: 核心成效查詢，使用 ClickHouse View，主要透過 ID 進行精準過濾。
   Returns: dimensions (dynamic), clicks, effective_impressions, ctr, vtr
   Merge Key: N/A
+  Binding: ID / 類別 / 日期以 ClickHouse server-side 參數 ({name:Type}) 帶入，SQL 文字不隨 ID 數量改變
   Parameters:
     - dimensions: List[str] (required) - 分析維度，支援 ['client_company', 'product_line', 'one_category', 'one_sub_category', 'ad_format_type', 'campaign_name', 'client_id', 'product_line_id', 'ad_format_type_id', 'plaid', 'cmpid', 'player_mode']
     - start_date: str (required) - 開始日期 (YYYY-MM-DD)
@@ -14,9 +15,43 @@
     - one_categories: List[str] (optional) - 產業類別 (String) 過濾
     - one_sub_categories: List[str] (optional) - 子產業類別 (String) 過濾
     - limit: int (optional, default 100) - 回傳筆數限制
+    - partitioned: bool (internal) - 依 partition_key 輸出部分彙總 (不排序)，供 partition cache 合併
+    - partition_row_limit: int (internal) - 部分彙總的列數上限 (以 LIMIT partition_row_limit + 1 查詢，超過時改用一般查詢)
+    - partition_months / partition_month_from / partition_month_to (internal) - 以月彙總的日期區間
+    - client_ids / agency_ids / industry_ids / sub_industry_ids: List[int] (optional) - ID Bridge 啟用時由 ClickHouse 解析 (見 _id_bridge_filter.sql)，否則先在 MySQL 解析成 plaids
+    - bridge_dictionary (internal) - ID Bridge dictionary 名稱
+    - rollup_table / rollup_from / rollup_to / rollup_until (internal) - 長區間改讀月彙總表的月份 (見 _ad_format_events_source.sql)
+    - sample_table / sample_rate (internal) - 近似模式：SAMPLE 抽樣表，內層依 維度 × plaid × day_local 彙總成抽樣單位 (見 _sample_units.sql)，
+      外層只依維度分組，不輸出 cmpid / plaid，改輸出動差欄位 (見 _sample_moments.sql)
 #}
 
+{%- if sample_rate %}
+-- 近似模式：外層以抽樣單位加總並計算動差
 SELECT
+    {%- for dim in dimensions %}
+    {{ dim }},
+    {%- endfor %}
+    SUM(unit_clicks) AS clicks,
+    SUM(unit_impressions) AS effective_impressions,
+    SUM(unit_q100) AS total_q100_views,
+    SUM(unit_engagements) AS total_engagements,
+    if(effective_impressions > 0, (clicks / effective_impressions) * 100, 0) AS ctr,
+    if(effective_impressions > 0, (total_q100_views / effective_impressions) * 100, 0) AS vtr,
+    if(effective_impressions > 0, (total_engagements / effective_impressions) * 100, 0) AS er,
+
+    -- 抽樣動差 (Approximate Mode)
+    {% include "_sample_moments.sql" %}
+FROM (
+{%- endif %}
+SELECT
+    {%- if partitioned %}
+    -- 分區鍵 (Partition Cache)：整月落在查詢範圍內的以月彙總，其餘以日彙總
+    {%- if partition_months %}
+    if(day_local >= {partition_month_from:Date} AND day_local <= {partition_month_to:Date}, toStartOfMonth(day_local), toDate(day_local)) AS partition_key,
+    {%- else %}
+    toDate(day_local) AS partition_key,
+    {%- endif %}
+    {%- endif %}
     -- 動態維度 (Dimensions)
     {%- for dim in dimensions %}
         {%- if dim == 'client_company' %}
@@ -37,6 +72,10 @@ SELECT
         {{ dim }},
         {%- endif %}
     {%- endfor %}
+    {%- if sample_rate %}
+    -- 抽樣單位 (Approximate Mode)
+    {% include "_sample_units.sql" %}
+    {%- else %}
     -- 核心關聯 ID (Internal Use)
     cmpid,
     plaid,
@@ -59,51 +98,47 @@ SELECT
 
     -- ER: 互動數 / 分母
     if(effective_impressions > 0, (total_engagements / effective_impressions) * 100, 0) AS er
+    {%- endif %}
 
-FROM kafka.summing_ad_format_events_view
+FROM {% include "_ad_format_events_source.sql" %}
 
 WHERE 1=1
     -- 時間範圍
     {% if start_date %}
-    AND day_local >= '{{ start_date }}'
+    AND day_local >= {start_date:Date}
     {% endif %}
     {% if end_date %}
-    AND day_local <= '{{ end_date }}'
+    AND day_local <= {end_date:Date}
     {% endif %}
 
     -- ID Filters (Primary - Native Columns)
     {% if plaids %}
-    AND plaid IN ({{ plaids | join(',') }})
+    AND plaid IN {plaids:Array(UInt64)}
     {% endif %}
 
     {% if cmpids %}
-    AND cmpid IN ({{ cmpids | join(',') }})
+    AND cmpid IN {cmpids:Array(UInt64)}
     {% endif %}
 
+    -- Client / Agency / Industry 過濾 (ID Bridge：由 ClickHouse dictionary 解析成 plaids)
+    {% include "_id_bridge_filter.sql" %}
+
     -- ID Filters (Dictionary Lookups)
     {% if product_line_ids %}
-    AND dictGetInt32('view_pid_attributes', 'product_line_id', toUInt64(pid)) IN ({{ product_line_ids | join(',') }})
+    AND dictGetInt32('view_pid_attributes', 'product_line_id', toUInt64(pid)) IN {product_line_ids:Array(Int64)}
     {% endif %}
 
     {% if ad_format_type_ids %}
-    AND ad_format_type_id IN ({{ ad_format_type_ids | join(',') }})
+    AND ad_format_type_id IN {ad_format_type_ids:Array(Int64)}
     {% endif %}
 
     -- String Filters (Categories)
     {% if one_categories %}
-    AND one_category IN (
-        {%- for cat in one_categories -%}
-        '{{ cat }}'{% if not loop.last %}, {% endif %}
-        {%- endfor -%}
-    )
+    AND one_category IN {one_categories:Array(String)}
     {% endif %}
 
     {% if one_sub_categories %}
-    AND one_sub_category IN (
-        {%- for sub in one_sub_categories -%}
-        '{{ sub }}'{% if not loop.last %}, {% endif %}
-        {%- endfor -%}
-    )
+    AND one_sub_category IN {one_sub_categories:Array(String)}
     {% endif %}
 
 GROUP BY
@@ -126,9 +161,28 @@ GROUP BY
         {{ dim }}
         {%- endif %}
         {%- if not loop.last %}, {% endif %}
-    {%- endfor %},
+    {%- endfor %}
+    {%- if sample_rate %},
+    plaid,
+    day_local
+    {%- else %},
     cmpid,
     plaid
+    {%- endif %}
+    {%- if partitioned %},
+    partition_key
+    {%- endif %}
+{%- if sample_rate %}
+)
+GROUP BY
+    {%- for dim in dimensions %}
+    {{ dim }}{% if not loop.last %},{% endif %}
+    {%- endfor %}
+{%- endif %}
 
+{% if not partitioned %}
 ORDER BY clicks DESC
 LIMIT {{ limit | default(100) }}
+{% elif partition_row_limit %}
+LIMIT {{ partition_row_limit + 1 }}
+{% endif %}
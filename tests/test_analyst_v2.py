@@ -0,0 +1,151 @@
+"""
+Retriever：同一輪 tool calls 的並行執行與 state 合併
+"""
+import asyncio
+import os
+import threading
+
+import pytest
+from langchain.agents import create_agent
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+# config/llm.py 在 import 時要求金鑰；這些測試以假模型取代，不會呼叫 Gemini
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from agent import analyst_v2  # noqa: E402
+from tools import campaign_template_tool as ctt  # noqa: E402
+
+
+class _ScriptedModel(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def _two_tool_calls():
+    return _ScriptedModel(messages=iter([
+        AIMessage(content="", tool_calls=[
+            {"name": "query_investment_budget", "args": {"cue_list_ids": [1]}, "id": "call_budget"},
+            {"name": "query_execution_budget", "args": {"plaids": [2]}, "id": "call_execution"},
+        ]),
+        AIMessage(content="done"),
+    ]))
+
+
+def _result(template_name):
+    return {"status": "success", "data": [{"template": template_name, "amount": 1}], "count": 1, "generated_sql": "SELECT 1"}
+
+
+@pytest.fixture
+def retriever(monkeypatch):
+    def _install(model):
+        agent = create_agent(
+            model=model,
+            tools=analyst_v2.RETRIEVER_TOOLS,
+            middleware=[analyst_v2.retriever_dynamic_prompt, analyst_v2.retriever_tool_middleware],
+            state_schema=analyst_v2.ProjectAgentState,
+        )
+        monkeypatch.setattr(analyst_v2, "retriever_agent", agent)
+    return _install
+
+
+def _state():
+    return {"messages": [HumanMessage(content="預算與執行金額")], "routing_context": {}}
+
+
+class TestConcurrentToolCalls:
+    def test_sync_tool_calls_overlap_and_both_results_are_stored(self, retriever, monkeypatch):
+        # 兩個工具都必須同時抵達 barrier 才能繼續；依序執行時會逾時
+        barrier = threading.Barrier(2, timeout=5)
+
+        def _execute(template_name, context):
+            barrier.wait()
+            return _result(template_name)
+
+        monkeypatch.setattr(ctt, "_render_and_execute_mysql", _execute)
+        retriever(_two_tool_calls())
+
+        output = analyst_v2.data_retriever_v2_node(_state())
+
+        assert set(output["data_store"]) == {"query_investment_budget", "query_execution_budget"}
+        assert [m.tool_call_id for m in output["messages"] if isinstance(m, ToolMessage)] == ["call_budget", "call_execution"]
+
+    def test_async_tool_calls_are_awaited_concurrently_on_the_event_loop(self, retriever, monkeypatch):
+        threads = []
+        retriever(_two_tool_calls())
+
+        async def _run():
+            barrier = asyncio.Barrier(2)
+
+            async def _execute(template_name, context):
+                threads.append(threading.current_thread())
+                await barrier.wait()
+                return _result(template_name)
+
+            monkeypatch.setattr(ctt, "_render_and_execute_mysql_async", _execute)
+            return await asyncio.wait_for(analyst_v2.adata_retriever_v2_node(_state()), timeout=5)
+
+        output = asyncio.run(_run())
+
+        assert set(output["data_store"]) == {"query_investment_budget", "query_execution_budget"}
+        assert threads == [threading.main_thread()] * 2
+
+    def test_state_lock_is_scoped_to_one_invocation(self, retriever, monkeypatch):
+        locks = []
+
+        def _execute(template_name, context):
+            locks.append(analyst_v2._state_lock_var.get())
+            return _result(template_name)
+
+        monkeypatch.setattr(ctt, "_render_and_execute_mysql", _execute)
+        retriever(_two_tool_calls())
+        analyst_v2.data_retriever_v2_node(_state())
+        retriever(_two_tool_calls())
+        analyst_v2.data_retriever_v2_node(_state())
+
+        assert locks[0] is locks[1]
+        assert locks[2] is locks[3]
+        assert locks[0] is not locks[2]
+        assert analyst_v2._state_lock_var.get() is None
+
+
+class _Request:
+    def __init__(self, name, args, state):
+        self.tool_call = {"name": name, "args": args, "id": "call_1"}
+        self.state = state
+
+
+class TestToolMiddleware:
+    def test_routing_dates_override_tool_args(self):
+        state = {"routing_context": {"start_date": "2024-01-01", "end_date": "2024-03-31", "original_query": "預算"}}
+        request = _Request("query_budget_summary", {"start_date": "2023-01-01", "end_date": "2024-03-31"}, state)
+
+        analyst_v2._before_tool_call(request)
+
+        assert request.tool_call["args"]["start_date"] == "2024-01-01"
+        assert state["data_store"] == {} and state["resolved_entities"] == []
+
+    def test_entity_matches_and_ambiguity_update_state(self):
+        state = {"data_store": {}, "resolved_entities": []}
+        lock = threading.RLock()
+        match = ToolMessage(tool_call_id="call_1", content='{"status": "exact_match", "data": {"id": 1, "type": "client"}}')
+
+        analyst_v2._after_tool_call(_Request("resolve_entity", {}, state), match, lock)
+
+        assert state["resolved_entities"] == [{"id": 1, "type": "client"}]
+        assert state["ambiguity_status"] is None
+
+        ambiguous = ToolMessage(tool_call_id="call_1", content='{"status": "needs_confirmation", "data": []}')
+        analyst_v2._after_tool_call(_Request("resolve_entity", {}, state), ambiguous, lock)
+
+        assert state["ambiguity_status"]["status"] == "needs_confirmation"
+
+    def test_tool_errors_become_tool_messages(self):
+        middleware = analyst_v2.RetrieverToolMiddleware()
+
+        def _failing(request):
+            raise RuntimeError("boom")
+
+        message = middleware.wrap_tool_call(_Request("query_campaign_basic", {}, {}), _failing)
+
+        assert message.content == '{"error": "boom"}'
@@ -0,0 +1,177 @@
+"""
+近似模式：抽樣計畫 (涵蓋範圍縮短 / 改回精確查詢) 與比率估計的信賴區間
+"""
+import math
+import os
+from datetime import date, timedelta
+
+import pandas as pd
+import pytest
+
+from tools import approximate as ap
+
+# agent.reporter 經由 config/llm.py 在 import 時要求金鑰；測試只用到 _approximate_note
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from agent import reporter  # noqa: E402
+
+COVERAGE = (date(2024, 1, 1), date(2024, 6, 30))
+
+
+@pytest.fixture(autouse=True)
+def sampled_table(monkeypatch):
+    monkeypatch.delenv("CH_SAMPLE_TABLE", raising=False)
+    monkeypatch.setenv("CH_SAMPLE_RATE", "0.1")
+    monkeypatch.setenv("CH_SAMPLE_MAX_LAG_DAYS", "2")
+    monkeypatch.setattr(ap, "table_coverage", lambda table, column: COVERAGE)
+
+
+def _context(start_date, end_date, **overrides):
+    return dict({"start_date": start_date, "end_date": end_date}, **overrides)
+
+
+def _recent_coverage(monkeypatch, lag_days):
+    last = date.today() - timedelta(days=lag_days)
+    monkeypatch.setattr(ap, "table_coverage", lambda table, column: (date(2024, 1, 1), last))
+    return last
+
+
+class TestPlanSample:
+    def test_covered_range_samples_as_asked(self):
+        plan = ap.plan_sample(_context("2024-02-01", "2024-03-31"))
+
+        assert plan == {"sample_table": "kafka.ad_format_events_sampled", "sample_rate": 0.1}
+
+    def test_id_filters_stay_exact(self):
+        assert ap.plan_sample(_context("2024-02-01", "2024-03-31", plaids=[1])) == {}
+
+    def test_late_start_is_clamped(self):
+        plan = ap.plan_sample(_context("2023-06-01", "2024-03-31"))
+
+        assert plan["start_date"] == "2024-01-01"
+        assert "end_date" not in plan
+
+    def test_end_within_the_lag_is_clamped(self, monkeypatch):
+        last = _recent_coverage(monkeypatch, lag_days=1)
+
+        plan = ap.plan_sample(_context("2024-02-01", date.today().isoformat()))
+
+        assert plan["end_date"] == last.isoformat()
+
+    def test_end_beyond_the_lag_falls_back_to_exact(self, monkeypatch):
+        _recent_coverage(monkeypatch, lag_days=5)
+
+        assert ap.plan_sample(_context("2024-02-01", date.today().isoformat())) == {}
+
+    def test_range_after_the_sampled_data_falls_back_to_exact(self, monkeypatch):
+        _recent_coverage(monkeypatch, lag_days=2)
+        today = date.today().isoformat()
+
+        assert ap.plan_sample(_context(today, today)) == {}
+
+    def test_missing_table_falls_back_to_exact(self, monkeypatch):
+        monkeypatch.setattr(ap, "table_coverage", lambda table, column: None)
+
+        assert ap.plan_sample(_context("2024-02-01", "2024-03-31")) == {}
+
+    @pytest.mark.parametrize("rate", [0, 1.5, -0.1])
+    def test_invalid_rate(self, rate):
+        with pytest.raises(ValueError):
+            ap.resolve_sample_rate(rate)
+
+
+class TestApproximateInfo:
+    def test_effective_range_reports_both_clamps(self):
+        plan = {"sample_table": "t", "sample_rate": 0.1, "start_date": "2024-01-01", "end_date": "2024-06-30"}
+
+        info = ap.approximate_info(plan, _context("2023-06-01", "2024-07-02"))
+
+        assert info["effective_range"] == ["2024-01-01", "2024-06-30"]
+        assert "instead of 2023-06-01 ~ 2024-07-02" in info["note"]
+
+    def test_unclamped_plan_has_no_range_note(self):
+        info = ap.approximate_info({"sample_table": "t", "sample_rate": 0.1}, _context("2024-02-01", "2024-03-31"))
+
+        assert info["effective_range"] == ["2024-02-01", "2024-03-31"]
+        assert "instead of" not in info["note"]
+
+
+def _sample_frame(x, y, factor=10.0):
+    """
+    一列彙總結果：n 個抽樣單位 (維度 × plaid × day_local) 的曝光 x 與點擊 y 及其動差。
+    """
+    return pd.DataFrame([{
+        "ad_format_type": "banner",
+        "clicks": sum(y),
+        "effective_impressions": sum(x),
+        "ctr": 100 * sum(y) / sum(x),
+        "sample_rows": len(x),
+        "sample_factor": factor,
+        "sample_imp_sq": sum(v * v for v in x),
+        "sample_click_sq": sum(v * v for v in y),
+        "sample_click_imp": sum(a * b for a, b in zip(x, y)),
+    }])
+
+
+class TestAddConfidenceIntervals:
+    def test_ratio_estimator_interval(self):
+        df = ap.add_confidence_intervals(_sample_frame([100, 100, 100, 100], [2, 8, 4, 6]), "unified_performance")
+
+        # R = 0.05, s² = (120 - 2·0.05·2000 + 0.05²·40000) / 3 = 20/3
+        # SE = sqrt(0.9 · 4 · 20/3) / 400，半寬 = 1.96 · SE · 100
+        half_width = 1.96 * math.sqrt(0.9 * 4 * 20 / 3) / 400 * 100
+        row = df.iloc[0]
+        assert row["ctr"] == pytest.approx(5.0)
+        assert row["ctr_ci_low"] == pytest.approx(5.0 - half_width, abs=1e-4)
+        assert row["ctr_ci_high"] == pytest.approx(5.0 + half_width, abs=1e-4)
+
+    def test_totals_are_scaled_and_moments_dropped(self):
+        df = ap.add_confidence_intervals(_sample_frame([100, 100, 100, 100], [2, 8, 4, 6]), "unified_performance")
+
+        row = df.iloc[0]
+        assert (row["clicks"], row["effective_impressions"]) == (200, 4000)
+        assert row["sample_rate"] == 0.1
+        assert not [c for c in df.columns if c.startswith("sample_") and c != "sample_rate"]
+
+    def test_full_sample_has_no_sampling_error(self):
+        df = ap.add_confidence_intervals(_sample_frame([100, 50], [2, 8], factor=1.0), "unified_performance")
+
+        assert df.iloc[0]["ctr_ci_low"] == df.iloc[0]["ctr_ci_high"] == pytest.approx(df.iloc[0]["ctr"], abs=1e-4)
+
+    def test_single_unit_has_no_interval(self):
+        df = ap.add_confidence_intervals(_sample_frame([100], [5]), "unified_performance")
+
+        assert math.isnan(df.iloc[0]["ctr_ci_low"])
+        assert ap.typical_half_width(df) is None
+
+    def test_lower_bound_is_clipped_at_zero(self):
+        df = ap.add_confidence_intervals(_sample_frame([10, 1000, 10, 10], [9, 0, 0, 0]), "unified_performance")
+
+        assert df.iloc[0]["ctr_ci_low"] == 0
+        assert ap.typical_half_width(df) == pytest.approx(df.iloc[0]["ctr_ci_high"] - df.iloc[0]["ctr"])
+
+    def test_clamped_range_columns(self):
+        df = ap.add_confidence_intervals(
+            _sample_frame([100, 100], [2, 8]), "unified_performance", "2024-01-01", "2024-06-30"
+        )
+
+        assert df.iloc[0]["sample_start_date"] == "2024-01-01"
+        assert df.iloc[0]["sample_end_date"] == "2024-06-30"
+
+    def test_exact_results_pass_through(self):
+        df = pd.DataFrame([{"clicks": 1, "ctr": 1.0}])
+
+        assert ap.add_confidence_intervals(df, "unified_performance") is df
+
+
+class TestReporterNote:
+    def test_note_mentions_the_sampled_range(self):
+        df = ap.add_confidence_intervals(
+            _sample_frame([100, 100, 100, 100], [2, 8, 4, 6]), "unified_performance", "2024-01-01", "2024-06-30"
+        )
+
+        note = reporter._approximate_note({"query_unified_performance": df})
+
+        assert "10% 抽樣資料估計" in note
+        assert "抽樣資料自 2024-01-01 起" in note
+        assert "抽樣資料只到 2024-06-30" in note
@@ -0,0 +1,304 @@
+"""
+MySQL 模板：分塊執行 (_chunk_contexts / _merge_chunk_results)、id_finder 的 keyset 分頁與 budget_summary
+"""
+import re
+from datetime import datetime
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from tools import campaign_template_tool as ctt
+
+
+def _rows(start, stop):
+    return [{"campaign_id": i, "campaign_name": f"c{i}"} for i in range(start, stop)]
+
+
+def _result(rows):
+    return {"status": "success", "data": rows, "count": len(rows), "generated_sql": "SELECT 1"}
+
+
+def _frame_result(rows):
+    frame = pd.DataFrame(rows)
+    return {"status": "success", "frame": frame, "count": len(frame), "generated_sql": "SELECT 1"}
+
+
+class TestChunkContexts:
+    def test_small_list_is_a_single_chunk_with_probe_row(self):
+        contexts, row_limit = ctt._chunk_contexts("campaign_basic", {"campaign_ids": [1, 2, 3]})
+
+        assert row_limit == 1000
+        assert contexts == [{"campaign_ids": [1, 2, 3], "row_limit": 1001}]
+
+    def test_large_list_is_deduplicated_and_split_by_chunk_size(self):
+        ids = list(range(250)) + [0, 1, 2]
+        contexts, row_limit = ctt._chunk_contexts("campaign_basic", {"campaign_ids": ids})
+
+        assert [len(c["campaign_ids"]) for c in contexts] == [100, 100, 50]
+        assert [i for c in contexts for i in c["campaign_ids"]] == list(range(250))
+        assert all(c["row_limit"] == row_limit + 1 for c in contexts)
+
+    def test_row_limit_well_above_chunk_size_for_grouped_templates(self):
+        spec = ctt.get_registry().get("campaign_basic")
+        assert spec.row_limit > spec.chunk_size
+
+    def test_caller_row_limit_overrides_index(self):
+        contexts, row_limit = ctt._chunk_contexts("investment_budget", {"cue_list_ids": [1], "row_limit": 10})
+
+        assert row_limit == 10
+        assert contexts[0]["row_limit"] == 11
+
+
+class TestMergeChunkResults:
+    def test_count_equal_to_limit_is_not_truncated(self):
+        merged = ctt._merge_chunk_results([_result(_rows(0, 100))], row_limit=100)
+
+        assert merged["truncated"] is False
+        assert merged["count"] == 100
+        assert "message" not in merged
+
+    def test_probe_row_marks_truncated_and_is_trimmed(self):
+        merged = ctt._merge_chunk_results([_result(_rows(0, 100)), _result(_rows(100, 201))], row_limit=100)
+
+        assert merged["truncated"] is True
+        assert merged["count"] == 200
+        assert merged["data"][-1]["campaign_id"] == 199
+        assert merged["chunks"] == 2
+        assert "truncated" in merged["message"]
+
+    def test_duplicates_across_chunks_are_removed_within_chunk_kept(self):
+        first = _rows(0, 3) + [{"campaign_id": 2, "campaign_name": "c2"}]
+        second = _rows(2, 5)
+        merged = ctt._merge_chunk_results([_result(first), _result(second)], row_limit=None)
+
+        assert [r["campaign_id"] for r in merged["data"]] == [0, 1, 2, 2, 3, 4]
+        assert merged["truncated"] is False
+
+    def test_frames_use_the_same_limit_rules(self):
+        merged = ctt._merge_chunk_results(
+            [_frame_result(_rows(0, 100)), _frame_result(_rows(100, 200))], row_limit=100
+        )
+
+        assert merged["truncated"] is False
+        assert merged["count"] == 200
+        assert list(merged["frame"]["campaign_id"]) == list(range(200))
+
+        merged = ctt._merge_chunk_results([_frame_result(_rows(0, 101))], row_limit=100)
+        assert merged["truncated"] is True
+        assert len(merged["frame"]) == 100
+
+    def test_max_result_rows_truncates_merged_result(self, monkeypatch):
+        monkeypatch.setattr(ctt, "MAX_RESULT_ROWS", 150)
+        merged = ctt._merge_chunk_results([_result(_rows(0, 100)), _result(_rows(100, 200))], row_limit=100)
+
+        assert merged["truncated"] is True
+        assert merged["count"] == 150
+
+    def test_first_error_is_returned(self):
+        error = {"status": "error", "message": "boom"}
+        assert ctt._merge_chunk_results([_result(_rows(0, 1)), error], row_limit=100) is error
+
+
+class _FakeKeysetConnection:
+    """
+    依 after_* 游標與 LIMIT 從排序好的 ID 列中回傳下一頁，並記錄每次送出的 SQL 與參數。
+    """
+
+    def __init__(self, rows):
+        self.rows = sorted(rows)
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def page(self, stmt, params):
+        self.statements.append((str(stmt), dict(params)))
+        after = (params.get("after_cue_list_id"), params.get("after_campaign_id"), params.get("after_plaid"))
+        rows = [r for r in self.rows if after[0] is None or r > after]
+        limit = int(re.search(r"LIMIT (\d+)", str(stmt)).group(1))
+        return rows[:limit]
+
+    def execute(self, stmt, params):
+        self.statements.append((str(stmt), dict(params)))
+        count = len(self.rows)
+        return type("Result", (), {"scalar": lambda self: count})()
+
+
+class TestKeysetPages:
+    @pytest.fixture
+    def connection(self, monkeypatch):
+        monkeypatch.setenv("QUERY_LOG_ENABLED", "false")
+        connection = _FakeKeysetConnection([(cl, cl * 10 + i, cl * 100 + i) for cl in range(1, 4) for i in range(3)])
+        monkeypatch.setattr(ctt, "prepare_mysql_session", lambda conn, timeout: 1)
+
+        def _iter_row_batches(conn, stmt, params):
+            page = conn.page(stmt, params)
+            return ["cue_list_id", "campaign_id", "plaid"], iter([page] if page else [])
+
+        monkeypatch.setattr(ctt, "iter_row_batches", _iter_row_batches)
+        return connection
+
+    @staticmethod
+    def _db(connection):
+        return type("DB", (), {"_engine": type("Engine", (), {"connect": lambda self: connection})()})()
+
+    def _run(self, connection, **context):
+        return ctt._execute_keyset_pages(
+            self._db(connection), "id_finder", dict({"start_date": "2024-01-01", "end_date": "2024-01-31"}, **context)
+        )
+
+    def test_first_page_has_no_cursor_and_next_page_starts_after_last_row(self, connection):
+        self._run(connection, page_size=4)
+
+        pages = connection.statements
+        assert "cl.id > :after_cue_list_id" not in pages[0][0]
+        assert "after_cue_list_id" not in pages[0][1]
+        assert "cl.id > :after_cue_list_id" in pages[1][0]
+        assert "ORDER BY cl.id, oc.id, pc.id" in pages[1][0]
+        assert (pages[1][1]["after_cue_list_id"], pages[1][1]["after_campaign_id"], pages[1][1]["after_plaid"]) == (2, 20, 200)
+
+    def test_all_rows_are_collected_across_pages(self, connection):
+        result = self._run(connection, page_size=4)
+
+        assert result["pages"] == 3
+        assert result["count"] == 9
+        assert result["truncated"] is False
+        assert result["total_count"] == 9
+        assert result["frame"]["plaid"].tolist() == sorted(r[2] for r in connection.rows)
+
+    def test_page_size_multiple_ends_with_an_empty_page(self, connection):
+        result = self._run(connection, page_size=3)
+
+        assert result["pages"] == 4
+        assert result["count"] == 9
+
+    def test_ceiling_counts_the_real_total(self, connection):
+        result = self._run(connection, page_size=4, limit=6)
+
+        assert result["count"] == 6
+        assert result["truncated"] is True
+        assert result["total_count"] == 9
+        assert "6 of 9" in result["message"]
+        assert "COUNT(*)" in connection.statements[-1][0]
+        # 最後一頁只要求補足上限的列數
+        assert "LIMIT 2" in connection.statements[-2][0]
+
+    def test_ceiling_equal_to_total_is_not_truncated(self, connection):
+        result = self._run(connection, page_size=4, limit=9)
+
+        assert result["truncated"] is False
+        assert result["total_count"] == 9
+        assert "message" not in result
+
+
+class TestKeysetToolOutput:
+    def test_ids_are_distinct_and_capped(self, monkeypatch):
+        monkeypatch.setattr(ctt, "KEYSET_INLINE_IDS", 2)
+        frame = pd.DataFrame({"cue_list_id": [1, 1, 1], "campaign_id": [10, 11, 12], "plaid": [100, 101, 102]})
+
+        output = ctt._tool_output({
+            "status": "success", "frame": frame, "count": 3, "generated_sql": "SELECT 1",
+            "id_columns": ["cue_list_id", "campaign_id", "plaid"]
+        })
+
+        assert output["ids"] == {"cue_list_id": [1], "campaign_id": [10, 11], "plaid": [100, 101]}
+        assert output["id_counts"] == {"cue_list_id": 1, "campaign_id": 3, "plaid": 3}
+        assert output["ids_truncated"] is True
+        assert "frame" not in output and "id_columns" not in output
+        assert output["dataset_handle"]
+
+
+class TestBudgetSummary:
+    """
+    在 SQLite 上執行 budget_summary.sql (以 Python 函式補上 MySQL 的 STR_TO_DATE)，檢查金額歸屬。
+    """
+
+    SCHEMA = [
+        "CREATE TABLE cue_lists (id INTEGER, client_id INTEGER, agency_id INTEGER, product_line_id INTEGER, status TEXT)",
+        "CREATE TABLE one_campaigns (id INTEGER, cue_list_id INTEGER, status TEXT, name TEXT)",
+        "CREATE TABLE pre_campaign (id INTEGER, one_campaign_id INTEGER, trash INTEGER, start_date TEXT, end_date TEXT,"
+        " ad_format_type_id INTEGER, category_id INTEGER, sub_category_id INTEGER, budget REAL, onead_gift REAL, status TEXT)",
+        "CREATE TABLE cue_list_product_lines (id INTEGER, cue_list_id INTEGER)",
+        "CREATE TABLE cue_list_ad_formats (id INTEGER, cue_list_product_line_id INTEGER, ad_format_type_id INTEGER)",
+        "CREATE TABLE cue_list_budgets (id INTEGER, cue_list_ad_format_id INTEGER, budget REAL, budget_gift REAL)",
+        "CREATE TABLE ad_format_types (id INTEGER, title TEXT, name TEXT)",
+        "CREATE TABLE clients (id INTEGER, advertiser_name TEXT, company TEXT)",
+        "CREATE TABLE agency (id INTEGER, agencyname TEXT)",
+    ]
+    ROWS = [
+        "INSERT INTO clients VALUES (1, 'Brand A', 'A Corp'), (2, NULL, 'B Corp')",
+        "INSERT INTO agency VALUES (7, 'Agency 7')",
+        "INSERT INTO ad_format_types VALUES (5, 'Banner', 'banner'), (6, 'Video', 'video')",
+        # 客戶 1：一個 CueList 底下兩個 Campaign
+        "INSERT INTO cue_lists VALUES (100, 1, 7, 1, 'converted'), (200, 2, NULL, 1, 'converted')",
+        "INSERT INTO one_campaigns VALUES (10, 100, 'oncue', 'A-1'), (11, 100, 'oncue', 'A-2'), (20, 200, 'oncue', 'B-1')",
+        "INSERT INTO pre_campaign VALUES"
+        " (1000, 10, 0, '2024/01/01', '2024/01/31', 5, 1, 1, 300, 30, 'oncue'),"
+        " (1001, 11, 0, '2024/01/10', '2024/02/10', 5, 1, 1, 200, 0, 'close'),"
+        " (1002, 11, 0, '2024/01/10', '2024/02/10', 6, 1, 1, 50, 0, 'requested'),"
+        " (2000, 20, 0, '2024/01/01', '2024/01/31', 5, 1, 1, 900, 0, 'oncue')",
+        "INSERT INTO cue_list_product_lines VALUES (1, 100), (2, 200)",
+        "INSERT INTO cue_list_ad_formats VALUES (1, 1, 5), (2, 1, 6), (3, 2, 5)",
+        "INSERT INTO cue_list_budgets VALUES (1, 1, 1000, 100), (2, 2, 400, 0), (3, 3, 5000, 0)",
+    ]
+
+    @pytest.fixture
+    def engine(self):
+        engine = create_engine("sqlite://")
+
+        @event.listens_for(engine, "connect")
+        def _functions(dbapi_connection, _):
+            dbapi_connection.create_function(
+                "STR_TO_DATE", 2, lambda value, fmt: datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+            )
+
+        with engine.begin() as connection:
+            for statement in self.SCHEMA + self.ROWS:
+                connection.execute(text(statement))
+        return engine
+
+    def _run(self, engine, **context):
+        stmt, params, _ = ctt._prepare_mysql_statement(
+            "budget_summary", dict({"start_date": "2024-01-01", "end_date": "2024-01-31"}, **context)
+        )
+        with engine.connect() as connection:
+            result = connection.execute(stmt, params)
+            return [dict(zip(result.keys(), row)) for row in result.fetchall()]
+
+    def test_investment_is_counted_once_per_cue_list(self, engine):
+        rows = self._run(engine, client_ids=[1])
+
+        by_key = {(r["campaign_id"], r["format_type_id"]): r for r in rows}
+        assert by_key[(10, 5)]["investment_amount"] == 1000
+        assert by_key[(10, 5)]["investment_gift"] == 100
+        assert by_key[(10, 6)]["investment_amount"] == 400
+        assert (11, 5) in by_key and by_key[(11, 5)]["investment_amount"] == 0
+        assert sum(r["investment_amount"] for r in rows) == 1400
+
+    def test_execution_only_counts_running_or_closed_plaids(self, engine):
+        rows = self._run(engine, client_ids=[1])
+
+        by_key = {(r["campaign_id"], r["format_type_id"]): r for r in rows}
+        assert by_key[(10, 5)]["execution_amount"] == 300
+        assert by_key[(10, 5)]["execution_gift"] == 30
+        assert by_key[(11, 5)]["execution_amount"] == 200
+        assert by_key[(10, 6)]["execution_amount"] == 0
+
+    def test_names_and_filters(self, engine):
+        rows = self._run(engine, client_ids=[1])
+
+        assert {r["client_name"] for r in rows} == {"Brand A"}
+        assert {r["agency_name"] for r in rows} == {"Agency 7"}
+        assert {r["campaign_id"] for r in self._run(engine, client_ids=[2])} == {20}
+        assert {r["agency_name"] for r in self._run(engine, client_ids=[2])} == {"Direct Client"}
+
+    def test_period_filter_uses_plaid_flight_dates(self, engine):
+        rows = self._run(engine, client_ids=[1], start_date="2024-02-01", end_date="2024-02-28")
+
+        # 只有 campaign 11 的 plaid 跨到二月；它成為 CueList 的代表 Campaign
+        assert {r["campaign_id"] for r in rows} == {11}
+        assert sum(r["investment_amount"] for r in rows) == 1400
@@ -0,0 +1,165 @@
+"""
+ClickHouse 成本防線：EXPLAIN ESTIMATE 換算、預算 (每次呼叫讀取環境變數)、拒絕與改讀月彙總
+"""
+from datetime import date
+
+import pytest
+
+from tools import clickhouse_cost as cc
+from tools import performance_rollup as pr
+from tools import performance_tools as pt
+
+
+@pytest.fixture(autouse=True)
+def cost_env(monkeypatch):
+    monkeypatch.setenv("CH_COST_GUARD", "enforce")
+    monkeypatch.setenv("CH_MAX_SCAN_ROWS", "1000")
+    monkeypatch.setenv("CH_MAX_SCAN_BYTES", "100000")
+    monkeypatch.setenv("PERF_ROLLUP_ENABLED", "true")
+    monkeypatch.setattr(pr, "rollup_coverage", lambda: (date(2023, 1, 1), date(2024, 12, 1)))
+    monkeypatch.setattr(cc, "_table_stats", None)
+
+
+def _estimate(rows, bytes_per_row=10.0):
+    return cc.CostEstimate([{"table": "kafka.t", "parts": 1, "marks": 1, "rows": rows, "bytes": rows * bytes_per_row}])
+
+
+class _Result:
+    def __init__(self, column_names, result_rows):
+        self.column_names = column_names
+        self.result_rows = result_rows
+
+
+class _FakeClient:
+    def __init__(self):
+        self.queries = []
+
+    def query(self, sql, **kwargs):
+        self.queries.append(sql)
+        if sql.startswith("EXPLAIN ESTIMATE"):
+            return _Result(["database", "table", "parts", "rows", "marks"], [("kafka", "events", 3, 500, 12)])
+        return _Result(["database", "table", "size"], [("kafka", "events", 40.0)])
+
+
+class TestBudget:
+    def test_budget_is_read_per_call(self, monkeypatch):
+        estimate = _estimate(1500)
+        assert estimate.over_budget()
+
+        monkeypatch.setenv("CH_MAX_SCAN_ROWS", "2000")
+        assert not estimate.over_budget()
+
+        monkeypatch.setenv("CH_MAX_SCAN_BYTES", "100")
+        assert estimate.over_budget()
+
+    def test_scan_limit_settings_follow_the_environment(self, monkeypatch):
+        monkeypatch.setenv("CH_COST_BACKSTOP_FACTOR", "3")
+
+        assert cc.scan_limit_settings() == {
+            "max_rows_to_read": 3000, "max_bytes_to_read": 300000, "read_overflow_mode": "throw",
+        }
+
+        monkeypatch.setenv("CH_COST_GUARD", "warn")
+        assert cc.scan_limit_settings() == {}
+
+    def test_unknown_mode_means_enforce(self, monkeypatch):
+        monkeypatch.setenv("CH_COST_GUARD", "sometimes")
+
+        assert cc.guard_mode() == "enforce"
+
+    def test_estimate_converts_rows_to_bytes(self):
+        client = _FakeClient()
+
+        estimate = cc.estimate_query(client, "SELECT 1")
+        cc.estimate_query(client, "SELECT 2")
+
+        assert estimate.tables == [{"table": "kafka.events", "parts": 3, "marks": 12, "rows": 500, "bytes": 20000.0}]
+        assert (estimate.rows, estimate.bytes) == (500, 20000.0)
+        # system.parts 的列大小有快取
+        assert sum(1 for q in client.queries if "system.parts" in q) == 1
+
+    def test_cost_error_tells_the_agent_how_to_narrow(self):
+        result = cc.cost_error("unified_performance", _estimate(5000), "SELECT 1")
+
+        assert result["status"] == "error"
+        assert result["error_type"] == "cost_limit"
+        assert result["estimated_rows"] == 5000
+        assert "over the budget of 1.0K rows" in result["message"]
+        assert "approximate=True" in result["message"]
+
+
+def _context(**overrides):
+    context = {"dimensions": ["ad_format_type"], "start_date": "2024-01-01", "end_date": "2024-06-30", "limit": 10}
+    context.update(overrides)
+    return context
+
+
+class TestPrepareGuardedQuery:
+    def test_under_budget_runs_as_rendered(self, monkeypatch):
+        monkeypatch.setattr(pt, "_estimate_clickhouse_cost", lambda sql, params: _estimate(10))
+
+        sql, _ = pt._prepare_guarded_query("unified_performance", _context())
+
+        assert "ad_format_events_monthly" not in sql
+
+    def test_over_budget_is_rewritten_to_the_rollup(self, monkeypatch):
+        monkeypatch.setattr(
+            pt, "_estimate_clickhouse_cost",
+            lambda sql, params: _estimate(10 if "ad_format_events_monthly" in sql else 5000),
+        )
+
+        sql, params = pt._prepare_guarded_query("unified_performance", _context())
+
+        assert "FROM kafka.ad_format_events_monthly" in sql
+        assert params["rollup_from"] == "2024-01-01"
+
+    def test_refused_when_the_rollup_is_still_over_budget(self, monkeypatch):
+        monkeypatch.setattr(pt, "_estimate_clickhouse_cost", lambda sql, params: _estimate(5000))
+
+        with pytest.raises(cc.QueryCostExceeded) as excinfo:
+            pt._prepare_guarded_query("unified_performance", _context())
+
+        assert excinfo.value.result["error_type"] == "cost_limit"
+        assert "ad_format_events_monthly" in excinfo.value.result["generated_sql"]
+
+    def test_warn_mode_runs_anyway(self, monkeypatch):
+        monkeypatch.setenv("CH_COST_GUARD", "warn")
+        monkeypatch.setattr(pt, "_estimate_clickhouse_cost", lambda sql, params: _estimate(5000))
+
+        sql, _ = pt._prepare_guarded_query("unified_performance", _context())
+
+        assert sql
+
+    def test_off_mode_skips_the_estimate(self, monkeypatch):
+        monkeypatch.setenv("CH_COST_GUARD", "off")
+        monkeypatch.setattr(pt, "_estimate_clickhouse_cost", lambda sql, params: pytest.fail("estimate should be skipped"))
+
+        pt._prepare_guarded_query("unified_performance", _context())
+
+    def test_templates_without_the_events_source_are_estimated_once(self, monkeypatch):
+        estimated = []
+
+        def _fake_estimate(sql, params):
+            estimated.append(sql)
+            return _estimate(5000)
+
+        monkeypatch.setattr(pt, "_estimate_clickhouse_cost", _fake_estimate)
+
+        with pytest.raises(cc.QueryCostExceeded):
+            pt._prepare_guarded_query("unified_dimensions", _context())
+
+        assert len(estimated) == 1
+
+
+class TestUnifiedDimensionsGuard:
+    def test_over_budget_dimension_query_is_refused(self, monkeypatch):
+        monkeypatch.setattr(pt, "_estimate_clickhouse_cost", lambda sql, params: _estimate(5000))
+        monkeypatch.setattr(pt, "_run_clickhouse_query", lambda *args: pytest.fail("query should not run"))
+
+        result = pt.query_unified_dimensions.invoke({
+            "start_date": "2024-01-01", "end_date": "2024-06-30", "dimensions": ["client_company"],
+        })
+
+        assert result["status"] == "error"
+        assert result["error_type"] == "cost_limit"
+        assert "unified_dimensions" in result["message"]
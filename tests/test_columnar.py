@@ -0,0 +1,93 @@
+"""
+data_store 的 ColumnarDataset：去重合併、handle 交接與輸出
+"""
+import pandas as pd
+
+from tools import columnar
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=["plaid", "clicks"])
+
+
+class TestColumnarDataset:
+    def test_duplicate_rows_are_dropped_on_construction(self):
+        dataset = columnar.ColumnarDataset(_frame([(1, 10), (1, 10), (2, 20)]))
+
+        assert dataset.row_count == 2
+        assert dataset.frame["plaid"].tolist() == [1, 2]
+
+    def test_concat_skips_rows_already_present(self):
+        first = columnar.ColumnarDataset(_frame([(1, 10), (2, 20)]))
+        second = columnar.ColumnarDataset(_frame([(2, 20), (3, 30)]))
+
+        merged = first.concat(second)
+
+        assert merged.frame["plaid"].tolist() == [1, 2, 3]
+        assert len(first) == 2
+
+    def test_concat_with_empty_returns_the_other_side(self):
+        dataset = columnar.ColumnarDataset(_frame([(1, 10)]))
+        empty = columnar.ColumnarDataset()
+
+        assert dataset.concat(empty) is dataset
+        assert empty.concat(dataset) is dataset
+
+    def test_unhashable_values_fall_back_to_strings(self):
+        dataset = columnar.ColumnarDataset(pd.DataFrame({"plaids": [[1, 2], [1, 2], [3]]}))
+
+        assert dataset.row_count == 2
+
+    def test_schema_and_preview(self):
+        dataset = columnar.ColumnarDataset(_frame([(i, i * 10) for i in range(5)]))
+
+        assert dataset.schema == {"plaid": "int64", "clicks": "int64"}
+        assert dataset.preview(limit=2) == [{"plaid": 0, "clicks": 0}, {"plaid": 1, "clicks": 10}]
+
+
+class TestStoreToolResult:
+    def test_dataset_handle_is_claimed_once(self):
+        result = columnar.columnar_result(_frame([(1, 10), (2, 20)]), "SELECT 1")
+        store = {}
+
+        added = columnar.store_tool_result(store, "query_unified_performance", result)
+
+        assert added == 2
+        assert isinstance(store["query_unified_performance"], columnar.ColumnarDataset)
+        assert columnar.claim_dataset(result["dataset_handle"]) is None
+
+    def test_dict_rows_are_merged_without_duplicates(self):
+        store = {"query_execution_budget": [{"plaid": 1, "clicks": 10}]}
+
+        added = columnar.store_tool_result(
+            store, "query_execution_budget", {"data": [{"plaid": 1, "clicks": 10}, {"plaid": 2, "clicks": 20}]}
+        )
+
+        assert added == 1
+        assert len(store["query_execution_budget"]) == 2
+
+    def test_results_without_rows_are_ignored(self):
+        store = {}
+
+        assert columnar.store_tool_result(store, "resolve_entity", {"status": "exact_match", "data": {"id": 1}}) == 0
+        assert store == {}
+
+
+class TestExportDataStore:
+    def test_datasets_are_exported_as_summaries(self):
+        store = {"perf": columnar.ColumnarDataset(_frame([(1, 10)])), "raw": [{"a": 1}]}
+
+        exported = columnar.export_data_store(store)
+
+        assert exported["perf"] == {
+            "columns": ["plaid", "clicks"],
+            "schema": {"plaid": "int64", "clicks": "int64"},
+            "count": 1,
+            "preview": [{"plaid": 1, "clicks": 10}],
+        }
+        assert exported["raw"] == [{"a": 1}]
+
+    def test_as_frame_accepts_legacy_lists(self):
+        frame = columnar.as_frame([{"plaid": 1}])
+
+        assert frame["plaid"].tolist() == [1]
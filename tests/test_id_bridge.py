@@ -0,0 +1,122 @@
+"""
+ID bridge：bridge 模式保留過濾；未啟用時以 id_finder (plaids_only) 在 MySQL 解析成 plaids
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+import config.database
+from services import query_log
+from tools import id_bridge
+from tools.template_registry import render_template
+
+SCHEMA = [
+    "CREATE TABLE cue_lists (id INTEGER, client_id INTEGER, agency_id INTEGER, product_line_id INTEGER)",
+    "CREATE TABLE one_campaigns (id INTEGER, cue_list_id INTEGER, status TEXT)",
+    "CREATE TABLE pre_campaign (id INTEGER, one_campaign_id INTEGER, trash INTEGER, start_date TEXT, end_date TEXT,"
+    " ad_format_type_id INTEGER, category_id INTEGER, sub_category_id INTEGER)",
+]
+ROWS = [
+    "INSERT INTO cue_lists VALUES (100, 1, 7, 1), (200, 2, 7, 1)",
+    "INSERT INTO one_campaigns VALUES (10, 100, 'oncue'), (11, 100, 'deleted'), (20, 200, 'oncue')",
+    "INSERT INTO pre_campaign VALUES"
+    " (1000, 10, 0, '2024/01/01', '2024/01/31', 5, 3, 30),"
+    " (1001, 10, 1, '2024/01/01', '2024/01/31', 5, 3, 30),"
+    " (1002, 11, 0, '2024/01/01', '2024/01/31', 5, 3, 30),"
+    " (1003, 10, 0, '2023/01/01', '2023/01/31', 5, 3, 30),"
+    " (2000, 20, 0, '2024/01/10', '2024/02/10', 6, 4, 40)",
+]
+
+
+class _Database:
+    def __init__(self, engine):
+        self._engine = engine
+
+
+@pytest.fixture
+def mysql(monkeypatch):
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def _functions(dbapi_connection, _):
+        dbapi_connection.create_function(
+            "STR_TO_DATE", 2, lambda value, fmt: datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        )
+
+    with engine.begin() as connection:
+        for statement in SCHEMA + ROWS:
+            connection.execute(text(statement))
+
+    monkeypatch.setenv("CH_ID_BRIDGE", "false")
+    monkeypatch.setenv("QUERY_LOG_ENABLED", "false")
+    monkeypatch.setattr(config.database, "get_mysql_db", lambda: _Database(engine))
+    return engine
+
+
+def _context(**overrides):
+    context = {"start_date": "2024-01-01", "end_date": "2024-01-31", "dimensions": ["ad_format_type"], "limit": 10}
+    context.update(overrides)
+    return context
+
+
+class TestPlaidsOnlyTemplate:
+    def test_selects_only_distinct_plaids_without_paging(self):
+        sql = render_template("id_finder", {"start_date": "2024-01-01", "end_date": "2024-01-31",
+                                            "client_ids": [1], "plaids_only": True})
+
+        assert "SELECT DISTINCT pc.id AS plaid" in sql
+        assert "AS cue_list_id" not in sql
+        assert "LIMIT" not in sql and "ORDER BY" not in sql
+        assert "cl.client_id IN (1)" in sql
+
+    def test_filter_types_are_checked_by_the_registry(self, mysql):
+        with pytest.raises(ValueError, match="client_ids"):
+            id_bridge.apply_entity_filters(_context(client_ids=["1 OR 1=1"]))
+
+
+class TestApplyEntityFilters:
+    def test_without_entity_filters_the_context_is_unchanged(self, mysql):
+        context = _context(plaids=[1])
+
+        assert id_bridge.apply_entity_filters(context) is context
+
+    def test_bridge_mode_keeps_filters_for_clickhouse(self, mysql, monkeypatch):
+        monkeypatch.setenv("CH_ID_BRIDGE", "true")
+
+        routed = id_bridge.apply_entity_filters(_context(client_ids=[1]))
+
+        assert routed["client_ids"] == [1]
+        assert routed["bridge_dictionary"] == "plaid_hierarchy"
+
+    def test_fallback_uses_id_finder_conditions(self, mysql):
+        routed = id_bridge.apply_entity_filters(_context(client_ids=[1]))
+
+        # 1001 已刪除 (trash)、1002 的 Campaign 為 deleted、1003 不在期間內
+        assert routed["plaids"] == [1000]
+        assert "client_ids" not in routed
+
+    def test_fallback_combines_filters_and_intersects_plaids(self, mysql):
+        assert sorted(id_bridge.apply_entity_filters(_context(agency_ids=[7]))["plaids"]) == [1000, 2000]
+        assert id_bridge.apply_entity_filters(_context(agency_ids=[7], industry_ids=[4]))["plaids"] == [2000]
+        assert id_bridge.apply_entity_filters(_context(agency_ids=[7], plaids=[2000, 9]))["plaids"] == [2000]
+
+    def test_no_match_filters_to_plaid_zero(self, mysql):
+        assert id_bridge.apply_entity_filters(_context(sub_industry_ids=[99]))["plaids"] == [0]
+
+    def test_fallback_is_logged_with_the_rendered_sql(self, mysql, monkeypatch):
+        logged = []
+
+        class _Log:
+            def record(self, backend, template, sql, params, rows, duration_ms, error=None):
+                logged.append((template, sql, rows))
+
+        monkeypatch.setenv("QUERY_LOG_ENABLED", "true")
+        monkeypatch.setattr(query_log, "get_query_log", lambda: _Log())
+
+        id_bridge.apply_entity_filters(_context(client_ids=[1]))
+
+        [(template, sql, rows)] = logged
+        assert template == "id_bridge_fallback"
+        assert "SELECT DISTINCT pc.id AS plaid" in sql
+        assert rows == 1
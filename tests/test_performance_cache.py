@@ -0,0 +1,143 @@
+"""
+分區快取：plan_partitions、merge_partials 與缺漏分區的補查
+"""
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from services.result_cache import ResultCache
+from tools import performance_cache as pc
+
+
+def _partial(rows):
+    return pd.DataFrame(rows, columns=["cmpid", "plaid"] + pc.ADDITIVE_METRICS)
+
+
+class TestPlanPartitions:
+    def test_whole_months_become_month_partitions(self):
+        parts = pc.plan_partitions(date(2024, 1, 1), date(2024, 2, 29))
+
+        assert parts == [(date(2024, 1, 1), date(2024, 1, 31)), (date(2024, 2, 1), date(2024, 2, 29))]
+
+    def test_partial_head_and_tail_become_day_partitions(self):
+        parts = pc.plan_partitions(date(2024, 1, 30), date(2024, 3, 2))
+
+        assert parts == [
+            (date(2024, 1, 30), date(2024, 1, 30)),
+            (date(2024, 1, 31), date(2024, 1, 31)),
+            (date(2024, 2, 1), date(2024, 2, 29)),
+            (date(2024, 3, 1), date(2024, 3, 1)),
+            (date(2024, 3, 2), date(2024, 3, 2)),
+        ]
+
+    def test_day_granularity_never_builds_month_partitions(self):
+        parts = pc.plan_partitions(date(2024, 2, 1), date(2024, 2, 29), granularity="day")
+
+        assert len(parts) == 29
+        assert all(start == end for start, end in parts)
+
+    def test_empty_range(self):
+        assert pc.plan_partitions(date(2024, 2, 2), date(2024, 2, 1)) == []
+
+
+class TestMergePartials:
+    def test_ratios_are_recomputed_from_summed_partials(self):
+        jan = _partial([(1, 10, 10, 1000, 100, 5)])
+        feb = _partial([(1, 10, 30, 1000, 300, 15)])
+
+        merged = pc.merge_partials([jan, feb], [], limit=None)
+
+        row = merged.iloc[0]
+        assert row["clicks"] == 40
+        assert row["effective_impressions"] == 2000
+        # (10 + 30) / 2000，而不是兩個分區 CTR (1% / 3%) 的平均
+        assert row["ctr"] == pytest.approx(2.0)
+        assert row["vtr"] == pytest.approx(20.0)
+        assert row["er"] == pytest.approx(1.0)
+
+    def test_zero_impressions_give_zero_ratios(self):
+        merged = pc.merge_partials([_partial([(1, 10, 0, 0, 0, 0)])], [], limit=None)
+
+        assert merged.iloc[0][["ctr", "vtr", "er"]].tolist() == [0, 0, 0]
+
+    def test_sorted_by_clicks_and_limited(self):
+        frame = _partial([(1, 10, 5, 100, 0, 0), (2, 20, 50, 100, 0, 0), (3, 30, 20, 100, 0, 0)])
+
+        merged = pc.merge_partials([frame], [], limit=2)
+
+        assert merged["cmpid"].tolist() == [2, 3]
+
+    def test_duplicate_dimension_columns_are_collapsed(self):
+        frame = pd.concat([pd.DataFrame({"cmpid": [1, 1]}), _partial([(1, 10, 1, 10, 0, 0), (1, 10, 2, 10, 0, 0)])], axis=1)
+
+        merged = pc.merge_partials([frame], ["cmpid"], limit=None)
+
+        assert list(merged.columns[:2]) == ["cmpid", "plaid"]
+        assert merged["clicks"].tolist() == [3]
+
+    def test_no_frames_returns_empty_frame_with_columns(self):
+        merged = pc.merge_partials([None, _partial([])], ["ad_format_type"], limit=10)
+
+        assert merged.empty
+        assert list(merged.columns) == ["ad_format_type", "cmpid", "plaid"] + pc.ADDITIVE_METRICS + ["ctr", "vtr", "er"]
+
+
+class TestPartitionCacheApplicable:
+    def test_disabled_by_default(self, monkeypatch):
+        monkeypatch.delenv("PERF_PARTITION_CACHE", raising=False)
+
+        assert not pc.partition_cache_applicable({"plaids": [1]})
+
+    def test_requires_id_filter(self, monkeypatch):
+        monkeypatch.setenv("PERF_PARTITION_CACHE", "true")
+
+        assert not pc.partition_cache_applicable({"start_date": "2024-01-01"})
+        assert pc.partition_cache_applicable({"cmpids": [7]})
+
+
+class TestQueryPartitioned:
+    @pytest.fixture
+    def cache(self, monkeypatch):
+        cache = ResultCache(max_bytes=10 * 1024 * 1024)
+        monkeypatch.setattr(pc, "get_result_cache", lambda: cache)
+        return cache
+
+    @staticmethod
+    def _fetch_recorder(calls):
+        def _fetch(context):
+            calls.append(context)
+            start, end = date.fromisoformat(context["start_date"]), date.fromisoformat(context["end_date"])
+            keys = [p[0] for p in pc.plan_partitions(start, end)]
+            frame = _partial([(1, 10, 1, 100, 0, 0)] * len(keys))
+            frame["partition_key"] = keys
+            return frame
+        return _fetch
+
+    def test_contiguous_runs(self):
+        jan, feb, mar = (date(2024, 1, 1), date(2024, 1, 31)), (date(2024, 2, 1), date(2024, 2, 29)), (date(2024, 3, 1), date(2024, 3, 31))
+
+        assert pc.contiguous_runs([jan, mar]) == [[jan], [mar]]
+        assert pc.contiguous_runs([jan, feb, mar]) == [[jan, feb, mar]]
+        assert pc.contiguous_runs([]) == []
+
+    def test_cached_middle_partition_is_not_refetched(self, cache):
+        context = {"start_date": "2024-01-01", "end_date": "2024-03-31", "plaids": [10], "dimensions": [], "limit": None}
+        feb = (date(2024, 2, 1), date(2024, 2, 29))
+        cache.set(pc._partition_cache_key(context, feb), _partial([(1, 10, 5, 100, 0, 0)]), ttl=3600)
+        calls = []
+
+        merged, stats = pc.query_partitioned(context, self._fetch_recorder(calls))
+
+        assert [(c["start_date"], c["end_date"]) for c in calls] == [("2024-01-01", "2024-01-31"), ("2024-03-01", "2024-03-31")]
+        assert [c["partition_month_from"] for c in calls] == ["2024-01-01", "2024-03-01"]
+        assert stats == {"partitions": 3, "cached": 1, "fetched": 2, "fetch_queries": 2}
+        assert merged.iloc[0]["clicks"] == 7
+
+    def test_row_limit_applies_across_runs(self, cache, monkeypatch):
+        monkeypatch.setenv("PERF_PARTITION_MAX_ROWS", "1")
+        context = {"start_date": "2024-01-01", "end_date": "2024-03-31", "plaids": [10], "dimensions": [], "limit": None}
+        cache.set(pc._partition_cache_key(context, (date(2024, 2, 1), date(2024, 2, 29))), _partial([]), ttl=3600)
+
+        with pytest.raises(pc.PartitionFetchTooLarge):
+            pc.query_partitioned(context, self._fetch_recorder([]))
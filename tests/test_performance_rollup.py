@@ -0,0 +1,106 @@
+"""
+月彙總改寫：哪些月份改讀 rollup 表，以及改寫後的 SQL 與綁定參數
+"""
+from datetime import date
+
+import pytest
+
+from tools import performance_rollup as pr
+from tools import performance_tools as pt
+
+COVERAGE = (date(2023, 1, 1), date(2024, 12, 1))
+
+
+@pytest.fixture(autouse=True)
+def rollup_env(monkeypatch):
+    monkeypatch.setenv("PERF_ROLLUP_ENABLED", "true")
+    monkeypatch.setenv("PERF_ROLLUP_MIN_MONTHS", "2")
+    monkeypatch.delenv("PERF_ROLLUP_TABLE", raising=False)
+    # 不連 ClickHouse：coverage 固定為 2023-01 ~ 2024-12
+    monkeypatch.setattr(pr, "rollup_coverage", lambda: COVERAGE)
+
+
+def _context(start_date, end_date, **overrides):
+    context = {"dimensions": ["ad_format_type"], "start_date": start_date, "end_date": end_date, "limit": 10}
+    context.update(overrides)
+    return context
+
+
+class TestPlanRollup:
+    def test_only_complete_months_are_read_from_the_rollup(self):
+        plan = pr.plan_rollup(_context("2024-01-15", "2024-05-10"))
+
+        assert plan == {
+            "rollup_table": "kafka.ad_format_events_monthly",
+            "rollup_from": "2024-02-01",
+            "rollup_to": "2024-04-01",
+            "rollup_until": "2024-04-30",
+        }
+
+    def test_months_outside_coverage_stay_daily(self):
+        plan = pr.plan_rollup(_context("2024-10-01", "2025-03-31"))
+
+        assert (plan["rollup_from"], plan["rollup_to"], plan["rollup_until"]) == ("2024-10-01", "2024-12-01", "2024-12-31")
+
+    def test_too_few_complete_months(self):
+        assert pr.plan_rollup(_context("2024-01-01", "2024-02-20")) == {}
+        assert pr.plan_rollup(_context("2024-01-01", "2024-02-20"), min_months=1)["rollup_to"] == "2024-01-01"
+
+    @pytest.mark.parametrize("overrides", [
+        {"dimensions": ["day_local"]},
+        {"sample_rate": 0.1},
+        {"partitioned": True},
+    ])
+    def test_not_applicable(self, overrides):
+        assert pr.plan_rollup(_context("2023-01-01", "2024-06-30", **overrides)) == {}
+
+    def test_monthly_partitions_can_use_the_rollup(self):
+        plan = pr.plan_rollup(_context("2023-01-01", "2024-06-30", partitioned=True, partition_months=["2023-01-01"]))
+
+        assert plan["rollup_from"] == "2023-01-01"
+
+    def test_disabled_or_empty_table(self, monkeypatch):
+        monkeypatch.setattr(pr, "rollup_coverage", lambda: None)
+        assert pr.plan_rollup(_context("2023-01-01", "2024-06-30")) == {}
+
+        monkeypatch.setenv("PERF_ROLLUP_ENABLED", "false")
+        assert pr.plan_rollup(_context("2023-01-01", "2024-06-30"), coverage=COVERAGE) == {}
+
+    def test_invalid_table_name_is_rejected(self, monkeypatch):
+        monkeypatch.setenv("PERF_ROLLUP_TABLE", "kafka.t; DROP TABLE x")
+
+        with pytest.raises(ValueError):
+            pr.rollup_table()
+
+
+class TestWithRollup:
+    def test_context_is_not_mutated(self):
+        context = _context("2023-01-01", "2024-06-30")
+
+        rewritten = pr.with_rollup(context)
+
+        assert "rollup_from" not in context
+        assert rewritten["rollup_to"] == "2024-06-01"
+
+    def test_planning_failure_falls_back_to_daily(self, monkeypatch):
+        monkeypatch.setenv("PERF_ROLLUP_TABLE", "not a table")
+        context = _context("2023-01-01", "2024-06-30")
+
+        assert pr.with_rollup(context) is context
+
+    def test_rewritten_sql_unions_rollup_and_daily_view(self):
+        context = pr.with_rollup(_context("2024-01-15", "2024-05-10"))
+
+        sql, params = pt._prepare_clickhouse_query("unified_performance", context)
+
+        assert "FROM kafka.ad_format_events_monthly" in sql
+        assert "UNION ALL" in sql
+        assert "NOT (day_local >= {rollup_from:Date} AND day_local <= {rollup_until:Date})" in sql
+        assert params["rollup_from"] == "2024-02-01"
+        assert params["rollup_until"] == "2024-04-30"
+
+    def test_short_range_keeps_the_daily_view(self):
+        sql, params = pt._prepare_clickhouse_query("unified_performance", pr.with_rollup(_context("2024-01-01", "2024-01-31")))
+
+        assert "ad_format_events_monthly" not in sql
+        assert "rollup_from" not in params
@@ -0,0 +1,89 @@
+"""
+ClickHouse 成效查詢：server-side 參數綁定與大型 ID 清單的 external data table
+"""
+from tools import performance_tools as pt
+
+
+def _context(**overrides):
+    context = {"dimensions": ["ad_format_type"], "start_date": "2024-01-01", "end_date": "2024-01-31", "limit": 10}
+    context.update(overrides)
+    return context
+
+
+class TestPrepareClickhouseQuery:
+    def test_only_referenced_params_are_bound(self):
+        sql, params = pt._prepare_clickhouse_query("unified_performance", _context(plaids=[1, 2, 3]))
+
+        assert params == {"start_date": "2024-01-01", "end_date": "2024-01-31", "plaids": [1, 2, 3]}
+        assert "plaid IN {plaids:Array(UInt64)}" in sql
+
+    def test_ids_are_not_inlined(self):
+        sql, _ = pt._prepare_clickhouse_query("unified_performance", _context(plaids=[987654321]))
+
+        assert "987654321" not in sql
+
+    def test_sql_text_does_not_depend_on_list_size(self):
+        small, _ = pt._prepare_clickhouse_query("unified_performance", _context(plaids=[1]))
+        large, _ = pt._prepare_clickhouse_query("unified_performance", _context(plaids=list(range(5000))))
+
+        assert small == large
+
+    def test_tuples_become_lists_and_none_is_skipped(self):
+        _, params = pt._prepare_clickhouse_query("unified_performance", _context(plaids=(4, 5), cmpids=None))
+
+        assert params["plaids"] == [4, 5]
+        assert "cmpids" not in params
+
+    def test_string_filters_are_bound(self):
+        sql, params = pt._prepare_clickhouse_query("unified_performance", _context(one_categories=["汽車'"]))
+
+        assert params["one_categories"] == ["汽車'"]
+        assert "汽車" not in sql
+
+
+class TestExternalizeLargeLists:
+    SQL = "SELECT 1 WHERE plaid IN {plaids:Array(UInt64)} AND cmpid IN {cmpids:Array(UInt64)} AND day >= {start_date:Date}"
+
+    def test_small_lists_stay_bound_parameters(self):
+        params = {"plaids": [1, 2], "cmpids": [3], "start_date": "2024-01-01"}
+
+        sql, rewritten, external = pt._externalize_large_lists(self.SQL, params, threshold=2)
+
+        assert sql == self.SQL
+        assert rewritten == params
+        assert external is None
+
+    def test_large_list_becomes_external_table(self):
+        params = {"plaids": [1, 2, 3], "cmpids": [9], "start_date": "2024-01-01"}
+
+        sql, rewritten, external = pt._externalize_large_lists(self.SQL, params, threshold=2)
+
+        assert "plaid IN external_plaids" in sql
+        assert "cmpid IN {cmpids:Array(UInt64)}" in sql
+        assert rewritten == {"cmpids": [9], "start_date": "2024-01-01"}
+        assert [f.name for f in external.files] == ["external_plaids"]
+        assert external.files[0].data == b"1\n2\n3\n"
+        assert external.query_params["external_plaids_structure"] == "id UInt64"
+
+    def test_several_large_lists_share_one_external_data(self):
+        params = {"plaids": [1, 2, 3], "cmpids": [4, 5, 6]}
+
+        sql, rewritten, external = pt._externalize_large_lists(self.SQL, params, threshold=2)
+
+        assert "IN external_plaids" in sql and "IN external_cmpids" in sql
+        assert rewritten == {}
+        assert [f.name for f in external.files] == ["external_plaids", "external_cmpids"]
+
+    def test_input_parameters_are_not_mutated(self):
+        params = {"plaids": [1, 2, 3]}
+
+        pt._externalize_large_lists(self.SQL, params, threshold=2)
+
+        assert params == {"plaids": [1, 2, 3]}
+
+    def test_string_values_are_tsv_escaped(self):
+        sql = "SELECT 1 WHERE c IN {cats:Array(String)}"
+
+        _, _, external = pt._externalize_large_lists(sql, {"cats": ["a\tb", "c\\d"]}, threshold=1)
+
+        assert external.files[0].data == b"a\\tb\nc\\\\d\n"
@@ -0,0 +1,135 @@
+"""
+Query log：SQL 形狀正規化、SQLite 紀錄與 scripts/query_report.py 的彙總
+"""
+import json
+import time
+
+import pytest
+
+from scripts import query_report
+from services import query_log as ql
+
+
+class TestNormalizeSql:
+    def test_constants_and_in_lists_collapse_to_one_shape(self):
+        first = "SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'a' -- note\n AND day >= '2024-01-01'"
+        second = "select *  from t where id in (7) and name = 'b''c' and day >= '2025-12-31'"
+
+        assert ql.normalize_sql(first) == ql.normalize_sql(second)
+        assert ql.normalize_sql(first) == "select * from t where id in (?+) and name = ? and day >= ?"
+
+    def test_bound_parameters_become_placeholders(self):
+        clickhouse = "SELECT 1 WHERE plaid IN {plaids:Array(UInt64)}"
+        mysql = "SELECT 1 WHERE plaid IN :plaids AND ts::date = :day"
+
+        assert ql.normalize_sql(clickhouse) == "select ? where plaid in ?"
+        assert ql.normalize_sql(mysql) == "select ? where plaid in ? and ts::date = ?"
+
+    def test_different_branches_give_different_fingerprints(self):
+        assert ql.sql_fingerprint("SELECT a FROM t WHERE x = 1") == ql.sql_fingerprint("SELECT a FROM t WHERE x = 2")
+        assert ql.sql_fingerprint("SELECT a FROM t") != ql.sql_fingerprint("SELECT b FROM t")
+
+    def test_param_cardinalities(self):
+        params = {"plaids": [1, 2, 3], "start_date": "2024-01-01", "client_ids": None, "tags": ()}
+
+        assert ql.param_cardinalities(params) == {"plaids": 3, "start_date": 1, "tags": 0}
+
+
+@pytest.fixture
+def query_log(tmp_path, monkeypatch):
+    log = ql.QueryLog(str(tmp_path / "query_log.sqlite"), retention_days=0)
+    monkeypatch.setattr(ql, "_query_log", log)
+    monkeypatch.setenv("QUERY_LOG_ENABLED", "true")
+    return log
+
+
+class TestLogQuery:
+    def test_success_is_recorded_with_rows(self, query_log):
+        with ql.log_query("mysql", "templates/id_finder.sql", {"plaids": [1, 2]}, "SELECT 1 WHERE id IN (1, 2)") as execution:
+            execution.rows = 2
+        query_log.flush()
+
+        [entry] = query_report.load_entries(query_log.path, since=0)
+
+        assert entry["template"] == "id_finder"
+        assert entry["backend"] == "mysql"
+        assert entry["rows"] == 2
+        assert entry["error"] is None
+        assert json.loads(entry["param_cardinalities"]) == {"plaids": 2}
+        assert entry["fingerprint"] == ql.sql_fingerprint("SELECT 1 WHERE id IN (1, 2)")
+
+    def test_error_is_recorded_and_reraised(self, query_log):
+        with pytest.raises(RuntimeError):
+            with ql.log_query("clickhouse", "unified_performance", sql="SELECT 1"):
+                raise RuntimeError("timeout")
+        query_log.flush()
+
+        [entry] = query_report.load_entries(query_log.path, since=0)
+
+        assert entry["error"] == "RuntimeError: timeout"
+        assert entry["rows"] is None
+
+    def test_disabled_log_records_nothing(self, monkeypatch):
+        monkeypatch.setenv("QUERY_LOG_ENABLED", "false")
+        monkeypatch.setattr(ql, "get_query_log", lambda: pytest.fail("query log should not be opened"))
+
+        with ql.log_query("mysql", "id_finder", sql="SELECT 1") as execution:
+            execution.rows = 1
+
+    def test_load_entries_filters(self, query_log):
+        query_log.record("mysql", "id_finder", "SELECT 1", None, 1, 5.0)
+        query_log.record("clickhouse", "unified_performance", "SELECT 2", None, 1, 5.0)
+        query_log.flush()
+
+        assert [e["template"] for e in query_report.load_entries(query_log.path, 0, backend="clickhouse")] == \
+            ["unified_performance"]
+        assert query_report.load_entries(query_log.path, time.time() + 60) == []
+
+
+def _entry(template, duration_ms, fingerprint="f1", rows=10, error=None, cardinalities=None, backend="mysql"):
+    return {
+        "template": template, "backend": backend, "fingerprint": fingerprint, "sql_shape": "select ?",
+        "param_cardinalities": json.dumps(cardinalities or {}), "rows": rows, "duration_ms": duration_ms, "error": error,
+    }
+
+
+class TestReport:
+    def test_percentile_interpolates(self):
+        assert query_report.percentile([], 50) == 0.0
+        assert query_report.percentile([10.0], 95) == 10.0
+        assert query_report.percentile([0.0, 10.0, 20.0, 30.0, 40.0], 50) == 20.0
+        assert query_report.percentile([0.0, 10.0, 20.0, 30.0, 40.0], 95) == pytest.approx(38.0)
+
+    def test_template_report_is_sorted_by_p95(self):
+        entries = [
+            _entry("id_finder", 10.0), _entry("id_finder", 30.0, rows=None, error="boom"),
+            _entry("campaign_basic", 100.0, fingerprint="f2"),
+        ]
+
+        report = query_report.template_report(entries)
+
+        assert [r["template"] for r in report] == ["campaign_basic", "id_finder"]
+        assert report[1]["count"] == 2
+        assert report[1]["errors"] == 1
+        assert report[1]["p50_ms"] == 20.0
+        assert report[1]["avg_rows"] == 10.0
+
+    def test_fingerprint_report_keeps_max_cardinality_and_top(self):
+        entries = [
+            _entry("id_finder", 10.0, cardinalities={"plaids": 3}),
+            _entry("id_finder", 20.0, cardinalities={"plaids": 800, "client_ids": 1}),
+            _entry("campaign_basic", 50.0, fingerprint="f2"),
+            _entry("budget_summary", 5.0, fingerprint="f3"),
+        ]
+
+        report = query_report.fingerprint_report(entries, top=2, min_count=1)
+
+        assert [r["fingerprint"] for r in report] == ["f2", "f1"]
+        assert report[1]["max_param_cardinality"] == {"plaids": 800, "client_ids": 1}
+
+    def test_fingerprint_report_min_count(self):
+        entries = [_entry("id_finder", 10.0), _entry("id_finder", 20.0), _entry("campaign_basic", 50.0, fingerprint="f2")]
+
+        report = query_report.fingerprint_report(entries, top=10, min_count=2)
+
+        assert [r["fingerprint"] for r in report] == ["f1"]
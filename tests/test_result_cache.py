@@ -0,0 +1,84 @@
+"""
+MySQL 模板結果快取：key 正規化與 LRU / TTL
+"""
+from datetime import date, datetime
+
+from services import result_cache as rc
+
+
+class TestCanonicalKey:
+    def test_id_lists_are_sorted_and_deduplicated(self):
+        assert rc.canonical_key("campaign_basic", {"campaign_ids": [3, 1, 1]}) == \
+            rc.canonical_key("campaign_basic", {"campaign_ids": [1, 3]})
+
+    def test_dates_are_normalised(self):
+        keys = {
+            rc.canonical_key("id_finder", {"start_date": value})
+            for value in ["2025/1/5", "2025-01-05", " 2025-1-05 ", date(2025, 1, 5), datetime(2025, 1, 5, 13, 30)]
+        }
+
+        assert len(keys) == 1
+
+    def test_none_and_empty_lists_are_ignored(self):
+        assert rc.canonical_key("id_finder", {"start_date": "2025-01-01", "client_ids": None, "agency_ids": []}) == \
+            rc.canonical_key("id_finder", {"start_date": "2025-01-01"})
+
+    def test_file_name_and_index_name_share_a_key(self):
+        assert rc.canonical_key("id_finder.sql", {"a": 1}) == rc.canonical_key("id_finder", {"a": 1})
+
+    def test_different_values_give_different_keys(self):
+        assert rc.canonical_key("campaign_basic", {"campaign_ids": [1]}) != \
+            rc.canonical_key("campaign_basic", {"campaign_ids": [2]})
+
+
+class TestResultCache:
+    def test_hit_and_miss_are_counted_per_template(self):
+        cache = rc.ResultCache(max_bytes=1000)
+        cache.set("id_finder:{}", {"rows": 1}, ttl=60)
+
+        assert cache.get("id_finder:{}") == {"rows": 1}
+        assert cache.get("id_finder:{\"x\": 1}") is None
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+        assert stats["templates"]["id_finder"] == {"hits": 1, "misses": 1}
+
+    def test_least_recently_used_entry_is_evicted(self):
+        # 每筆約 10 bytes (JSON 字串)，容量只放得下兩筆
+        cache = rc.ResultCache(max_bytes=25)
+        cache.set("t:a", "x" * 8, ttl=60)
+        cache.set("t:b", "y" * 8, ttl=60)
+        cache.get("t:a")
+        cache.set("t:c", "z" * 8, ttl=60)
+
+        assert cache.get("t:b") is None
+        assert cache.get("t:a") == "x" * 8
+        assert cache.get("t:c") == "z" * 8
+        assert cache.stats()["evictions"] == 1
+
+    def test_expired_entries_are_dropped(self, monkeypatch):
+        now = [100.0]
+        monkeypatch.setattr(rc.time, "monotonic", lambda: now[0])
+        cache = rc.ResultCache(max_bytes=1000)
+        cache.set("t:a", [1, 2], ttl=10)
+
+        now[0] = 110.0
+
+        assert cache.get("t:a") is None
+        assert cache.stats()["expirations"] == 1
+        assert cache.stats()["bytes"] == 0
+
+    def test_oversized_result_is_rejected(self):
+        cache = rc.ResultCache(max_bytes=5)
+        cache.set("t:a", "x" * 100, ttl=60)
+
+        assert cache.get("t:a") is None
+        assert cache.stats()["rejected"] == 1
+
+    def test_overwrite_replaces_size(self):
+        cache = rc.ResultCache(max_bytes=1000)
+        cache.set("t:a", "x" * 50, ttl=60)
+        cache.set("t:a", "x", ttl=60)
+
+        assert cache.stats()["bytes"] == rc._estimate_bytes("x")
+        assert cache.stats()["entries"] == 1
@@ -0,0 +1,84 @@
+"""
+SQL 模板 registry：型別檢查與 render_<name> 的參數綁定
+"""
+import inspect
+from typing import List, Optional
+
+import pytest
+
+from tools import template_registry
+from tools.template_registry import get_registry, render_template
+
+
+class TestHeaderParamTypes:
+    def test_parses_types_and_slash_separated_names(self):
+        source = """{#
+  Parameters:
+    - plaids: List[int] (required)
+    - client_ids / agency_ids: List[int] (optional)
+    - start_date: str (required)
+    - partition_months / partition_month_from (internal)
+#}
+SELECT 1"""
+
+        types = template_registry._header_param_types(source)
+
+        assert types == {"plaids": "List[int]", "client_ids": "List[int]", "agency_ids": "List[int]", "start_date": "str"}
+
+    def test_no_header(self):
+        assert template_registry._header_param_types("SELECT 1") == {}
+
+
+class TestCheckTypes:
+    def test_rejects_wrong_list_element_type(self):
+        spec = get_registry().get("id_finder")
+
+        with pytest.raises(ValueError, match="client_ids should be List\\[int\\]"):
+            spec.check_types({"start_date": "2024-01-01", "client_ids": ["1"]})
+
+    def test_bool_is_not_an_int(self):
+        spec = get_registry().get("id_finder")
+
+        with pytest.raises(ValueError, match="page_size"):
+            spec.check_types({"page_size": True})
+
+    def test_none_and_undeclared_params_are_skipped(self):
+        spec = get_registry().get("id_finder")
+
+        spec.check_types({"client_ids": None, "after_plaid": "anything", "start_date": "2024-01-01"})
+
+    def test_render_checks_required_params_before_types(self):
+        with pytest.raises(ValueError, match="missing required params: \\['end_date'\\]"):
+            render_template("id_finder", {"start_date": "2024-01-01", "client_ids": ["x"]})
+
+
+class TestRenderer:
+    def test_signature_comes_from_index_and_header(self):
+        signature = inspect.signature(template_registry.render_id_finder)
+
+        assert list(signature.parameters)[:3] == ["start_date", "end_date", "client_ids"]
+        assert signature.parameters["start_date"].default is inspect.Parameter.empty
+        assert signature.parameters["client_ids"].annotation == Optional[List[int]]
+        assert signature.parameters["internal"].kind is inspect.Parameter.VAR_KEYWORD
+
+    def test_missing_required_param_fails_at_bind(self):
+        with pytest.raises(TypeError):
+            template_registry.render_id_finder(start_date="2024-01-01")
+
+    def test_internal_params_reach_the_template(self):
+        sql = template_registry.render_id_finder(
+            start_date="2024-01-01", end_date="2024-01-31", client_ids=[7], page_size=50
+        )
+
+        assert "cl.client_id IN (7)" in sql
+        assert "LIMIT 50" in sql
+
+    def test_renderer_is_named_after_the_template(self):
+        assert template_registry.render_campaign_basic.__name__ == "render_campaign_basic"
+
+    def test_unknown_template_is_an_attribute_error(self):
+        with pytest.raises(AttributeError):
+            template_registry.render_no_such_template
+
+    def test_file_name_lookup(self):
+        assert get_registry().get("id_finder.sql") is get_registry().get("id_finder")
@@ -0,0 +1,196 @@
+"""
+Approximate Mode (ClickHouse SAMPLE)
+
+「所有格式的 CTR 大概排名」這類全站問題，精確查詢要彙總每一列事件資料。
+近似模式 (approximate=True) 改讀抽樣表 (templates/ddl/clickhouse/ad_format_events_sampled.sql，SAMPLE BY
+cityHash64(plaid, day_local))，只讀取 sample_rate 比例的 (版位 × 日) 資料：
+- 加總欄位 (點擊 / 曝光 / Q100 / 互動) 依 _sample_factor 放大回全體估計值
+- CTR / VTR / ER 為比率估計 (ratio estimator)，以線性化變異數計算 95% 信賴區間 (<rate>_ci_low / <rate>_ci_high)；
+  抽樣單位是 (版位 × 日) 群集，模板先在內層依 維度 × plaid × day_local 彙總 (_sample_units.sql) 再計算動差
+- 結果帶有 sample_rate 欄位，Reporter 據此標示數字為估計值
+以 plaids / cmpids 過濾的查詢本身已經很小，維持精確查詢；抽樣表未涵蓋 end_date 時同樣改回精確查詢。
+抽樣表晚於 start_date 才開始、或在容許的延遲內 (CH_SAMPLE_MAX_LAG_DAYS) 尚未回填到 end_date 時，查詢區間縮短為抽樣表涵蓋的部分，
+approximate 標記與 sample_start_date / sample_end_date 欄位會註明實際範圍。
+抽樣表由 scripts/backfill_rollup.py --target sampled 建立與回填。
+"""
+import math
+import os
+import re
+from datetime import date, timedelta
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from tools.performance_cache import _parse_date
+from tools.performance_rollup import table_coverage
+
+_TABLE_RE = re.compile(r"^[A-Za-z_]\w*(\.[A-Za-z_]\w*)?$")
+
+# 95% 信賴區間
+CONFIDENCE = 0.95
+_Z = 1.96
+
+# 每個模板的 (點擊, 曝光, Q100, 互動) 欄位
+_TOTAL_COLUMNS = {
+    "unified_performance": ("clicks", "effective_impressions", "total_q100_views", "total_engagements"),
+    "format_benchmark": ("total_clicks", "total_impressions", "total_q100", "total_engagements"),
+}
+
+# rate -> (分子平方和, 分子 × 分母) 動差欄位 (見 _sample_moments.sql)
+_RATE_MOMENTS = {
+    "ctr": ("sample_click_sq", "sample_click_imp"),
+    "vtr": ("sample_q100_sq", "sample_q100_imp"),
+    "er": ("sample_eng_sq", "sample_eng_imp"),
+}
+
+_MOMENT_COLUMNS = [
+    "sample_rows", "sample_factor", "sample_imp_sq",
+    "sample_click_sq", "sample_click_imp", "sample_q100_sq", "sample_q100_imp", "sample_eng_sq", "sample_eng_imp",
+]
+
+# 有這些過濾時不抽樣 (ID 導向的查詢本身很小，且需要精確值)
+_EXACT_FILTERS = ("plaids", "cmpids", "cmp_ids")
+
+
+def sample_table() -> str:
+    table = os.getenv('CH_SAMPLE_TABLE', 'kafka.ad_format_events_sampled')
+    if not _TABLE_RE.match(table):
+        raise ValueError(f"Error: Invalid CH_SAMPLE_TABLE {table!r}")
+    return table
+
+
+def resolve_sample_rate(sample_rate: Optional[float] = None) -> float:
+    """
+    抽樣比例 (未指定時為 CH_SAMPLE_RATE，預設 0.1)，必須介於 0 (不含) 與 1 之間。
+    """
+    rate = float(sample_rate if sample_rate is not None else os.getenv('CH_SAMPLE_RATE', 0.1))
+    if not 0 < rate <= 1:
+        raise ValueError(f"Error: sample_rate must be in (0, 1], got {rate}")
+    return rate
+
+
+def plan_sample(context: Dict[str, Any], sample_rate: Optional[float] = None) -> Dict[str, Any]:
+    """
+    回傳要併入模板 context 的抽樣參數 (sample_table / sample_rate)；不適用時回傳空 dict。
+    抽樣表的最後一天需涵蓋 end_date (最多落後 CH_SAMPLE_MAX_LAG_DAYS 天，預設 2)；
+    抽樣表晚於 start_date 才開始時，回傳的 start_date 縮短為抽樣表的第一天，
+    尚未回填到 end_date 時，回傳的 end_date 縮短為抽樣表的最後一天。
+    """
+    rate = resolve_sample_rate(sample_rate)
+    exact_filters = [k for k in _EXACT_FILTERS if context.get(k)]
+    if exact_filters:
+        print(f"🎯 Approximate mode skipped: {', '.join(exact_filters)} filter is already selective")
+        return {}
+
+    table = sample_table()
+    coverage = table_coverage(table, "day_local")
+    if coverage is None:
+        print(f"⚠️ Approximate mode skipped: sampled table {table} is missing or empty")
+        return {}
+    start, end = _parse_date(context["start_date"]), _parse_date(context["end_date"])
+    lag_days = int(os.getenv('CH_SAMPLE_MAX_LAG_DAYS', 2))
+    required_until = min(end, date.today() - timedelta(days=lag_days))
+    if coverage[1] < required_until:
+        print(f"⚠️ Approximate mode skipped: {table} only reaches {coverage[1]}, query ends {context['end_date']}")
+        return {}
+    if coverage[0] > end:
+        print(f"⚠️ Approximate mode skipped: {table} starts at {coverage[0]}, query ends {context['end_date']}")
+        return {}
+    if coverage[1] < start:
+        print(f"⚠️ Approximate mode skipped: {table} only reaches {coverage[1]}, query starts {context['start_date']}")
+        return {}
+
+    plan = {"sample_table": table, "sample_rate": rate}
+    if coverage[0] > start:
+        plan["start_date"] = coverage[0].isoformat()
+    if coverage[1] < end:
+        plan["end_date"] = coverage[1].isoformat()
+    if "start_date" in plan or "end_date" in plan:
+        print(f"⚠️ {table} covers {coverage[0]} ~ {coverage[1]}; approximate result covers "
+              f"{plan.get('start_date', context['start_date'])} ~ {plan.get('end_date', context['end_date'])} only")
+    return plan
+
+
+def add_confidence_intervals(df: pd.DataFrame, template_name: str, sample_start_date: Optional[str] = None,
+                             sample_end_date: Optional[str] = None) -> pd.DataFrame:
+    """
+    將抽樣查詢的結果轉成估計值：
+    - 每個 rate 加上 <rate>_ci_low / <rate>_ci_high (百分比，95% 信賴區間，下限不小於 0)
+    - 加總欄位乘上 sample_factor，放大回全體估計值
+    - 加上 sample_rate 欄位 (實際抽樣比例)，移除動差欄位
+    - 查詢區間因抽樣表涵蓋範圍而縮短時，加上 sample_start_date / sample_end_date 欄位 (估計值的實際起始日 / 結束日)
+    比率估計 R = Σy / Σx 的標準誤 (抽樣單位為 維度 × plaid × day_local，n 個單位，抽樣比例 f)：
+        s² = (Σy² - 2RΣxy + R²Σx²) / (n - 1)
+        SE(R) = sqrt((1 - f) · n · s²) / Σx
+    """
+    if df.empty or "sample_factor" not in df.columns:
+        return df
+
+    df = df.copy()
+    clicks, impressions, q100, engagements = _TOTAL_COLUMNS[template_name]
+    n = df["sample_rows"].astype(float)
+    factor = df["sample_factor"].astype(float).where(lambda s: s > 0, 1.0)
+    fpc = (1 - 1 / factor).clip(lower=0)
+    x = df[impressions].astype(float)
+    x_sq = df["sample_imp_sq"].astype(float)
+
+    for rate, (y_sq_col, xy_col) in _RATE_MOMENTS.items():
+        if rate not in df.columns:
+            continue
+        ratio = df[rate].astype(float) / 100
+        variance = (df[y_sq_col].astype(float) - 2 * ratio * df[xy_col].astype(float) + ratio ** 2 * x_sq)
+        variance = (variance.clip(lower=0) / (n - 1)).where(n > 1)
+        se = ((fpc * n * variance) ** 0.5 / x).where(x > 0)
+        half_width = _Z * se * 100
+        df[f"{rate}_ci_low"] = (df[rate] - half_width).clip(lower=0).round(4)
+        df[f"{rate}_ci_high"] = (df[rate] + half_width).round(4)
+
+    for col in (clicks, impressions, q100, engagements):
+        if col in df.columns:
+            df[col] = (df[col].astype(float) * factor).round().astype("int64")
+
+    df["sample_rate"] = (1 / factor).round(6)
+    if sample_start_date:
+        df["sample_start_date"] = sample_start_date
+    if sample_end_date:
+        df["sample_end_date"] = sample_end_date
+    return df.drop(columns=[c for c in _MOMENT_COLUMNS if c in df.columns])
+
+
+def approximate_info(plan: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    工具回傳中的 approximate 標記；effective_range 為估計值實際涵蓋的日期區間。
+    """
+    effective_start = plan.get("start_date", context["start_date"])
+    effective_end = plan.get("end_date", context["end_date"])
+    note = (
+        f"Estimated from a {plan['sample_rate']:.0%} sample: totals are scaled up, "
+        "ctr / vtr / er come with <rate>_ci_low / <rate>_ci_high (95% confidence interval)."
+    )
+    if "start_date" in plan or "end_date" in plan:
+        note += (
+            f" The sampled table only covers {effective_start} ~ {effective_end}, so the estimate covers "
+            f"{effective_start} ~ {effective_end} instead of {context['start_date']} ~ {context['end_date']}."
+        )
+    return {
+        "sample_rate": plan["sample_rate"],
+        "sample_table": plan["sample_table"],
+        "confidence": CONFIDENCE,
+        "effective_range": [str(effective_start), str(effective_end)],
+        "note": note,
+    }
+
+
+def typical_half_width(df: pd.DataFrame, rate: str = "ctr") -> Optional[float]:
+    """
+    信賴區間的典型半寬 (中位數，百分點)；沒有區間欄位時為 None。
+    """
+    high = f"{rate}_ci_high"
+    if rate not in df.columns or high not in df.columns:
+        return None
+    # 下限可能被截在 0，以上限計算半寬
+    widths = (df[high] - df[rate]).dropna()
+    if widths.empty:
+        return None
+    value = float(widths.median())
+    return None if math.isnan(value) else value
@@ -1,32 +1,45 @@
-from typing import List, Dict, Any, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import pandas as pd
 from langchain_core.tools import tool
 from sqlalchemy import text, bindparam
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import functools
 import os
-from config.database import get_mysql_db
+from config.database import get_mysql_db, get_mysql_db_async
+from config.query_control import (
+    query_timeout, query_error, track_query, prepare_mysql_session, prepare_mysql_session_async
+)
 
-# 設定 Jinja2 環境
-TEMPLATE_DIR = os.path.join(os.getcwd(), "templates", "sql")
-env = Environment(
-    loader=FileSystemLoader(TEMPLATE_DIR),
-    autoescape=select_autoescape(['sql'])
+from services.query_log import log_query
+from services.result_cache import cache_enabled, canonical_key, get_result_cache
+from tools.columnar import columnar_enabled, columnar_result
+from tools.mysql_stream import (
+    BatchCollector, iter_row_batches, iter_row_batches_async, collect_batches, collect_batches_async
 )
+from tools.template_registry import get_registry, render_template
 
-def _render_and_execute_mysql(template_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+# 啟動時即載入並預先編譯所有模板 (索引錯誤在 import 時就會發現)
+get_registry()
+
+# 分塊查詢的併發數 (每個 chunk 各佔一條連線，需小於 MYSQL_POOL_SIZE) 與合併後的總列數上限
+CHUNK_CONCURRENCY = int(os.getenv('MYSQL_CHUNK_CONCURRENCY', 4))
+MAX_RESULT_ROWS = int(os.getenv('MYSQL_MAX_RESULT_ROWS', 50000))
+# keyset 模板 (id_finder) 回傳中每個 ID 欄位最多列出幾個相異 ID；完整結果只經由 dataset_handle 交給 data_store
+KEYSET_INLINE_IDS = int(os.getenv('KEYSET_INLINE_IDS', 5000))
+
+def _prepare_mysql_statement(template_name: str, context: Dict[str, Any], sql_prefix: str = ""):
     """
-    內部共用函數：渲染並執行 MySQL 模板
+    渲染模板並準備綁定參數 (sync / async 共用)
+    sql_prefix 會加在渲染結果之前 (例如 "EXPLAIN FORMAT=JSON ")。
+    回傳 (stmt, db_params, rendered_sql)；模板錯誤時直接拋出例外。
     """
-    db = get_mysql_db()
-    
-    # 1. 載入與渲染
-    try:
-        template = env.get_template(template_name)
-        rendered_sql = template.render(**context)
-    except Exception as e:
-        return {"status": "error", "message": f"Template Error: {e}"}
+    # 1. 渲染 (預先編譯的模板，並檢查 required_params)
+    rendered_sql = render_template(template_name, context)
 
     # 2. 準備參數 (處理 List -> Tuple 展開)
-    stmt = text(rendered_sql)
+    stmt = text(sql_prefix + rendered_sql)
     db_params = {}
     
     for k, v in context.items():
@@ -38,27 +51,428 @@ def _render_and_execute_mysql(template_name: str, context: Dict[str, Any]) -> Di
             else:
                 db_params[k] = v
 
-    # 3. 執行
+    return stmt, db_params, rendered_sql
+
+def _chunk_contexts(template_name: str, context: Dict[str, Any]):
+    """
+    依 template_index.yaml 的 chunk_param / chunk_size 將大型 ID 清單拆成多個 context。
+    每個 chunk 以 LIMIT row_limit + 1 查詢：多出的一列只用來判斷是否真的被截斷 (見 _merge_chunk_results)。
+    回傳 (contexts, row_limit)。
+    """
+    spec = get_registry().get(template_name)
+    row_limit = context.get("row_limit") or spec.row_limit
+    base = dict(context, row_limit=row_limit + 1) if row_limit else dict(context)
+
+    values = context.get(spec.chunk_param) if spec.chunk_param else None
+    if not values or not spec.chunk_size or len(values) <= spec.chunk_size:
+        return [base], row_limit
+
+    # 先去重再分塊，避免同一個 ID 出現在兩個 chunk
+    values = list(dict.fromkeys(values))
+    contexts = [
+        dict(base, **{spec.chunk_param: values[i:i + spec.chunk_size]})
+        for i in range(0, len(values), spec.chunk_size)
+    ]
+    return contexts, row_limit
+
+def _merge_chunk_rows(chunks: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    # 只去除「跨 chunk」的重複列；同一個 chunk 內的列保持原樣 (例如金額相同的兩筆預算)
+    seen = set()
+    rows = []
+    for chunk in chunks:
+        keys = []
+        for row in chunk:
+            key = tuple(row.values())
+            keys.append(key)
+            if key not in seen:
+                rows.append(row)
+        seen.update(keys)
+    return rows
+
+def _merge_chunk_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    _merge_chunk_rows 的 columnar 版本：以列雜湊去除跨 chunk 的重複列。
+    """
+    if len(frames) == 1:
+        return frames[0]
+    seen = set()
+    kept = []
+    for frame in frames:
+        try:
+            hashes = pd.util.hash_pandas_object(frame, index=False)
+        except TypeError:
+            # 欄位含不可雜湊的值 (list/dict) 時，以字串形式比對
+            hashes = pd.util.hash_pandas_object(frame.astype(str), index=False)
+        kept.append(frame[~hashes.isin(seen).to_numpy()])
+        seen.update(hashes.tolist())
+    return pd.concat(kept, ignore_index=True)
+
+def _merge_chunk_results(results: List[Dict[str, Any]], row_limit: Optional[int]) -> Dict[str, Any]:
+    """
+    合併各 chunk 的結果並去重。各 chunk 以 LIMIT row_limit + 1 查詢，
+    只有回傳超過 row_limit 列 (確實還有資料) 時才標記 truncated，並丟棄多出的那一列；
+    合併後超過 MAX_RESULT_ROWS 時同樣標記 truncated。
+    """
+    for result in results:
+        if result.get("status") != "success":
+            return result
+
+    data_key = "frame" if "frame" in results[0] else "data"
+    chunks = [result[data_key] for result in results]
+    truncated = False
+    if row_limit:
+        truncated = any(len(chunk) > row_limit for chunk in chunks)
+        chunks = [chunk[:row_limit] for chunk in chunks]
+    rows = _merge_chunk_frames(chunks) if data_key == "frame" else _merge_chunk_rows(chunks)
+
+    if len(rows) > MAX_RESULT_ROWS:
+        rows = rows[:MAX_RESULT_ROWS]
+        truncated = True
+
+    merged = {
+        "status": "success",
+        data_key: rows,
+        "count": len(rows),
+        "generated_sql": results[0]["generated_sql"],
+        "truncated": truncated
+    }
+    if len(results) > 1:
+        merged["chunks"] = len(results)
+    if truncated:
+        merged["message"] = (
+            f"Result was truncated (row limit {row_limit} per query). "
+            "Narrow the date range or filters for a complete answer."
+        )
+    return merged
+
+def _execute_mysql_chunk(db, template_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        stmt, db_params, rendered_sql = _prepare_mysql_statement(template_name, context)
+    except Exception as e:
+        return {"status": "error", "message": f"Template Error: {e}"}
+
+    # 套用模板時限，並登記 connection id 供斷線時 KILL QUERY
+    timeout = query_timeout(template_name)
+    try:
+        with db._engine.connect() as connection:
+            connection_id = prepare_mysql_session(connection, timeout)
+            with track_query("mysql", connection_id), \
+                    log_query("mysql", template_name, db_params, rendered_sql) as execution:
+                # server-side cursor 分批讀取，不再 fetchall 後整份複製成 dict 列
+                columns, batches = iter_row_batches(connection, stmt, db_params)
+                result = collect_batches(columns, batches, rendered_sql, columnar_enabled())
+                execution.rows = result["count"]
+                return result
+    except Exception as e:
+        return query_error(e, rendered_sql, timeout)
+
+def _keyset_ceiling(spec, context: Dict[str, Any]) -> int:
+    """
+    總列數上限：模板的 max_rows (可用 <TEMPLATE>_MAX_ROWS 覆寫)，呼叫端的 limit 只能再往下調。
+    """
+    ceiling = int(os.getenv(f"{spec.name.upper()}_MAX_ROWS", spec.max_rows or MAX_RESULT_ROWS))
+    limit = context.get("limit")
+    return min(ceiling, int(limit)) if limit else ceiling
+
+def _keyset_plan(template_name: str, context: Dict[str, Any]):
+    """
+    keyset 分頁的共用設定 (sync / async 共用)：回傳 (spec, page_size, ceiling, base_context, 初始游標)。
+    """
+    spec = get_registry().get(template_name)
+    page_size = int(context.get("page_size") or spec.page_size or 5000)
+    ceiling = _keyset_ceiling(spec, context)
+    base = {k: v for k, v in context.items() if k != "limit"}
+    cursor: Dict[str, Any] = {f"after_{col}": None for col in spec.keyset_columns}
+    return spec, page_size, ceiling, base, cursor
+
+def _keyset_result(spec, collector, rendered_sql: str, pages: int) -> Dict[str, Any]:
+    result = collector.result(rendered_sql)
+    result["id_columns"] = list(spec.keyset_columns)
+    result["pages"] = pages
+    result["truncated"] = False
+    result["total_count"] = collector.count
+    return result
+
+def _apply_keyset_total(result: Dict[str, Any], total: int, ceiling: int) -> Dict[str, Any]:
+    """
+    達到上限時以 count_only 查出的實際總數補上 total_count / truncated。
+    """
+    count = result["total_count"]
+    result["total_count"] = int(total)
+    if total > count:
+        result["truncated"] = True
+        result["message"] = (
+            f"Result was truncated at {count} of {total} rows (ceiling {ceiling}). "
+            "Narrow the date range or filters for a complete answer."
+        )
+    return result
+
+def _execute_keyset_pages(db, template_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    以 keyset 游標 (template_index.yaml 的 keyset_columns) 逐頁執行模板，取代單一的固定 LIMIT。
+    每頁以 server-side cursor 分批讀入同一個 BatchCollector (一律以 DataFrame 保存，不轉成 dict 列)；
+    達到上限時停止，標記 truncated 並以 count_only 模式查出實際的 total_count。
+    """
+    spec, page_size, ceiling, base, cursor = _keyset_plan(template_name, context)
+    timeout = query_timeout(template_name)
+
+    collector = None
+    pages = 0
+    rendered_sql = None
     try:
         with db._engine.connect() as connection:
-            result = connection.execute(stmt, db_params)
-            columns = result.keys()
-            rows = [dict(zip(columns, row)) for row in result.fetchall()]
-            
-            return {
-                "status": "success",
-                "data": rows,
-                "count": len(rows),
-                "generated_sql": rendered_sql
-            }
+            connection_id = prepare_mysql_session(connection, timeout)
+            while collector is None or collector.count < ceiling:
+                request_size = min(page_size, ceiling - (collector.count if collector else 0))
+                try:
+                    stmt, db_params, rendered_sql = _prepare_mysql_statement(
+                        template_name, dict(base, page_size=request_size, **cursor)
+                    )
+                except Exception as e:
+                    return {"status": "error", "message": f"Template Error: {e}"}
+
+                page_rows = 0
+                last_row = None
+                with track_query("mysql", connection_id), \
+                        log_query("mysql", template_name, db_params, rendered_sql) as execution:
+                    columns, batches = iter_row_batches(connection, stmt, db_params)
+                    if collector is None:
+                        collector = BatchCollector(columns, columnar=True)
+                    for batch in batches:
+                        collector.add(batch)
+                        page_rows += len(batch)
+                        last_row = batch[-1]
+                    execution.rows = page_rows
+                pages += 1
+
+                if page_rows < request_size:
+                    break
+                last = dict(zip(columns, last_row))
+                cursor = {f"after_{col}": last[col] for col in spec.keyset_columns}
+
+            result = _keyset_result(spec, collector, rendered_sql, pages)
+            if collector.count >= ceiling:
+                # 剛好等於上限時不一定有遺漏，以 COUNT 確認實際總數
+                stmt, db_params, count_sql = _prepare_mysql_statement(template_name, dict(base, count_only=True))
+                with track_query("mysql", connection_id), \
+                        log_query("mysql", f"{spec.name}:count", db_params, count_sql) as execution:
+                    total = connection.execute(stmt, db_params).scalar() or 0
+                    execution.rows = 1
+                _apply_keyset_total(result, total, ceiling)
+            return result
+    except Exception as e:
+        return query_error(e, rendered_sql, timeout)
+
+async def _execute_keyset_pages_async(engine, template_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    _execute_keyset_pages 的 async 版本 (engine 為 get_mysql_db_async)，逐頁等待時不佔用 worker thread。
+    """
+    spec, page_size, ceiling, base, cursor = _keyset_plan(template_name, context)
+    timeout = query_timeout(template_name)
+
+    collector = None
+    pages = 0
+    rendered_sql = None
+    try:
+        async with engine.connect() as connection:
+            connection_id = await prepare_mysql_session_async(connection, timeout)
+            while collector is None or collector.count < ceiling:
+                request_size = min(page_size, ceiling - (collector.count if collector else 0))
+                try:
+                    stmt, db_params, rendered_sql = _prepare_mysql_statement(
+                        template_name, dict(base, page_size=request_size, **cursor)
+                    )
+                except Exception as e:
+                    return {"status": "error", "message": f"Template Error: {e}"}
+
+                page_rows = 0
+                last_row = None
+                with track_query("mysql", connection_id), \
+                        log_query("mysql", template_name, db_params, rendered_sql) as execution:
+                    columns, batches = await iter_row_batches_async(connection, stmt, db_params)
+                    if collector is None:
+                        collector = BatchCollector(columns, columnar=True)
+                    async for batch in batches:
+                        collector.add(batch)
+                        page_rows += len(batch)
+                        last_row = batch[-1]
+                    execution.rows = page_rows
+                pages += 1
+
+                if page_rows < request_size:
+                    break
+                last = dict(zip(columns, last_row))
+                cursor = {f"after_{col}": last[col] for col in spec.keyset_columns}
+
+            result = _keyset_result(spec, collector, rendered_sql, pages)
+            if collector.count >= ceiling:
+                stmt, db_params, count_sql = _prepare_mysql_statement(template_name, dict(base, count_only=True))
+                with track_query("mysql", connection_id), \
+                        log_query("mysql", f"{spec.name}:count", db_params, count_sql) as execution:
+                    total = (await connection.execute(stmt, db_params)).scalar() or 0
+                    execution.rows = 1
+                _apply_keyset_total(result, total, ceiling)
+            return result
     except Exception as e:
-        return {
-            "status": "error", 
-            "message": str(e), 
-            "generated_sql": rendered_sql
-        }
+        return query_error(e, rendered_sql, timeout)
+
+def _cache_lookup(template_name: str, context: Dict[str, Any]):
+    """
+    回傳 (cache_key, ttl, cached_result)；模板未設定 cache_ttl 或快取停用時 key 為 None。
+    """
+    try:
+        ttl = get_registry().get(template_name).cache_ttl
+    except ValueError:
+        return None, 0, None
+    if not ttl or not cache_enabled():
+        return None, 0, None
+    key = canonical_key(template_name, context)
+    cached = get_result_cache().get(key)
+    return key, ttl, (dict(cached, cached=True) if cached is not None else None)
+
+def _cache_store(key: Optional[str], ttl: float, result: Dict[str, Any]) -> Dict[str, Any]:
+    if key and result.get("status") == "success":
+        get_result_cache().set(key, result, ttl)
+    return result
+
+def _id_lists(frame: pd.DataFrame, columns: List[str]):
+    """
+    每個 ID 欄位的相異 ID (最多 KEYSET_INLINE_IDS 個，依出現順序) 與完整的相異數量。
+    """
+    ids, counts = {}, {}
+    for col in columns:
+        values = frame[col].dropna().drop_duplicates()
+        counts[col] = int(len(values))
+        ids[col] = values.head(KEYSET_INLINE_IDS).tolist()
+    return ids, counts
 
-@tool
+def _tool_output(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    含 "frame" 的結果 (columnar 模式或 keyset 模板) 轉成工具回傳：預覽列 + dataset_handle。
+    keyset 模板另外附上 ids / id_counts (各欄位的相異 ID)，不把整份結果放進 LLM 的內容。
+    快取中保存的是 frame 本身，每次回傳都重新登記一個 handle。
+    """
+    frame = result.get("frame")
+    if frame is None:
+        return result
+    output = {k: v for k, v in result.items() if k not in ("frame", "id_columns")}
+    output.update(columnar_result(frame, result["generated_sql"]))
+    id_columns = result.get("id_columns")
+    if id_columns:
+        output["ids"], output["id_counts"] = _id_lists(frame, id_columns)
+        output["ids_truncated"] = any(count > KEYSET_INLINE_IDS for count in output["id_counts"].values())
+    return output
+
+def _render_and_execute_mysql(template_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    內部共用函數：渲染並執行 MySQL 模板
+    大型 ID 清單會依 chunk_size 分塊，在連線池上平行執行後合併去重。
+    相同模板 + 相同參數在 cache_ttl 內直接回傳快取結果，不經過 SSH Tunnel。
+    結果以 server-side cursor 分批讀取 (MYSQL_STREAM_BATCH_SIZE)；COLUMNAR_RESULTS=true 時
+    逐批組成 DataFrame，只回傳預覽列與 dataset_handle (keyset 模板不論設定一律如此)。
+    """
+    cache_key, ttl, cached = _cache_lookup(template_name, context)
+    if cached is not None:
+        return _tool_output(cached)
+
+    db = get_mysql_db()
+
+    try:
+        keyset = bool(get_registry().get(template_name).keyset_columns)
+    except Exception as e:
+        return {"status": "error", "message": f"Template Error: {e}"}
+    if keyset:
+        return _tool_output(_cache_store(cache_key, ttl, _execute_keyset_pages(db, template_name, context)))
+
+    try:
+        contexts, row_limit = _chunk_contexts(template_name, context)
+    except Exception as e:
+        return {"status": "error", "message": f"Template Error: {e}"}
+
+    if len(contexts) == 1:
+        result = _merge_chunk_results([_execute_mysql_chunk(db, template_name, contexts[0])], row_limit)
+        return _tool_output(_cache_store(cache_key, ttl, result))
+
+    # 每個 chunk 複製一份 contextvars，讓 worker thread 也拿得到目前請求的 QueryScope
+    with ThreadPoolExecutor(max_workers=min(CHUNK_CONCURRENCY, len(contexts))) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, _execute_mysql_chunk, db, template_name, chunk)
+            for chunk in contexts
+        ]
+        results = [f.result() for f in futures]
+    return _tool_output(_cache_store(cache_key, ttl, _merge_chunk_results(results, row_limit)))
+
+async def _execute_mysql_chunk_async(engine, template_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        stmt, db_params, rendered_sql = _prepare_mysql_statement(template_name, context)
+    except Exception as e:
+        return {"status": "error", "message": f"Template Error: {e}"}
+
+    timeout = query_timeout(template_name)
+    try:
+        async with engine.connect() as connection:
+            connection_id = await prepare_mysql_session_async(connection, timeout)
+            with track_query("mysql", connection_id), \
+                    log_query("mysql", template_name, db_params, rendered_sql) as execution:
+                columns, batches = await iter_row_batches_async(connection, stmt, db_params)
+                result = await collect_batches_async(columns, batches, rendered_sql, columnar_enabled())
+                execution.rows = result["count"]
+                return result
+    except Exception as e:
+        return query_error(e, rendered_sql, timeout)
+
+async def _render_and_execute_mysql_async(template_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    _render_and_execute_mysql 的 async 版本 (使用 get_mysql_db_async)，等待 MySQL 時不阻塞 worker thread
+    """
+    cache_key, ttl, cached = _cache_lookup(template_name, context)
+    if cached is not None:
+        return _tool_output(cached)
+
+    try:
+        keyset = bool(get_registry().get(template_name).keyset_columns)
+    except Exception as e:
+        return {"status": "error", "message": f"Template Error: {e}"}
+    engine = get_mysql_db_async()
+    if keyset:
+        result = await _execute_keyset_pages_async(engine, template_name, context)
+        return _tool_output(_cache_store(cache_key, ttl, result))
+
+    try:
+        contexts, row_limit = _chunk_contexts(template_name, context)
+    except Exception as e:
+        return {"status": "error", "message": f"Template Error: {e}"}
+
+    semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+
+    async def _run(chunk):
+        async with semaphore:
+            return await _execute_mysql_chunk_async(engine, template_name, chunk)
+
+    results = await asyncio.gather(*[_run(chunk) for chunk in contexts])
+    return _tool_output(_cache_store(cache_key, ttl, _merge_chunk_results(list(results), row_limit)))
+
+def mysql_template_tool(build: Callable[..., Tuple[str, Dict[str, Any]]]):
+    """
+    MySQL 模板工具的裝飾器：build 只負責把工具參數整理成 (template_name, context)。
+    同一個工具同時提供 sync (invoke，scripts/cli.py) 與 async (ainvoke，ToolNode / LangServe) 實作；
+    async 版本走 get_mysql_db_async，等待 MySQL 時不佔用 worker thread。
+    參數 schema 與說明沿用 build 的簽名與 docstring。
+    """
+    @functools.wraps(build)
+    def _run(*args, **kwargs) -> Dict[str, Any]:
+        return _render_and_execute_mysql(*build(*args, **kwargs))
+
+    @functools.wraps(build)
+    async def _arun(*args, **kwargs) -> Dict[str, Any]:
+        return await _render_and_execute_mysql_async(*build(*args, **kwargs))
+
+    template_tool = tool(build)
+    template_tool.func = _run
+    template_tool.coroutine = _arun
+    return template_tool
+
+@mysql_template_tool
 def id_finder(
     start_date: str,
     end_date: str,
@@ -68,12 +482,15 @@ def id_finder(
     industry_ids: Optional[List[int]] = None,
     sub_industry_ids: Optional[List[int]] = None,
     product_line_ids: Optional[List[int]] = None,
-    limit: int = 5000
-) -> Dict[str, Any]:
+    limit: Optional[int] = None
+) -> Tuple[str, Dict[str, Any]]:
     """
     【核心工具】ID 搜尋器。
     根據時間、客戶、格式等條件，找出所有相關的 IDs (CueList, Campaign, Plaid)。
     這些 IDs 是後續查詢預算、執行、成效的必要輸入。
+    結果以 keyset 分頁完整取回；超過上限時 truncated=True，total_count 為實際總數。
+    回傳的 ids 為各欄位 (cue_list_id / campaign_id / plaid) 的相異 ID 清單，id_counts 為相異數量；
+    data 只是前幾列預覽，完整結果會自動存入 data_store。
     
     Args:
         start_date: 開始日期 (Required)
@@ -84,6 +501,7 @@ def id_finder(
         industry_ids: 產業 ID 列表
         sub_industry_ids: 子產業 ID 列表
         product_line_ids: 產品線 ID 列表
+        limit: 最多回傳列數 (選填，預設為系統上限)
     """
     context = {
         "start_date": start_date,
@@ -96,12 +514,50 @@ def id_finder(
         "product_line_ids": product_line_ids,
         "limit": limit
     }
-    return _render_and_execute_mysql("id_finder.sql", context)
+    return "id_finder.sql", context
+
+@mysql_template_tool
+def query_budget_summary(
+    start_date: str,
+    end_date: str,
+    client_ids: Optional[List[int]] = None,
+    agency_ids: Optional[List[int]] = None,
+    ad_format_type_ids: Optional[List[int]] = None,
+    industry_ids: Optional[List[int]] = None,
+    sub_industry_ids: Optional[List[int]] = None,
+    product_line_ids: Optional[List[int]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    【預算快速查詢】一次取得 Campaign × 格式 的「進單金額」與「執行金額」。
+    直接使用 id_finder 的過濾條件，不需要先呼叫 id_finder、query_investment_budget、query_execution_budget。
+    適用「客戶 X 今年預算」、「代理商 Y 的進單與執行金額」等問題。
+
+    Args:
+        start_date: 開始日期 (Required)
+        end_date: 結束日期 (Required)
+        client_ids: 客戶 ID 列表
+        agency_ids: 代理商 ID 列表
+        ad_format_type_ids: 廣告格式 ID 列表
+        industry_ids: 產業 ID 列表
+        sub_industry_ids: 子產業 ID 列表
+        product_line_ids: 產品線 ID 列表
+    """
+    context = {
+        "start_date": start_date,
+        "end_date": end_date,
+        "client_ids": client_ids,
+        "agency_ids": agency_ids,
+        "ad_format_type_ids": ad_format_type_ids,
+        "industry_ids": industry_ids,
+        "sub_industry_ids": sub_industry_ids,
+        "product_line_ids": product_line_ids
+    }
+    return "budget_summary.sql", context
 
-@tool
+@mysql_template_tool
 def query_campaign_basic(
     campaign_ids: List[int]
-) -> Dict[str, Any]:
+) -> Tuple[str, Dict[str, Any]]:
     """
     查詢活動基本資訊 (Metadata)，包含名稱、日期、客戶與 agency。
     並附帶該活動旗下的所有 Plaid 列表。
@@ -112,12 +568,12 @@ def query_campaign_basic(
     context = {
         "campaign_ids": campaign_ids
     }
-    return _render_and_execute_mysql("campaign_basic.sql", context)
+    return "campaign_basic.sql", context
 
-@tool
+@mysql_template_tool
 def query_investment_budget(
     cue_list_ids: List[int]
-) -> Dict[str, Any]:
+) -> Tuple[str, Dict[str, Any]]:
     """
     查詢「進單/投資」金額 (Investment Budget)。
     
@@ -127,12 +583,12 @@ def query_investment_budget(
     context = {
         "cue_list_ids": cue_list_ids
     }
-    return _render_and_execute_mysql("investment_budget.sql", context)
+    return "investment_budget.sql", context
 
-@tool
+@mysql_template_tool
 def query_execution_budget(
     plaids: List[int]
-) -> Dict[str, Any]:
+) -> Tuple[str, Dict[str, Any]]:
     """
     查詢「執行/認列」金額 (Execution Budget)。
     
@@ -142,12 +598,12 @@ def query_execution_budget(
     context = {
         "plaids": plaids
     }
-    return _render_and_execute_mysql("execution_budget.sql", context)
+    return "execution_budget.sql", context
 
-@tool
+@mysql_template_tool
 def query_targeting_segments(
     plaids: List[int]
-) -> Dict[str, Any]:
+) -> Tuple[str, Dict[str, Any]]:
     """
     查詢活動的「數據鎖定」或「受眾標籤」設定 (Targeting Segments)。
     
@@ -157,9 +613,9 @@ def query_targeting_segments(
     context = {
         "plaids": plaids
     }
-    return _render_and_execute_mysql("targeting_segments.sql", context)
+    return "targeting_segments.sql", context
 
-@tool
+@mysql_template_tool
 def execute_sql_template(
     template_name: str,
     campaign_ids: Optional[List[int]] = None,
@@ -170,7 +626,7 @@ def execute_sql_template(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     limit: int = 1000
-) -> Dict[str, Any]:
+) -> Tuple[str, Dict[str, Any]]:
     """
     [進階] 通用 SQL 模板執行器。只有在上述專用工具不適用時才使用。
     """
@@ -184,4 +640,4 @@ def execute_sql_template(
         "end_date": end_date,
         "limit": limit
     }
-    return _render_and_execute_mysql(template_name, context)
+    return template_name, context
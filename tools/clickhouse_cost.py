@@ -0,0 +1,160 @@
+"""
+ClickHouse Cost Guardrail
+
+Agent 可能在沒有 plaids / cmpids 的情況下查詢好幾年的成效，整個 events view 都會被掃過。
+執行前先以 EXPLAIN ESTIMATE 取得每張表預計讀取的 parts / rows / marks (只做 index 分析，不讀資料)，
+再以 system.parts 的平均每列大小 (快取) 換算成 bytes：
+- 未超過預算 (CH_MAX_SCAN_ROWS / CH_MAX_SCAN_BYTES) 照常執行
+- 超過時由呼叫端嘗試改寫 (例如月彙總表)，仍超過則拒絕執行，把原因與建議回給 Agent (error_type: cost_limit)
+- 執行時另外帶上 max_rows_to_read / max_bytes_to_read 作為 server 端的最後防線
+CH_COST_GUARD: enforce (預設) / warn (只記錄不拒絕) / off
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+_table_stats: Optional[Tuple[float, Dict[Tuple[str, str], float]]] = None
+_table_stats_lock = threading.Lock()
+
+
+def max_scan_rows() -> int:
+    return int(os.getenv('CH_MAX_SCAN_ROWS', 2_000_000_000))
+
+
+def max_scan_bytes() -> int:
+    return int(os.getenv('CH_MAX_SCAN_BYTES', 50 * 1024 ** 3))
+
+
+def backstop_factor() -> float:
+    """
+    server 端防線 = 預算 × 此倍數 (EXPLAIN ESTIMATE 以 granule 估算，實際讀取量會略有出入)。
+    """
+    return float(os.getenv('CH_COST_BACKSTOP_FACTOR', 2))
+
+
+def guard_mode() -> str:
+    mode = os.getenv('CH_COST_GUARD', 'enforce').lower()
+    return mode if mode in ("enforce", "warn", "off") else "enforce"
+
+
+def scan_limit_settings() -> Dict[str, Any]:
+    """
+    執行查詢時帶上的 server 端讀取上限 (enforce 模式才有)。
+    """
+    if guard_mode() != "enforce":
+        return {}
+    return {
+        "max_rows_to_read": int(max_scan_rows() * backstop_factor()),
+        "max_bytes_to_read": int(max_scan_bytes() * backstop_factor()),
+        "read_overflow_mode": "throw",
+    }
+
+
+def _format_bytes(value: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024:
+            return f"{value:.0f}{unit}"
+        value /= 1024
+    return f"{value:.1f}TB"
+
+
+def _format_rows(value: float) -> str:
+    for unit, size in (("B", 1e9), ("M", 1e6), ("K", 1e3)):
+        if value >= size:
+            return f"{value / size:.1f}{unit}"
+    return str(int(value))
+
+
+class CostEstimate:
+    """
+    EXPLAIN ESTIMATE 的結果：每張表預計讀取的列數，以及依平均列大小換算的 bytes (上限估計)。
+    """
+
+    def __init__(self, tables: List[Dict[str, Any]]):
+        self.tables = tables
+        self.rows = sum(t["rows"] for t in tables)
+        self.bytes = sum(t["bytes"] for t in tables)
+
+    def over_budget(self) -> bool:
+        return self.rows > max_scan_rows() or self.bytes > max_scan_bytes()
+
+    def describe(self) -> str:
+        return f"~{_format_rows(self.rows)} rows / ~{_format_bytes(self.bytes)}"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"estimated_rows": self.rows, "estimated_bytes": int(self.bytes), "tables": self.tables}
+
+
+def _bytes_per_row(client) -> Dict[Tuple[str, str], float]:
+    """
+    每張表的平均未壓縮列大小 (system.parts)，快取 CH_TABLE_STATS_TTL 秒。
+    以整列計算，實際只讀部分欄位，因此換算出的 bytes 是上限。
+    """
+    global _table_stats
+    now = time.monotonic()
+    if _table_stats is not None and _table_stats[0] > now:
+        return _table_stats[1]
+    with _table_stats_lock:
+        if _table_stats is not None and _table_stats[0] > now:
+            return _table_stats[1]
+        result = client.query(
+            "SELECT database, table, sum(data_uncompressed_bytes) / greatest(sum(rows), 1) "
+            "FROM system.parts WHERE active GROUP BY database, table"
+        )
+        stats = {(db, table): float(size) for db, table, size in result.result_rows}
+        _table_stats = (now + float(os.getenv('CH_TABLE_STATS_TTL', 3600)), stats)
+        return stats
+
+
+def estimate_query(client, sql: str, parameters: Optional[Dict[str, Any]] = None,
+                   external_data=None, settings: Optional[Dict[str, Any]] = None) -> CostEstimate:
+    """
+    以 EXPLAIN ESTIMATE 估算查詢會讀取的列數與 bytes。
+    """
+    result = client.query(
+        f"EXPLAIN ESTIMATE {sql}", parameters=parameters, external_data=external_data, settings=settings
+    )
+    columns = result.column_names
+    sizes = _bytes_per_row(client)
+    tables = []
+    for row in result.result_rows:
+        entry = dict(zip(columns, row))
+        key = (entry.get("database"), entry.get("table"))
+        rows = int(entry.get("rows") or 0)
+        tables.append({
+            "table": f"{key[0]}.{key[1]}",
+            "parts": int(entry.get("parts") or 0),
+            "marks": int(entry.get("marks") or 0),
+            "rows": rows,
+            "bytes": rows * sizes.get(key, 0.0),
+        })
+    return CostEstimate(tables)
+
+
+def cost_error(template_name: str, estimate: CostEstimate, generated_sql: Optional[str] = None) -> Dict[str, Any]:
+    """
+    超過預算時回給 Agent 的結構化錯誤。
+    """
+    return {
+        "status": "error",
+        "error_type": "cost_limit",
+        "generated_sql": generated_sql,
+        **estimate.as_dict(),
+        "message": (
+            f"{template_name} would scan {estimate.describe()}, over the budget of "
+            f"{_format_rows(max_scan_rows())} rows / {_format_bytes(max_scan_bytes())}. "
+            "Add plaids or cmpids (from id_finder), filter by format or category, or narrow the date range, then retry. "
+            "For a rough site-wide ranking, retry with approximate=True."
+        ),
+    }
+
+
+class QueryCostExceeded(Exception):
+    """
+    查詢預估成本超過預算 (enforce 模式)；result 為回給 Agent 的錯誤內容。
+    """
+
+    def __init__(self, template_name: str, estimate: CostEstimate, generated_sql: Optional[str] = None):
+        self.result = cost_error(template_name, estimate, generated_sql)
+        super().__init__(self.result["message"])
@@ -0,0 +1,226 @@
+"""
+Columnar Result Handoff
+
+大型查詢結果以 ColumnarDataset (DataFrame 欄位陣列 + schema + 列數) 形式保留在 process 內，
+工具只把「預覽列」放進回給 LLM 的內容，並附上 dataset_handle。Retriever middleware 再用 handle
+取回完整資料集存進 data_store，Reporter 直接以 DataFrame 處理，
+避免整份結果被轉成 dict-per-row、序列化成字串、再解析回來。
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+# 尚未被取走的結果最多保留幾份 / 幾秒 (例如工具被呼叫但 middleware 沒有接手)
+MAX_PENDING_FRAMES = int(os.getenv('COLUMNAR_MAX_PENDING', 64))
+PENDING_TTL_SECONDS = float(os.getenv('COLUMNAR_PENDING_TTL', 600))
+PREVIEW_ROWS = int(os.getenv('COLUMNAR_PREVIEW_ROWS', 50))
+
+_pending: "OrderedDict[str, tuple]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def columnar_enabled() -> bool:
+    return os.getenv('COLUMNAR_RESULTS', 'false').lower() == 'true'
+
+
+def _evict_expired(now: float) -> None:
+    while _pending:
+        handle, (created_at, _) = next(iter(_pending.items()))
+        if len(_pending) > MAX_PENDING_FRAMES or now - created_at > PENDING_TTL_SECONDS:
+            _pending.pop(handle, None)
+        else:
+            break
+
+
+class ColumnarDataset:
+    """
+    data_store 中的單一資料集。
+    - frame: 以欄位陣列保存的 DataFrame (呼叫端不可就地修改)
+    - schema / row_count: 不需轉成 dict 列即可取得的結構資訊
+    - 維護每列的雜湊值，跨多次工具呼叫 concat 時只需對新進的列計算雜湊即可去重
+    """
+
+    def __init__(self, frame: Optional[pd.DataFrame] = None):
+        frame = frame if frame is not None else pd.DataFrame()
+        hashes = _row_hashes(frame)
+        unique = ~hashes.duplicated().to_numpy()
+        if not unique.all():
+            frame = frame[unique].reset_index(drop=True)
+            hashes = hashes[unique]
+        self.frame = frame
+        self._hashes = set(hashes.tolist())
+
+    @classmethod
+    def from_records(cls, rows: List[Dict[str, Any]]) -> "ColumnarDataset":
+        return cls(pd.DataFrame(rows))
+
+    @property
+    def columns(self) -> List[str]:
+        return [str(c) for c in self.frame.columns]
+
+    @property
+    def schema(self) -> Dict[str, str]:
+        return {str(c): str(t) for c, t in self.frame.dtypes.items()}
+
+    @property
+    def row_count(self) -> int:
+        return len(self.frame)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def __repr__(self) -> str:
+        return f"ColumnarDataset(rows={self.row_count}, columns={self.columns})"
+
+    def concat(self, other: "ColumnarDataset") -> "ColumnarDataset":
+        """
+        回傳併入 other 後的新資料集：other 中已存在 (或重複) 的列會被略過。
+        """
+        if len(other) == 0:
+            return self
+        if len(self) == 0:
+            return other
+        hashes = _row_hashes(other.frame)
+        fresh = (~hashes.isin(self._hashes)).to_numpy()
+        merged = ColumnarDataset.__new__(ColumnarDataset)
+        merged.frame = pd.concat([self.frame, other.frame[fresh]], ignore_index=True) if fresh.any() else self.frame
+        merged._hashes = self._hashes | set(hashes[fresh].tolist())
+        return merged
+
+    def to_frame(self) -> pd.DataFrame:
+        return self.frame
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        return self.frame.to_dict('records')
+
+    def preview(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        return preview_records(self.frame, PREVIEW_ROWS if limit is None else limit)
+
+
+def _row_hashes(frame: pd.DataFrame) -> pd.Series:
+    if frame.empty:
+        return pd.Series([], dtype="uint64")
+    try:
+        return pd.util.hash_pandas_object(frame, index=False)
+    except TypeError:
+        # 欄位含不可雜湊的值 (list/dict) 時，以字串形式比對
+        return pd.util.hash_pandas_object(frame.astype(str), index=False)
+
+
+def stash_dataset(df: pd.DataFrame) -> str:
+    """
+    將查詢結果包成 ColumnarDataset 暫存 (去重與雜湊在工具的 thread 內完成)，
+    回傳之後可用 claim_dataset 取回的 handle。
+    """
+    handle = f"ds_{uuid.uuid4().hex}"
+    dataset = ColumnarDataset(df)
+    now = time.monotonic()
+    with _lock:
+        _pending[handle] = (now, dataset)
+        _evict_expired(now)
+    return handle
+
+
+def claim_dataset(handle: Optional[str]) -> Optional[ColumnarDataset]:
+    """
+    取回並移除暫存的 ColumnarDataset；handle 不存在或已過期時回傳 None。
+    """
+    if not handle:
+        return None
+    with _lock:
+        entry = _pending.pop(handle, None)
+    return entry[1] if entry else None
+
+
+def preview_records(df: pd.DataFrame, limit: int = PREVIEW_ROWS) -> List[Dict[str, Any]]:
+    """
+    只把前 limit 列轉成 dict (給 LLM 看的預覽)。
+    """
+    return df.head(limit).to_dict('records')
+
+
+def columnar_result(df: pd.DataFrame, generated_sql: str) -> Dict[str, Any]:
+    """
+    組出 columnar 模式下的工具回傳：預覽列 + 完整結果的 handle。
+    """
+    return {
+        "status": "success",
+        "data": preview_records(df),
+        "count": len(df),
+        "columns": list(df.columns),
+        "generated_sql": generated_sql,
+        "dataset_handle": stash_dataset(df),
+        "preview_only": len(df) > PREVIEW_ROWS
+    }
+
+
+def store_tool_result(data_store: Dict[str, Any], tool_name: str, result: Dict[str, Any]) -> int:
+    """
+    將工具結果併入 data_store[tool_name] (ColumnarDataset)，回傳新增的列數。
+    有 dataset_handle 時取回完整資料集；否則把 "data" 中的 dict 列轉為資料集。
+    """
+    dataset = claim_dataset(result.get("dataset_handle"))
+    if dataset is None:
+        data = result.get("data")
+        if not (isinstance(data, list) and data and isinstance(data[0], dict)):
+            return 0
+        dataset = ColumnarDataset.from_records(data)
+    if len(dataset) == 0:
+        return 0
+
+    existing = as_dataset(data_store.get(tool_name))
+    merged = existing.concat(dataset) if existing is not None else dataset
+    data_store[tool_name] = merged
+    return len(merged) - (len(existing) if existing is not None else 0)
+
+
+def as_dataset(value: Any) -> Optional[ColumnarDataset]:
+    if value is None or isinstance(value, ColumnarDataset):
+        return value
+    if isinstance(value, pd.DataFrame):
+        return ColumnarDataset(value)
+    if isinstance(value, list):
+        return ColumnarDataset.from_records(value)
+    return None
+
+
+def as_frame(value: Any) -> Optional[pd.DataFrame]:
+    """
+    Reporter 以 DataFrame 處理 data_store；舊格式的 List[Dict] 在這裡一次轉換。
+    """
+    if isinstance(value, ColumnarDataset):
+        return value.frame
+    if isinstance(value, pd.DataFrame):
+        return value
+    if isinstance(value, list):
+        return pd.DataFrame(value)
+    return None
+
+
+def export_data_store(data_store: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Graph 最外層輸出 (LangServe / Studio) 需要 JSON-safe 的 state：
+    columnar 結果只輸出欄位、schema、筆數與預覽，不把整份資料集轉成 dict 列。
+    """
+    if not data_store:
+        return data_store
+    exported = {}
+    for key, value in data_store.items():
+        dataset = value if isinstance(value, ColumnarDataset) else (
+            ColumnarDataset(value) if isinstance(value, pd.DataFrame) else None
+        )
+        if dataset is not None:
+            exported[key] = {
+                "columns": dataset.columns,
+                "schema": dataset.schema,
+                "count": dataset.row_count,
+                "preview": dataset.preview()
+            }
+        else:
+            exported[key] = value
+    return exported
@@ -1,6 +1,7 @@
 import pandas as pd
 from typing import List, Dict, Any, Optional
 from langchain_core.tools import tool
+from tools.columnar import as_frame
 
 @tool
 def pandas_processor(
@@ -30,7 +31,52 @@ def pandas_processor(
         rename_map: (選填) 欄位重命名映射 {old_name: new_name}。在篩選前執行。
         percentage_config: (選填) 佔比計算配置 {'column': 'target_col', 'new_col': 'output_col'}
     """
-    if not data:
+    return process_data(
+        data, operation,
+        groupby_col=groupby_col, sum_col=sum_col, concat_col=concat_col, sep=sep,
+        sort_col=sort_col, top_n=top_n, merge_data=merge_data, merge_on=merge_on,
+        merge_how=merge_how, ascending=ascending, date_col=date_col, new_col=new_col,
+        period=period, select_columns=select_columns, rename_map=rename_map,
+        percentage_config=percentage_config
+    )
+
+def _input_frame(data: Any) -> Optional[pd.DataFrame]:
+    """
+    接受 List[Dict]、DataFrame 或 ColumnarDataset；DataFrame 以淺複製處理，
+    後續的欄位型別轉換不會改動 data_store 中的原始資料。
+    """
+    df = as_frame(data)
+    if df is None or len(df) == 0:
+        return None
+    return df if isinstance(data, list) else df.copy(deep=False)
+
+def process_data(
+    data: Any,
+    operation: str,
+    groupby_col: Optional[str] = None,
+    sum_col: Optional[str] = None,
+    concat_col: Optional[str] = None,
+    sep: str = ", ",
+    sort_col: Optional[str] = None,
+    top_n: Optional[int] = None,
+    merge_data: Any = None,
+    merge_on: Optional[str] = None,
+    merge_how: str = "inner",
+    ascending: bool = False,
+    date_col: Optional[str] = None,
+    new_col: Optional[str] = None,
+    period: Optional[str] = None,
+    select_columns: Optional[List[str]] = None,
+    rename_map: Optional[Dict[str, str]] = None,
+    percentage_config: Optional[Dict[str, str]] = None,
+    return_frame: bool = False
+) -> Dict[str, Any]:
+    """
+    pandas_processor 的核心實作。data / merge_data 可直接傳入 data_store 中的 ColumnarDataset 或 DataFrame；
+    return_frame=True 時 "data" 回傳 DataFrame (Reporter 串接多個步驟時不需來回轉成 dict 列)。
+    """
+    df = _input_frame(data)
+    if df is None:
         return {
             "status": "error",
             "markdown": "⚠️ 無資料可供處理。",
@@ -38,8 +84,6 @@ def pandas_processor(
             "count": 0
         }
 
-    df = pd.DataFrame(data)
-
     # --- [MOVED] Explicit Renaming moved to end (after all operations) ---
     # We'll apply rename_map at the very end to avoid column name mismatch issues
 
@@ -69,7 +113,7 @@ def pandas_processor(
                 df[target_new_col] = df[date_col].dt.to_period('Q').astype(str)
             
             result_df = df
-            processed_data = result_df.to_dict('records')
+            processed_data = result_df if return_frame else result_df.to_dict('records')
             return {
                 "status": "success",
                 "markdown": f"✅ 已新增 {target_new_col} 欄位 ({target_period})。前 5 筆預覽：\n\n" + result_df.head(5).to_markdown(index=False),
@@ -96,7 +140,9 @@ def pandas_processor(
     try:
         # ===== 新增：Merge 操作 =====
         if operation == 'merge':
-            if not merge_data or not merge_on:
+            # 將第二個數據集轉為 DataFrame
+            df2 = _input_frame(merge_data)
+            if df2 is None or not merge_on:
                 return {
                     "status": "error",
                     "markdown": "❌ Error: merge 操作需要 merge_data 和 merge_on 參數。",
@@ -104,9 +150,6 @@ def pandas_processor(
                     "count": 0
                 }
 
-            # 將第二個數據集轉為 DataFrame
-            df2 = pd.DataFrame(merge_data)
-
             # 同樣進行型別轉換
             for col in df2.columns:
                 try:
@@ -491,7 +534,7 @@ def pandas_processor(
                 result_df = result_df.rename(columns=valid_rename)
 
         # 3. 保存處理後的數據（數值格式）供後續使用
-        processed_data = result_df.to_dict('records')
+        processed_data = result_df if return_frame else result_df.to_dict('records')
 
         # 4. 格式化數值用於展示 (加上千分位)
         display_df = result_df.copy()
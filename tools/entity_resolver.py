@@ -1,7 +1,9 @@
+import asyncio
 from typing import List, Dict, Any, Optional
 from langchain_core.tools import tool
 from sqlalchemy import text
-from config.database import get_mysql_db
+from config.database import get_mysql_db, get_mysql_db_async
+from services.query_log import log_query
 from services.rag_service import RagService
 
 # 定義搜尋範圍配置
@@ -72,16 +74,16 @@ SEARCH_CONFIGS = [
     }
 ]
 
-def _search_table(conn, config: Dict, keyword: str) -> List[Dict[str, Any]]:
+def _build_search_query(config: Dict):
     """
-    執行單一表格的 SQL 搜尋（LIKE 查詢）
+    組出單一表格的 LIKE 搜尋 SQL (sync / async 共用)
     """
     meta_select = ""
     if config.get("meta_cols"):
         meta_select = ", " + ", ".join(config["meta_cols"])
 
     # 過濾掉空字串或 NULL 的欄位
-    query = text(f"""
+    return text(f"""
         SELECT {config['id_col']} as id, {config['name_col']} as name {meta_select}
         FROM {config['table']}
         WHERE {config['name_col']} LIKE :kw
@@ -91,52 +93,133 @@ def _search_table(conn, config: Dict, keyword: str) -> List[Dict[str, Any]]:
         LIMIT 15
     """)
 
-    try:
-        result = conn.execute(query, {"kw": f"%{keyword}%"})
-        columns = result.keys()
-        rows = result.fetchall()
+def _rows_to_candidates(config: Dict, columns, rows) -> List[Dict[str, Any]]:
+    """
+    將搜尋結果轉為候選實體列表
+    """
+    candidates = []
+    for row in rows:
+        row_dict = dict(zip(columns, row))
+        candidate = {
+            "id": row_dict["id"],
+            "name": row_dict["name"],
+            "type": config["type"],
+            "table": config["table"],
+            "column": config["name_col"],
+            "description": f"{row_dict['name']} ({config['desc']})"
+        }
+        
+        # 處理 Metadata
+        meta = {}
+        if "start_date" in row_dict and row_dict["start_date"]:
+            # 轉為年份
+            try:
+                meta["year"] = row_dict["start_date"].year if hasattr(row_dict["start_date"], 'year') else str(row_dict["start_date"])[:4]
+            except:
+                meta["year"] = str(row_dict["start_date"])[:4]
         
-        candidates = []
-        for row in rows:
-            row_dict = dict(zip(columns, row))
-            candidate = {
-                "id": row_dict["id"],
-                "name": row_dict["name"],
-                "type": config["type"],
-                "table": config["table"],
-                "column": config["name_col"],
-                "description": f"{row_dict['name']} ({config['desc']})"
+        if "status" in row_dict:
+            status_map = {
+                "converted": "已轉正式",
+                "requested": "需求中",
+                "oncue": "投放中",
+                "close": "已結案",
+                "deleted": "已刪除"
             }
+            meta["status"] = status_map.get(row_dict["status"], row_dict["status"])
+        
+        if meta:
+            candidate["metadata"] = meta
             
-            # 處理 Metadata
-            meta = {}
-            if "start_date" in row_dict and row_dict["start_date"]:
-                # 轉為年份
-                try:
-                    meta["year"] = row_dict["start_date"].year if hasattr(row_dict["start_date"], 'year') else str(row_dict["start_date"])[:4]
-                except:
-                    meta["year"] = str(row_dict["start_date"])[:4]
-            
-            if "status" in row_dict:
-                status_map = {
-                    "converted": "已轉正式",
-                    "requested": "需求中",
-                    "oncue": "投放中",
-                    "close": "已結案",
-                    "deleted": "已刪除"
-                }
-                meta["status"] = status_map.get(row_dict["status"], row_dict["status"])
-            
-            if meta:
-                candidate["metadata"] = meta
-                
-            candidates.append(candidate)
-            
-        return candidates
+        candidates.append(candidate)
+        
+    return candidates
+
+def _search_table(conn, config: Dict, keyword: str) -> List[Dict[str, Any]]:
+    """
+    執行單一表格的 SQL 搜尋（LIKE 查詢）
+    """
+    query = _build_search_query(config)
+
+    params = {"kw": f"%{keyword}%"}
+    try:
+        with log_query("mysql", f"entity_search:{config['type']}", params, str(query)) as execution:
+            result = conn.execute(query, params)
+            columns = result.keys()
+            rows = result.fetchall()
+            execution.rows = len(rows)
+        return _rows_to_candidates(config, columns, rows)
+    except Exception as e:
+        print(f"⚠️ LIKE search failed for {config['table']}.{config['name_col']}: {e}")
+        return []
+
+async def _search_table_async(conn, config: Dict, keyword: str) -> List[Dict[str, Any]]:
+    """
+    _search_table 的 async 版本 (conn 為 AsyncConnection)
+    """
+    query = _build_search_query(config)
+
+    params = {"kw": f"%{keyword}%"}
+    try:
+        with log_query("mysql", f"entity_search:{config['type']}", params, str(query)) as execution:
+            result = await conn.execute(query, params)
+            columns = result.keys()
+            rows = result.fetchall()
+            execution.rows = len(rows)
+        return _rows_to_candidates(config, columns, rows)
     except Exception as e:
         print(f"⚠️ LIKE search failed for {config['table']}.{config['name_col']}: {e}")
         return []
 
+async def _search_tables_async(configs: List[Dict], keyword: str) -> List[Dict[str, Any]]:
+    """
+    平行搜尋多個表格：每個表格使用獨立的 async 連線，總耗時約等於最慢的一張表
+    """
+    engine = get_mysql_db_async()
+
+    async def _search_one(config: Dict) -> List[Dict[str, Any]]:
+        async with engine.connect() as conn:
+            return await _search_table_async(conn, config, keyword)
+
+    results = await asyncio.gather(*(_search_one(c) for c in configs))
+    return [candidate for candidates in results for candidate in candidates]
+
+def _target_configs(target_types: Optional[List[str]]) -> List[Dict]:
+    return [c for c in SEARCH_CONFIGS if not target_types or c["type"] in target_types]
+
+def _selection_config(selected_type: str) -> Optional[Dict]:
+    # 根據 type 找到對應的 config
+    return next((c for c in SEARCH_CONFIGS if c["type"] == selected_type), None)
+
+def _invalid_selection(selected_type: str) -> Dict[str, Any]:
+    return {
+        "status": "error",
+        "data": {},
+        "message": f"Invalid entity type: {selected_type}",
+        "source": "user_selection"
+    }
+
+def _build_selection_query(config: Dict):
+    return text(f"""
+        SELECT {config['id_col']} as id, {config['name_col']} as name
+        FROM {config['table']}
+        WHERE {config['id_col']} = :entity_id
+    """)
+
+def _selection_result(config: Dict, selected_type: str, row) -> Dict[str, Any]:
+    return {
+        "status": "exact_match",
+        "data": {
+            "id": row[0],
+            "name": row[1],
+            "type": selected_type,
+            "table": config["table"],
+            "column": config["name_col"]
+        },
+        "message": f"User confirmed: {row[1]}",
+        "source": "user_selection"
+    }
+
 @tool
 def resolve_entity(
     keyword: str,
@@ -177,40 +260,15 @@ def resolve_entity(
     # ===== 階段 0: 使用者已確認選擇 =====
     if selected_id and selected_type:
         print(f"✅ [EntityResolver] User confirmed selection: {selected_type} ID={selected_id}")
+        config = _selection_config(selected_type)
+        if not config:
+            return _invalid_selection(selected_type)
         db = get_mysql_db()
         with db._engine.connect() as connection:
-            # 根據 type 找到對應的 config
-            config = next((c for c in SEARCH_CONFIGS if c["type"] == selected_type), None)
-            if not config:
-                return {
-                    "status": "error",
-                    "data": {},
-                    "message": f"Invalid entity type: {selected_type}",
-                    "source": "user_selection"
-                }
-
             # 查詢該實體的詳細資訊
-            query = text(f"""
-                SELECT {config['id_col']} as id, {config['name_col']} as name
-                FROM {config['table']}
-                WHERE {config['id_col']} = :entity_id
-            """)
-            result = connection.execute(query, {"entity_id": selected_id})
-            row = result.fetchone()
-
-            if row:
-                return {
-                    "status": "exact_match",
-                    "data": {
-                        "id": row[0],
-                        "name": row[1],
-                        "type": selected_type,
-                        "table": config["table"],
-                        "column": config["name_col"]
-                    },
-                    "message": f"User confirmed: {row[1]}",
-                    "source": "user_selection"
-                }
+            row = connection.execute(_build_selection_query(config), {"entity_id": selected_id}).fetchone()
+        if row:
+            return _selection_result(config, selected_type, row)
 
     # ===== 階段 1: LIKE 查詢 =====
     print(f"📊 [EntityResolver] Phase 1: LIKE query in database...")
@@ -219,12 +277,54 @@ def resolve_entity(
 
     with db._engine.connect() as connection:
         # First Pass: With target_types filter
-        for config in SEARCH_CONFIGS:
-            if target_types and config["type"] not in target_types:
-                continue
+        for config in _target_configs(target_types):
             results = _search_table(connection, config, keyword)
             candidates.extend(results)
 
+    return _resolve_candidates(keyword, candidates, target_types, use_rag)
+
+async def _resolve_entity_async(
+    keyword: str,
+    target_types: Optional[List[str]] = None,
+    use_rag: bool = True,
+    selected_id: Optional[int] = None,
+    selected_type: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    resolve_entity 的 async 版本 (ToolNode 的 ainvoke 路徑)：
+    LIKE 查詢以 get_mysql_db_async 平行搜尋各表格，排序與 RAG 搜尋 (同步的 Qdrant client) 交給 thread 執行。
+    """
+    print(f"🔍 [EntityResolver] Resolving: '{keyword}'")
+
+    # ===== 階段 0: 使用者已確認選擇 =====
+    if selected_id and selected_type:
+        print(f"✅ [EntityResolver] User confirmed selection: {selected_type} ID={selected_id}")
+        config = _selection_config(selected_type)
+        if not config:
+            return _invalid_selection(selected_type)
+        async with get_mysql_db_async().connect() as connection:
+            result = await connection.execute(_build_selection_query(config), {"entity_id": selected_id})
+            row = result.fetchone()
+        if row:
+            return _selection_result(config, selected_type, row)
+
+    # ===== 階段 1: LIKE 查詢 =====
+    print(f"📊 [EntityResolver] Phase 1: LIKE query in database (async)...")
+    candidates = await _search_tables_async(_target_configs(target_types), keyword)
+
+    return await asyncio.to_thread(_resolve_candidates, keyword, candidates, target_types, use_rag)
+
+resolve_entity.coroutine = _resolve_entity_async
+
+def _resolve_candidates(
+    keyword: str,
+    candidates: List[Dict[str, Any]],
+    target_types: Optional[List[str]],
+    use_rag: bool
+) -> Dict[str, Any]:
+    """
+    LIKE 查詢之後的共用流程 (sync / async 共用)：去重、類型感知過濾、判斷結果，無結果時改用 RAG。
+    """
     # 去重：避免同一個 ID 被多次搜出 (例如 brand 和 client 可能來自同一表)
     unique_candidates = []
     seen = set()
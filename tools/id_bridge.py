@@ -0,0 +1,69 @@
+"""
+Cross-Database ID Bridge
+
+「客戶 X 的成效」原本要先在 MySQL 跑 id_finder 取得 plaids，再把整份 ID 清單傳回 ClickHouse。
+啟用 bridge (CH_ID_BRIDGE=true) 後，ClickHouse 以 plaid_hierarchy dictionary
+(templates/ddl/clickhouse/plaid_hierarchy_dictionary.sql，鏡像 cue_lists / one_campaigns / pre_campaign 階層)
+自己解析 client / agency / industry 過濾，一次查詢完成，沒有 Python 往返與 ID 清單傳輸。
+未啟用時，同樣的過濾先在 MySQL 解析成 plaids (以 id_finder 模板的 plaids_only 模式渲染，條件與 id_finder 一致)，工具介面不變。
+"""
+import os
+import re
+from typing import Any, Dict, List
+
+from sqlalchemy import text
+
+from tools.template_registry import render_template
+
+ENTITY_FILTERS = ("client_ids", "agency_ids", "industry_ids", "sub_industry_ids")
+
+_NAME_RE = re.compile(r"^[A-Za-z_]\w*(\.[A-Za-z_]\w*)?$")
+
+
+def bridge_enabled() -> bool:
+    return os.getenv('CH_ID_BRIDGE', 'false').lower() == 'true'
+
+
+def bridge_dictionary() -> str:
+    name = os.getenv('CH_ID_BRIDGE_DICTIONARY', 'plaid_hierarchy')
+    if not _NAME_RE.match(name):
+        raise ValueError(f"Error: Invalid CH_ID_BRIDGE_DICTIONARY {name!r}")
+    return name
+
+
+def _plaids_from_mysql(start_date: str, end_date: str, filters: Dict[str, List[int]]) -> List[int]:
+    from config.database import get_mysql_db
+    from services.query_log import log_query
+
+    params = dict(filters, start_date=start_date, end_date=end_date)
+    # 與 id_finder 相同的條件 (registry 會檢查必要參數與型別)，只取相異的 plaid 且不分頁
+    rendered_sql = render_template("id_finder", dict(params, plaids_only=True))
+
+    with get_mysql_db()._engine.connect() as conn, \
+            log_query("mysql", "id_bridge_fallback", params, rendered_sql) as execution:
+        plaids = [row[0] for row in conn.execute(text(rendered_sql))]
+        execution.rows = len(plaids)
+    return plaids
+
+
+def apply_entity_filters(context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    處理 context 中的 client_ids / agency_ids / industry_ids / sub_industry_ids：
+    - bridge 啟用: 保留過濾並帶上 bridge_dictionary，由模板的 _id_bridge_filter.sql 在 ClickHouse 解析
+    - 未啟用: 先在 MySQL 解析成 plaids (與既有 plaids 取交集)，移除這些過濾
+    沒有這些過濾時原樣回傳。
+    """
+    filters = {k: list(context[k]) for k in ENTITY_FILTERS if context.get(k)}
+    if not filters:
+        return context
+    if bridge_enabled():
+        return dict(context, bridge_dictionary=bridge_dictionary())
+
+    plaids = _plaids_from_mysql(context["start_date"], context["end_date"], filters)
+    if context.get("plaids"):
+        plaids = sorted(set(plaids) & set(context["plaids"]))
+    print(f"🔗 Resolved {', '.join(filters)} to {len(plaids)} plaids in MySQL (CH_ID_BRIDGE disabled)")
+    routed = {k: v for k, v in context.items() if k not in ENTITY_FILTERS}
+    # 沒有符合的版位時以不存在的 plaid 0 過濾，查詢回傳空結果
+    routed["plaids"] = plaids or [0]
+    return routed
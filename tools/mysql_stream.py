@@ -0,0 +1,110 @@
+"""
+MySQL Streaming Results
+
+原本的執行方式是 result.fetchall() 後再轉成 dict 列，同一份結果在記憶體中同時存在好幾份
+(driver buffer、Row list、dict list)，代理商層級的大查詢很容易讓 backend 的 3G container 爆記憶體。
+這裡改用 server-side cursor (stream_results=True) 分批讀取：
+- iter_row_batches / iter_row_batches_async: 每次 yield 一批 Row (最多 batch_size 列)
+- collect_batches: 逐批組成 dict 列，或 (COLUMNAR_RESULTS=true) 逐批轉成 DataFrame 再一次 concat
+
+限制：collect_batches 仍會把整份結果收進記憶體 (工具回傳、快取與 data_store 都需要完整結果)。
+省下的是 driver buffer 與中間的 Row list，峰值約為「最終結果一份」(columnar 模式 concat 時短暫約兩份)，
+而不是隨批次大小有界；結果大小仍由模板的 row_limit / max_rows 控制。
+"""
+import os
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+import pandas as pd
+
+STREAM_BATCH_SIZE = int(os.getenv('MYSQL_STREAM_BATCH_SIZE', 2000))
+
+
+def stream_results_enabled() -> bool:
+    return os.getenv('MYSQL_STREAM_RESULTS', 'true').lower() == 'true'
+
+
+def _stream_options(batch_size: int) -> Dict[str, Any]:
+    if not stream_results_enabled():
+        return {}
+    # max_row_buffer 限制 SQLAlchemy 端預先緩衝的列數，避免 buffer 成長到整份結果
+    return {"stream_results": True, "max_row_buffer": batch_size}
+
+
+def iter_row_batches(connection, stmt, params: Dict[str, Any], batch_size: int = STREAM_BATCH_SIZE) -> Tuple[List[str], Iterator[Sequence]]:
+    """
+    以 server-side cursor 執行查詢，回傳 (columns, batches)；batches 每次 yield 最多 batch_size 列。
+    必須在 connection 關閉前讀完 (或丟棄) 所有批次。
+    """
+    result = connection.execution_options(**_stream_options(batch_size)).execute(stmt, params)
+    return list(result.keys()), result.partitions(batch_size)
+
+
+async def iter_row_batches_async(connection, stmt, params: Dict[str, Any], batch_size: int = STREAM_BATCH_SIZE) -> Tuple[List[str], AsyncIterator[Sequence]]:
+    """
+    iter_row_batches 的 async 版本 (connection 為 AsyncConnection)。
+    """
+    if stream_results_enabled():
+        result = await connection.stream(stmt, params, execution_options={"max_row_buffer": batch_size})
+        return list(result.keys()), result.partitions(batch_size)
+
+    result = await connection.execute(stmt, params)
+
+    async def _buffered():
+        for batch in result.partitions(batch_size):
+            yield batch
+
+    return list(result.keys()), _buffered()
+
+
+class BatchCollector:
+    """
+    逐批累積查詢結果：columnar=True 時每批轉成 DataFrame，最後 concat 一次；否則累積 dict 列。
+    """
+
+    def __init__(self, columns: List[str], columnar: bool):
+        self.columns = columns
+        self.columnar = columnar
+        self.count = 0
+        self._frames: List[pd.DataFrame] = []
+        self._rows: List[Dict[str, Any]] = []
+
+    def add(self, batch: Sequence) -> None:
+        if self.columnar:
+            self._frames.append(pd.DataFrame.from_records(batch, columns=self.columns))
+        else:
+            self._rows.extend(dict(zip(self.columns, row)) for row in batch)
+        self.count += len(batch)
+
+    def result(self, generated_sql: str) -> Dict[str, Any]:
+        """
+        組出 chunk 結果：columnar 模式放在 "frame"，否則放在 "data"。
+        """
+        output = {"status": "success", "count": self.count, "generated_sql": generated_sql}
+        if self.columnar:
+            if not self._frames:
+                output["frame"] = pd.DataFrame(columns=self.columns)
+            elif len(self._frames) == 1:
+                output["frame"] = self._frames[0]
+            else:
+                output["frame"] = pd.concat(self._frames, ignore_index=True)
+            self._frames = []
+        else:
+            output["data"] = self._rows
+        return output
+
+
+def collect_batches(columns: List[str], batches: Iterable[Sequence], generated_sql: str, columnar: bool) -> Dict[str, Any]:
+    """
+    讀完所有批次並組成完整結果 (見模組說明中的記憶體限制)。
+    """
+    collector = BatchCollector(columns, columnar)
+    for batch in batches:
+        collector.add(batch)
+    return collector.result(generated_sql)
+
+
+async def collect_batches_async(columns: List[str], batches: AsyncIterator[Sequence], generated_sql: str, columnar: bool) -> Dict[str, Any]:
+    collector = BatchCollector(columns, columnar)
+    async for batch in batches:
+        collector.add(batch)
+    return collector.result(generated_sql)
@@ -0,0 +1,208 @@
+"""
+Partitioned Performance Cache
+
+unified_performance 每次都會掃過整個 start_date ~ end_date，但兩天前以前的資料已不會再變動。
+這裡把查詢範圍切成分區 (整月落在範圍內 → 月分區，頭尾不滿一個月的部分 → 日分區)：
+- 已結束的分區以長 TTL 快取「部分彙總」(clicks / effective_impressions / q100 / engagements)
+- 只查詢快取中缺少的分區 (日期相連的缺漏各一次查詢，依 partition_key 分組後拆回各分區)
+- 合併所有分區後再依 group-by 加總並重新計算 CTR / VTR / ER
+"YTD"、"過去三個月" 這類問題之後只需要查最新的幾天。
+
+分區查詢不排序、不 LIMIT，且依 dims × cmpid × plaid × 分區分組，全站查詢的部分彙總會非常大，因此：
+- 預設關閉 (PERF_PARTITION_CACHE=true 啟用)，且只用於帶有 plaids / cmpids 的查詢；全站 / 長區間查詢改走月彙總表
+- 一次請求補查的部分彙總合計最多 PERF_PARTITION_MAX_ROWS 列，超過時拋出 PartitionFetchTooLarge，由呼叫端改用一般查詢
+"""
+import calendar
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from services.result_cache import canonical_key, get_result_cache
+
+ADDITIVE_METRICS = ["clicks", "effective_impressions", "total_q100_views", "total_engagements"]
+# 比率指標: (分子, 分母)，與 unified_performance.sql 相同以百分比表示
+RATIO_METRICS = {
+    "ctr": ("clicks", "effective_impressions"),
+    "vtr": ("total_q100_views", "effective_impressions"),
+    "er": ("total_engagements", "effective_impressions"),
+}
+# 查詢參數中不屬於「過濾條件」的欄位 (不放進分區快取 key)
+_NON_FILTER_KEYS = {"start_date", "end_date", "limit"}
+
+Partition = Tuple[date, date]
+
+
+class PartitionFetchTooLarge(Exception):
+    """
+    補查的部分彙總超過 PERF_PARTITION_MAX_ROWS 列 (結果不完整，不寫入快取)。
+    """
+
+
+def partition_cache_enabled() -> bool:
+    return os.getenv('PERF_PARTITION_CACHE', 'false').lower() == 'true'
+
+
+def partition_cache_applicable(context: Dict[str, Any]) -> bool:
+    """
+    只有以 plaids / cmpids 限定範圍的查詢才使用分區快取 (部分彙總的列數與 ID 數量成正比)。
+    """
+    return partition_cache_enabled() and bool(context.get("plaids") or context.get("cmpids"))
+
+
+def _partition_max_rows() -> int:
+    return int(os.getenv('PERF_PARTITION_MAX_ROWS', 200000))
+
+
+def _granularity() -> str:
+    return os.getenv('PERF_CACHE_GRANULARITY', 'month').lower()
+
+
+def _parse_date(value: Any) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value).strip().replace("/", "-"), "%Y-%m-%d").date()
+
+
+def plan_partitions(start: date, end: date, granularity: str = "month") -> List[Partition]:
+    """
+    將 [start, end] 切成分區：完整落在範圍內的月份為月分區，其餘 (或 granularity=day) 為日分區。
+    """
+    partitions: List[Partition] = []
+    cursor = start
+    while cursor <= end:
+        month_last = cursor.replace(day=calendar.monthrange(cursor.year, cursor.month)[1])
+        if granularity == "month" and cursor.day == 1 and month_last <= end:
+            partitions.append((cursor, month_last))
+            cursor = month_last + timedelta(days=1)
+        else:
+            partitions.append((cursor, cursor))
+            cursor += timedelta(days=1)
+    return partitions
+
+
+def _partition_ttl(partition: Partition, today: date) -> float:
+    """
+    結束超過 PERF_CACHE_SETTLE_DAYS 天的分區視為已關帳 (長 TTL)，近期分區只短暫快取。
+    """
+    settle_days = int(os.getenv('PERF_CACHE_SETTLE_DAYS', 2))
+    if partition[1] < today - timedelta(days=settle_days):
+        return float(os.getenv('PERF_CACHE_CLOSED_TTL', 7 * 24 * 3600))
+    return float(os.getenv('PERF_CACHE_OPEN_TTL', 300))
+
+
+def _partition_cache_key(context: Dict[str, Any], partition: Partition) -> str:
+    filters = {k: v for k, v in context.items() if k not in _NON_FILTER_KEYS}
+    filters["partition"] = [partition[0].isoformat(), partition[1].isoformat()]
+    return canonical_key("unified_performance_partition", filters)
+
+
+def group_columns(dimensions: List[str]) -> List[str]:
+    return list(dict.fromkeys(list(dimensions) + ["cmpid", "plaid"]))
+
+
+def merge_partials(frames: List[pd.DataFrame], dimensions: List[str], limit: Optional[int]) -> pd.DataFrame:
+    """
+    依 group-by 欄位加總各分區的部分彙總，再重新計算比率指標，排序並套用 limit。
+    """
+    keys = group_columns(dimensions)
+    frames = [f for f in frames if f is not None and len(f) > 0]
+    if not frames:
+        return pd.DataFrame(columns=keys + ADDITIVE_METRICS + list(RATIO_METRICS))
+
+    combined = pd.concat(frames, ignore_index=True)
+    # 維度中若包含 cmpid / plaid，SQL 會輸出重複欄位名稱
+    combined = combined.loc[:, ~combined.columns.duplicated()]
+    merged = combined.groupby(keys, dropna=False, sort=False)[ADDITIVE_METRICS].sum().reset_index()
+
+    for ratio, (numerator, denominator) in RATIO_METRICS.items():
+        merged[ratio] = (merged[numerator] / merged[denominator] * 100).where(merged[denominator] > 0, 0)
+
+    merged = merged.sort_values("clicks", ascending=False, kind="stable")
+    if limit:
+        merged = merged.head(limit)
+    return merged.reset_index(drop=True)
+
+
+def contiguous_runs(partitions: List[Partition]) -> List[List[Partition]]:
+    """
+    將 (已排序的) 分區切成日期相連的區段：中間隔著已快取分區的兩段缺漏各自成為一段。
+    """
+    runs: List[List[Partition]] = []
+    for partition in partitions:
+        if runs and partition[0] == runs[-1][-1][1] + timedelta(days=1):
+            runs[-1].append(partition)
+        else:
+            runs.append([partition])
+    return runs
+
+
+def _run_fetch_context(context: Dict[str, Any], run: List[Partition], row_limit: int) -> Dict[str, Any]:
+    months = [p for p in run if p[0] != p[1]]
+    fetch_context = dict(
+        context,
+        start_date=run[0][0].isoformat(),
+        end_date=run[-1][1].isoformat(),
+        partitioned=True,
+        partition_months=bool(months),
+        partition_row_limit=row_limit,
+    )
+    if months:
+        fetch_context["partition_month_from"] = months[0][0].isoformat()
+        fetch_context["partition_month_to"] = months[-1][1].isoformat()
+    return fetch_context
+
+
+def query_partitioned(
+    context: Dict[str, Any],
+    fetch_frame: Callable[[Dict[str, Any]], pd.DataFrame],
+) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """
+    以分區快取執行 unified_performance。
+    缺少的分區依日期相連的區段分別補查 (不會重查夾在中間、已快取的分區)；
+    fetch_frame(context) 負責實際查詢 (partitioned=True 的模板參數)，回傳含 partition_key 欄位的 DataFrame。
+    回傳 (合併後的 DataFrame, 分區統計)；補查結果合計超過 PERF_PARTITION_MAX_ROWS 列時拋出 PartitionFetchTooLarge。
+    """
+    cache = get_result_cache()
+    today = date.today()
+    partitions = plan_partitions(_parse_date(context["start_date"]), _parse_date(context["end_date"]), _granularity())
+
+    frames: List[pd.DataFrame] = []
+    missing: List[Partition] = []
+    for partition in partitions:
+        cached = cache.get(_partition_cache_key(context, partition))
+        if cached is None:
+            missing.append(partition)
+        else:
+            frames.append(cached)
+
+    runs = contiguous_runs(missing)
+    remaining_rows = _partition_max_rows()
+    for run in runs:
+        fetch_context = _run_fetch_context(context, run, remaining_rows)
+        fetched = fetch_frame(fetch_context)
+        if len(fetched) > remaining_rows:
+            raise PartitionFetchTooLarge(
+                f"partial aggregates exceed {_partition_max_rows()} rows for "
+                f"{fetch_context['start_date']} ~ {fetch_context['end_date']}"
+            )
+        remaining_rows -= len(fetched)
+        partition_keys = pd.to_datetime(fetched["partition_key"]).dt.date if len(fetched) else pd.Series(dtype=object)
+        for partition in run:
+            part = fetched[partition_keys == partition[0]].drop(columns=["partition_key"]).reset_index(drop=True)
+            ttl = _partition_ttl(partition, today)
+            if ttl > 0:
+                cache.set(_partition_cache_key(context, partition), part, ttl)
+            frames.append(part)
+
+    merged = merge_partials(frames, context.get("dimensions") or [], context.get("limit"))
+    stats = {
+        "partitions": len(partitions),
+        "cached": len(partitions) - len(missing),
+        "fetched": len(missing),
+        "fetch_queries": len(runs),
+    }
+    return merged, stats
@@ -0,0 +1,130 @@
+"""
+Monthly Rollup Routing
+
+成效查詢原本一律讀 kafka.summing_ad_format_events_view 的每日資料，「全部時間」這類問題要掃過好幾年的 day_local。
+這裡決定哪些月份可以改讀月彙總表 (templates/ddl/clickhouse/ad_format_events_monthly.sql)：
+- 只有完整落在查詢範圍內、且已回填到月彙總表的月份 (coverage = 表中最早 ~ 最晚的月份)
+- 近期 / 不滿一個月的頭尾仍讀每日 view，由 _ad_format_events_source.sql 以 UNION ALL 接起來
+- 以 day_local 為維度時無法使用月彙總
+月彙總表由 scripts/backfill_rollup.py 建立與回填。
+"""
+import os
+import re
+import threading
+import time
+from datetime import date
+from typing import Any, Dict, Optional, Tuple
+
+from tools.performance_cache import _parse_date, plan_partitions
+
+_TABLE_RE = re.compile(r"^[A-Za-z_]\w*(\.[A-Za-z_]\w*)?$")
+
+Coverage = Tuple[date, date]
+
+# table -> (expires_at, coverage)
+_coverage: Dict[str, Tuple[float, Optional[Coverage]]] = {}
+_coverage_lock = threading.Lock()
+
+
+def rollup_enabled() -> bool:
+    return os.getenv('PERF_ROLLUP_ENABLED', 'true').lower() == 'true'
+
+
+def rollup_table() -> str:
+    table = os.getenv('PERF_ROLLUP_TABLE', 'kafka.ad_format_events_monthly')
+    if not _TABLE_RE.match(table):
+        raise ValueError(f"Error: Invalid PERF_ROLLUP_TABLE {table!r}")
+    return table
+
+
+def _query_coverage(table: str, column: str) -> Optional[Coverage]:
+    from config.database import clickhouse_client, clickhouse_query_settings
+    from services.query_log import log_query
+
+    sql = f"SELECT min({column}), max({column}), count() FROM {table}"
+    with clickhouse_client() as client, log_query("clickhouse", "table_coverage", sql=sql) as execution:
+        first, last, rows = client.query(sql, settings=clickhouse_query_settings()).result_rows[0]
+        execution.rows = 1
+    if not rows:
+        return None
+    return _parse_date(first), _parse_date(last)
+
+
+def table_coverage(table: str, column: str) -> Optional[Coverage]:
+    """
+    預先彙總 / 抽樣表涵蓋的日期範圍 (column 的最小值, 最大值)；表不存在或為空時為 None。
+    結果快取 PERF_ROLLUP_COVERAGE_TTL 秒，回填後最多延遲這麼久才會被使用。
+    """
+    now = time.monotonic()
+    cached = _coverage.get(table)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    with _coverage_lock:
+        cached = _coverage.get(table)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        try:
+            coverage = _query_coverage(table, column)
+        except Exception as e:
+            print(f"⚠️ {table} unavailable, using daily source: {e}")
+            coverage = None
+        _coverage[table] = (now + float(os.getenv('PERF_ROLLUP_COVERAGE_TTL', 600)), coverage)
+        return coverage
+
+
+def rollup_coverage() -> Optional[Coverage]:
+    """
+    月彙總表涵蓋的月份 (第一個月初, 最後一個月初)。
+    """
+    return table_coverage(rollup_table(), "month")
+
+
+def plan_rollup(context: Dict[str, Any], coverage: Optional[Coverage] = None,
+                min_months: Optional[int] = None) -> Dict[str, Any]:
+    """
+    回傳要併入模板 context 的 rollup 參數 (rollup_table / rollup_from / rollup_to / rollup_until)；
+    不適用時回傳空 dict。完整月份少於 min_months (預設 PERF_ROLLUP_MIN_MONTHS) 時不值得改寫查詢。
+    """
+    if not rollup_enabled() or "day_local" in (context.get("dimensions") or []):
+        return {}
+    # 抽樣查詢讀的是抽樣表，不與月彙總混用
+    if context.get("sample_rate"):
+        return {}
+    # partition cache 以日為分區時，月彙總列無法拆回各日分區
+    if context.get("partitioned") and not context.get("partition_months"):
+        return {}
+
+    if min_months is None:
+        min_months = int(os.getenv('PERF_ROLLUP_MIN_MONTHS', 2))
+    start, end = _parse_date(context["start_date"]), _parse_date(context["end_date"])
+    months = [p for p in plan_partitions(start, end, "month") if p[0] != p[1]]
+    if len(months) < max(min_months, 1):
+        return {}
+
+    coverage = coverage or rollup_coverage()
+    if coverage is None:
+        return {}
+    months = [p for p in months if coverage[0] <= p[0] <= coverage[1]]
+    if len(months) < max(min_months, 1):
+        return {}
+
+    return {
+        "rollup_table": rollup_table(),
+        "rollup_from": months[0][0].isoformat(),
+        "rollup_to": months[-1][0].isoformat(),
+        "rollup_until": months[-1][1].isoformat(),
+    }
+
+
+def with_rollup(context: Dict[str, Any], min_months: Optional[int] = None) -> Dict[str, Any]:
+    """
+    context 加上 rollup 參數 (不適用時原樣回傳)。
+    """
+    try:
+        plan = plan_rollup(context, min_months=min_months)
+    except Exception as e:
+        print(f"⚠️ Rollup planning failed, using daily source: {e}")
+        return context
+    if plan:
+        print(f"📦 Reading {plan['rollup_from']} ~ {plan['rollup_until']} from monthly rollup {plan['rollup_table']}")
+    return dict(context, **plan) if plan else context
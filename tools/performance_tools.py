@@ -1,16 +1,24 @@
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Dict, Any, Optional
 from langchain_core.tools import tool
 from sqlalchemy import text, bindparam
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from clickhouse_connect.driver.external import ExternalData
 import os
-from config.database import get_mysql_db, get_clickhouse_db
+import re
+import uuid
+from config.database import get_mysql_db, clickhouse_client, clickhouse_query_settings
+from config.query_control import query_timeout, query_error, track_query
+from services.query_log import log_query
+from tools.approximate import add_confidence_intervals, approximate_info, plan_sample
+from tools.clickhouse_cost import QueryCostExceeded, estimate_query, guard_mode, scan_limit_settings
+from tools.columnar import columnar_enabled, columnar_result
+from tools.id_bridge import apply_entity_filters
+from tools.performance_cache import PartitionFetchTooLarge, partition_cache_applicable, query_partitioned
+from tools.performance_rollup import with_rollup
 
-# Setup Jinja2 Environment
-TEMPLATE_DIR = os.path.join(os.getcwd(), "templates", "sql")
-env = Environment(
-    loader=FileSystemLoader(TEMPLATE_DIR),
-    autoescape=select_autoescape(['sql'])
-)
+from tools.template_registry import get_registry, render_template
+
+# 啟動時即載入並預先編譯所有模板 (索引錯誤在 import 時就會發現)
+get_registry()
 
 def _get_cmp_ids_from_mysql(client_names: List[str], start_date: str, end_date: str) -> List[int]:
     """
@@ -50,12 +58,255 @@ def _get_cmp_ids_from_mysql(client_names: List[str], start_date: str, end_date:
         traceback.print_exc()
         return []
 
+def _prepare_clickhouse_query(template_name: str, context: Dict[str, Any]):
+    """
+    渲染模板並準備 server-side 參數。
+    模板以 {name:Type} 宣告參數 (例如 {plaids:Array(UInt64)})，ID 清單不會內嵌進 SQL 文字，
+    同一組過濾條件無論 ID 多寡都產生相同的 SQL，ClickHouse 不需重新 parse 巨大的字串。
+    回傳 (rendered_sql, parameters)；模板錯誤時直接拋出例外。
+    """
+    rendered_sql = render_template(template_name, context)
+
+    parameters = {}
+    for k, v in context.items():
+        # 只有在 SQL 中有出現該參數時才綁定
+        if v is not None and f"{{{k}:" in rendered_sql:
+            parameters[k] = list(v) if isinstance(v, tuple) else v
+
+    return rendered_sql, parameters
+
+# ID 清單超過此長度時改以 external data table 傳送 (不放進 URL 參數或 SQL 文字)
+EXTERNAL_DATA_THRESHOLD = int(os.getenv('CH_EXTERNAL_DATA_THRESHOLD', 1000))
+_ARRAY_IN_PARAM_RE = re.compile(r"IN\s+\{(\w+):Array\((\w+)\)\}")
+
+def _tsv_value(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+def _externalize_large_lists(rendered_sql: str, parameters: Dict[str, Any], threshold: Optional[int] = None):
+    """
+    將超過 EXTERNAL_DATA_THRESHOLD 的 `IN {name:Array(T)}` 參數改為 ClickHouse external data table：
+    ID 以單欄 TSV 隨查詢一起上傳，SQL 改寫成 `IN external_<name>`，查詢文字保持精簡固定。
+    回傳 (sql, parameters, external_data)；沒有大型清單時 external_data 為 None。
+    """
+    threshold = EXTERNAL_DATA_THRESHOLD if threshold is None else threshold
+    external_data = None
+    parameters = dict(parameters)
+
+    def _replace(match):
+        nonlocal external_data
+        name, ch_type = match.group(1), match.group(2)
+        values = parameters.get(name)
+        if not isinstance(values, list) or len(values) <= threshold:
+            return match.group(0)
+
+        table = f"external_{name}"
+        data = ("\n".join(_tsv_value(v) for v in values) + "\n").encode("utf-8")
+        file_args = {"file_name": f"{table}.tsv", "data": data, "fmt": "TSV", "structure": [f"id {ch_type}"]}
+        if external_data is None:
+            external_data = ExternalData(**file_args)
+        else:
+            external_data.add_file(**file_args)
+        parameters.pop(name, None)
+        return f"IN {table}"
+
+    rewritten_sql = _ARRAY_IN_PARAM_RE.sub(_replace, rendered_sql)
+    return rewritten_sql, parameters, external_data
+
+def _run_clickhouse_query(
+    template_name: str,
+    rendered_sql: str,
+    error_label: str,
+    parameters: Optional[Dict[str, Any]] = None,
+    postprocess: Optional[Callable[[Any], Any]] = None
+) -> Dict[str, Any]:
+    """
+    執行 ClickHouse 查詢並組出工具回傳格式。
+    COLUMNAR_RESULTS=true 時以 query_df 取回 columnar 結果，只有預覽列會轉成 dict 給 LLM，
+    完整 DataFrame 透過 dataset_handle 交給 data_store。
+    postprocess 會先套用在結果 DataFrame 上 (例如近似模式的信賴區間)。
+    查詢帶上模板時限 (max_execution_time) 與 query_id，Client 斷線時可 KILL QUERY。
+    """
+    # 記錄原始參數的基數 (externalize 之後大型清單已不在 parameters 中)
+    logged_params = dict(parameters or {})
+    rendered_sql, parameters, external_data = _externalize_large_lists(rendered_sql, parameters or {})
+    timeout = query_timeout(template_name)
+    query_id = f"agent-{uuid.uuid4().hex}"
+    settings = clickhouse_query_settings(max_execution_time=int(timeout), query_id=query_id, **scan_limit_settings())
+    try:
+        with clickhouse_client() as ch_client, track_query("clickhouse", query_id), \
+                log_query("clickhouse", template_name, logged_params, rendered_sql) as execution:
+            if columnar_enabled() or postprocess is not None:
+                df = ch_client.query_df(
+                    rendered_sql, parameters=parameters, settings=settings, external_data=external_data
+                )
+                execution.rows = len(df)
+                if postprocess is not None:
+                    df = postprocess(df)
+                if columnar_enabled():
+                    return columnar_result(df, rendered_sql)
+                columns = list(df.columns)
+                rows = df.to_dict('records')
+            else:
+                result = ch_client.query(
+                    rendered_sql, parameters=parameters, settings=settings, external_data=external_data
+                )
+                execution.rows = len(result.result_rows)
+                columns = result.column_names
+                rows = [dict(zip(columns, row)) for row in result.result_rows]
+        
+        return {
+            "status": "success",
+            "data": rows,
+            "count": len(rows),
+            "generated_sql": rendered_sql,
+            "columns": columns
+        }
+        
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return query_error(e, rendered_sql, timeout, label=error_label)
+
+def _estimate_clickhouse_cost(rendered_sql: str, parameters: Dict[str, Any]):
+    """
+    EXPLAIN ESTIMATE 預估讀取量；估算失敗時回傳 None (不阻擋查詢，由 server 端讀取上限把關)。
+    """
+    rendered_sql, parameters, external_data = _externalize_large_lists(rendered_sql, parameters)
+    try:
+        with clickhouse_client() as ch_client:
+            return estimate_query(
+                ch_client, rendered_sql, parameters, external_data, settings=clickhouse_query_settings()
+            )
+    except Exception as e:
+        print(f"⚠️ EXPLAIN ESTIMATE failed, skipping cost check: {e}")
+        return None
+
+def _prepare_guarded_query(template_name: str, context: Dict[str, Any]):
+    """
+    渲染模板並在執行前檢查預估成本 (CH_COST_GUARD)。
+    超過預算時先嘗試改讀月彙總表 (只要有一個完整月份即可；模板不讀成效來源時 SQL 不變，直接略過)；
+    仍超過則拋出 QueryCostExceeded (warn 模式只印出警告)。
+    回傳 (rendered_sql, parameters)。
+    """
+    rendered_sql, parameters = _prepare_clickhouse_query(template_name, context)
+    if guard_mode() == "off":
+        return rendered_sql, parameters
+
+    estimate = _estimate_clickhouse_cost(rendered_sql, parameters)
+    if estimate is None or not estimate.over_budget():
+        return rendered_sql, parameters
+
+    if not context.get("rollup_from"):
+        routed = with_rollup(context, min_months=1)
+        if routed is not context:
+            routed_sql, routed_params = _prepare_clickhouse_query(template_name, routed)
+            routed_estimate = None
+            if routed_sql != rendered_sql:
+                routed_estimate = _estimate_clickhouse_cost(routed_sql, routed_params)
+            if routed_estimate is not None and not routed_estimate.over_budget():
+                print(f"📦 {template_name}: {estimate.describe()} over budget, rewritten to the monthly rollup "
+                      f"({routed_estimate.describe()})")
+                return routed_sql, routed_params
+            if routed_estimate is not None:
+                rendered_sql, parameters, estimate = routed_sql, routed_params, routed_estimate
+
+    if guard_mode() == "warn":
+        print(f"⚠️ {template_name} is over the scan budget ({estimate.describe()}), running anyway (CH_COST_GUARD=warn)")
+        return rendered_sql, parameters
+    print(f"🛑 {template_name} refused: {estimate.describe()} over the scan budget")
+    raise QueryCostExceeded(template_name, estimate, rendered_sql)
+
+def _fetch_clickhouse_frame(template_name: str, rendered_sql: str, parameters: Dict[str, Any]):
+    """
+    執行已渲染的模板，直接回傳 DataFrame (供 partition cache 等內部彙總使用)；錯誤時拋出例外。
+    """
+    logged_params = dict(parameters)
+    rendered_sql, parameters, external_data = _externalize_large_lists(rendered_sql, parameters)
+    timeout = query_timeout(template_name)
+    query_id = f"agent-{uuid.uuid4().hex}"
+    settings = clickhouse_query_settings(max_execution_time=int(timeout), query_id=query_id, **scan_limit_settings())
+    with clickhouse_client() as ch_client, track_query("clickhouse", query_id), \
+            log_query("clickhouse", template_name, logged_params, rendered_sql) as execution:
+        df = ch_client.query_df(
+            rendered_sql, parameters=parameters, settings=settings, external_data=external_data
+        )
+        execution.rows = len(df)
+        return df
+
+def _run_partitioned_performance(context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    以分區快取執行 unified_performance：已關帳的日 / 月分區直接取快取，只查詢缺少的分區。
+    部分彙總超過 PERF_PARTITION_MAX_ROWS 列時回傳 None，由呼叫端改用一般查詢。
+    """
+    generated_sql = None
+    try:
+        def _fetch(fetch_context):
+            nonlocal generated_sql
+            # 缺少的分區中完整且已回填的月份改讀月彙總表
+            generated_sql, parameters = _prepare_guarded_query("unified_performance", with_rollup(fetch_context))
+            return _fetch_clickhouse_frame("unified_performance", generated_sql, parameters)
+
+        df, partition_stats = query_partitioned(context, _fetch)
+    except PartitionFetchTooLarge as e:
+        print(f"⚠️ Partition cache skipped: {e}")
+        return None
+    except QueryCostExceeded as e:
+        return e.result
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return query_error(e, generated_sql, query_timeout("unified_performance"), label="Unified Performance Query Error")
+
+    generated_sql = generated_sql or "-- served entirely from partition cache"
+    if columnar_enabled():
+        result = columnar_result(df, generated_sql)
+    else:
+        rows = df.to_dict('records')
+        result = {
+            "status": "success",
+            "data": rows,
+            "count": len(rows),
+            "generated_sql": generated_sql,
+            "columns": list(df.columns)
+        }
+    result["partition_cache"] = partition_stats
+    return result
+
+def _run_approximate_query(template_name: str, context: Dict[str, Any], sample_plan: Dict[str, Any],
+                           error_label: str) -> Dict[str, Any]:
+    """
+    近似模式：SAMPLE 抽樣表，加總放大回全體估計值並附上 CTR / VTR / ER 的信賴區間 (tools/approximate.py)。
+    """
+    try:
+        rendered_sql, parameters = _prepare_guarded_query(template_name, dict(context, **sample_plan))
+    except QueryCostExceeded as e:
+        return e.result
+    except Exception as e:
+        return {"status": "error", "message": f"Template Rendering Error: {e}"}
+
+    print(f"🎲 {template_name}: approximate mode, sampling {sample_plan['sample_rate']:.0%} of {sample_plan['sample_table']}")
+    result = _run_clickhouse_query(
+        template_name, rendered_sql, error_label, parameters,
+        postprocess=lambda df: add_confidence_intervals(
+            df, template_name, sample_plan.get("start_date"), sample_plan.get("end_date")
+        )
+    )
+    if result.get("status") == "success":
+        result["approximate"] = approximate_info(sample_plan, context)
+    return result
+
 @tool
 def query_format_benchmark(
     start_date: str,
     end_date: str,
     cmp_ids: Optional[List[int]] = None,
-    format_ids: Optional[List[int]] = None
+    format_ids: Optional[List[int]] = None,
+    client_ids: Optional[List[int]] = None,
+    agency_ids: Optional[List[int]] = None,
+    industry_ids: Optional[List[int]] = None,
+    sub_industry_ids: Optional[List[int]] = None,
+    approximate: bool = False,
+    sample_rate: Optional[float] = None
 ) -> Dict[str, Any]:
     """
     查詢【格式成效基準】(Benchmark) 與排名。
@@ -64,50 +315,51 @@ def query_format_benchmark(
     2. "汽車產業" (透過 cmp_ids 篩選) 的格式成效平均值。
     3. "Mobile Banner" (透過 format_ids 篩選) 的全站平均成效。
     
+    ⚡️ 只需要大概排名時可設 approximate=True：以抽樣資料估計，速度快很多，CTR / VTR / ER 附 95% 信賴區間
+    (<rate>_ci_low / <rate>_ci_high)，結果帶有 sample_rate 欄位。
+    
     Args:
         start_date: 開始日期
         end_date: 結束日期
         cmp_ids: Campaign IDs (用於篩選特定產業或客戶群的 Campaign)
         format_ids: 格式 IDs (用於篩選特定格式)
+        client_ids / agency_ids / industry_ids / sub_industry_ids: 直接以客戶 / 代理商 / 產業過濾 (不需先取得 cmp_ids)
+        approximate: 近似模式 (抽樣估計，附信賴區間)
+        sample_rate: 近似模式的抽樣比例 (0~1，預設 CH_SAMPLE_RATE)
     """
     
-    # Render ClickHouse SQL
     try:
-        template = env.get_template("format_benchmark.sql")
-        context = {
+        context = apply_entity_filters({
             "start_date": start_date,
             "end_date": end_date,
             "cmp_ids": cmp_ids,
-            "format_ids": format_ids
-        }
-        rendered_sql = template.render(**context)
+            "format_ids": format_ids,
+            "client_ids": client_ids,
+            "agency_ids": agency_ids,
+            "industry_ids": industry_ids,
+            "sub_industry_ids": sub_industry_ids
+        })
     except Exception as e:
-        return {"status": "error", "message": f"Template Rendering Error: {e}"}
+        return {"status": "error", "message": f"Entity Filter Resolution Error: {e}"}
 
-    # Execute
+    if approximate:
+        try:
+            sample_plan = plan_sample(context, sample_rate)
+        except Exception as e:
+            return {"status": "error", "message": f"Approximate Mode Error: {e}"}
+        if sample_plan:
+            return _run_approximate_query("format_benchmark", context, sample_plan, "ClickHouse Benchmark Query Error")
+
+    # Render ClickHouse SQL
     try:
-        ch_client = get_clickhouse_db()
-        result = ch_client.query(rendered_sql)
-        
-        columns = result.column_names
-        rows = [dict(zip(columns, row)) for row in result.result_rows]
-        
-        return {
-            "status": "success",
-            "data": rows,
-            "count": len(rows),
-            "generated_sql": rendered_sql,
-            "columns": columns
-        }
-        
+        rendered_sql, parameters = _prepare_guarded_query("format_benchmark", with_rollup(context))
+    except QueryCostExceeded as e:
+        return e.result
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return {
-            "status": "error",
-            "message": f"ClickHouse Benchmark Query Error: {e}",
-            "generated_sql": rendered_sql
-        }
+        return {"status": "error", "message": f"Template Rendering Error: {e}"}
+
+    # Execute
+    return _run_clickhouse_query("format_benchmark", rendered_sql, "ClickHouse Benchmark Query Error", parameters)
 
 @tool
 def query_unified_performance(
@@ -116,16 +368,24 @@ def query_unified_performance(
     group_by: List[str],
     plaids: Optional[List[int]] = None,
     cmpids: Optional[List[int]] = None,
+    client_ids: Optional[List[int]] = None,
+    agency_ids: Optional[List[int]] = None,
+    industry_ids: Optional[List[int]] = None,
+    sub_industry_ids: Optional[List[int]] = None,
     product_line_ids: Optional[List[int]] = None,
     ad_format_type_ids: Optional[List[int]] = None,
     one_categories: Optional[List[str]] = None,
     one_sub_categories: Optional[List[str]] = None,
-    limit: int = 100
+    limit: int = 100,
+    approximate: bool = False,
+    sample_rate: Optional[float] = None
 ) -> Dict[str, Any]:
     """
     【核心成效查詢工具】從 ClickHouse 查詢成效數據，使用 ID 進行精準過濾。
     
-    ⚠️ 重要: 此工具不再接受 client_ids。若要查特定客戶成效，必須先呼叫 `query_media_placements` 取得 plaids。
+    ⚡️ 只查成效時可直接傳入 client_ids / agency_ids / industry_ids (resolve_entity 取得)，不需先呼叫 id_finder。
+    ⚡️ 全站 (未指定 plaids / cmpids) 的大概排名可設 approximate=True：以抽樣資料估計，附 95% 信賴區間，
+       結果不含 cmpid / plaid，帶有 sample_rate 欄位。
     
     Args:
         start_date: 開始日期 (YYYY-MM-DD)
@@ -136,10 +396,15 @@ def query_unified_performance(
                   'ad_format_type_id', 'plaid', 'cmpid']
         plaids: Placement IDs (強烈建議使用此欄位過濾)
         cmpids: Campaign IDs (ClickHouse cmpid)
+        client_ids: 客戶 IDs
+        agency_ids: 代理商 IDs
+        industry_ids / sub_industry_ids: 產業 / 子產業 IDs (與 id_finder 相同)
         product_line_ids: Product Line IDs
         ad_format_type_ids: Ad Format Type IDs
         one_categories: 產業類別 (String)
         one_sub_categories: 子產業類別 (String)
+        approximate: 近似模式 (抽樣估計，附信賴區間；有 plaids / cmpids 時仍為精確查詢)
+        sample_rate: 近似模式的抽樣比例 (0~1，預設 CH_SAMPLE_RATE)
     """
     
     # 安全性驗證
@@ -154,46 +419,48 @@ def query_unified_performance(
         valid_dims = ['client_company'] 
         
     try:
-        template = env.get_template("unified_performance.sql")
-        context = {
+        # client / agency / industry：bridge 模式由 ClickHouse 解析，否則先在 MySQL 解析成 plaids
+        context = apply_entity_filters({
             "start_date": start_date,
             "end_date": end_date,
             "dimensions": valid_dims,
             "plaids": plaids,
             "cmpids": cmpids,
+            "client_ids": client_ids,
+            "agency_ids": agency_ids,
+            "industry_ids": industry_ids,
+            "sub_industry_ids": sub_industry_ids,
             "product_line_ids": product_line_ids,
             "ad_format_type_ids": ad_format_type_ids,
             "one_categories": one_categories,
             "one_sub_categories": one_sub_categories,
             "limit": limit
-        }
-        rendered_sql = template.render(**context)
+        })
     except Exception as e:
-        return {"status": "error", "message": f"Template Rendering Error: {e}"}
+        return {"status": "error", "message": f"Entity Filter Resolution Error: {e}"}
+
+    if approximate:
+        try:
+            sample_plan = plan_sample(context, sample_rate)
+        except Exception as e:
+            return {"status": "error", "message": f"Approximate Mode Error: {e}"}
+        if sample_plan:
+            return _run_approximate_query("unified_performance", context, sample_plan, "Unified Performance Query Error")
 
+    if partition_cache_applicable(context):
+        result = _run_partitioned_performance(context)
+        if result is not None:
+            return result
+
+    # 長區間：完整且已回填的月份改讀月彙總表；執行前檢查預估讀取量
     try:
-        ch_client = get_clickhouse_db()
-        result = ch_client.query(rendered_sql)
-        
-        columns = result.column_names
-        rows = [dict(zip(columns, row)) for row in result.result_rows]
-        
-        return {
-            "status": "success",
-            "data": rows,
-            "count": len(rows),
-            "generated_sql": rendered_sql,
-            "columns": columns
-        }
-        
+        rendered_sql, parameters = _prepare_guarded_query("unified_performance", with_rollup(context))
+    except QueryCostExceeded as e:
+        return e.result
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return {
-            "status": "error",
-            "message": f"Unified Performance Query Error: {e}",
-            "generated_sql": rendered_sql
-        }
+        return {"status": "error", "message": f"Template Rendering Error: {e}"}
+
+    return _run_clickhouse_query("unified_performance", rendered_sql, "Unified Performance Query Error", parameters)
 
 @tool
 def query_unified_dimensions(
@@ -239,7 +506,6 @@ def query_unified_dimensions(
         return {"status": "error", "message": "No valid dimensions provided."}
         
     try:
-        template = env.get_template("unified_dimensions.sql")
         context = {
             "start_date": start_date,
             "end_date": end_date,
@@ -253,30 +519,10 @@ def query_unified_dimensions(
             "one_sub_categories": one_sub_categories,
             "limit": limit
         }
-        rendered_sql = template.render(**context)
+        rendered_sql, parameters = _prepare_guarded_query("unified_dimensions", context)
+    except QueryCostExceeded as e:
+        return e.result
     except Exception as e:
         return {"status": "error", "message": f"Template Rendering Error: {e}"}
 
-    try:
-        ch_client = get_clickhouse_db()
-        result = ch_client.query(rendered_sql)
-        
-        columns = result.column_names
-        rows = [dict(zip(columns, row)) for row in result.result_rows]
-        
-        return {
-            "status": "success",
-            "data": rows,
-            "count": len(rows),
-            "generated_sql": rendered_sql,
-            "columns": columns
-        }
-        
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return {
-            "status": "error",
-            "message": f"Unified Dimensions Query Error: {e}",
-            "generated_sql": rendered_sql
-        }
+    return _run_clickhouse_query("unified_dimensions", rendered_sql, "Unified Dimensions Query Error", parameters)
@@ -0,0 +1,235 @@
+"""
+SQL Template Registry
+
+以 templates/sql/template_index.yaml 為唯一來源：
+- 啟動時載入索引並預先編譯所有模板 (索引指向不存在的檔案會在 import 時就失敗，而不是請求進行到一半)
+- 渲染前檢查 required_params
+- 每個模板產生具名、帶型別的 render 函式 (render_<模板名稱>)：參數取自索引的 required / optional_params，
+  型別取自模板開頭註解的 Parameters 區塊 (例如 `- plaids: List[int] (required)`)
+- 模板路徑以專案根目錄為準，不再依賴 os.getcwd()
+"""
+import inspect
+import numbers
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_DIR = os.path.join(PROJECT_ROOT, "templates", "sql")
+INDEX_FILE = "template_index.yaml"
+
+# 模板註解中的參數型別 -> (annotation, 檢查函式)
+_PARAM_TYPES = {
+    "str": (str, lambda v: isinstance(v, str)),
+    "int": (int, lambda v: isinstance(v, numbers.Integral) and not isinstance(v, bool)),
+    "float": (float, lambda v: isinstance(v, numbers.Real) and not isinstance(v, bool)),
+    "bool": (bool, lambda v: isinstance(v, bool)),
+    "List[int]": (List[int], lambda v: isinstance(v, (list, tuple)) and all(
+        isinstance(x, numbers.Integral) and not isinstance(x, bool) for x in v)),
+    "List[str]": (List[str], lambda v: isinstance(v, (list, tuple)) and all(isinstance(x, str) for x in v)),
+}
+_HEADER_RE = re.compile(r"\{#(.*?)#\}", re.S)
+# "- client_ids / agency_ids: List[int] (optional) - ..."
+_PARAM_LINE_RE = re.compile(r"^\s*-\s+([\w\s/]+?):\s*(List\[int\]|List\[str\]|str|int|float|bool)(?![\w\[])", re.M)
+
+
+def _header_param_types(source: str) -> Dict[str, str]:
+    """
+    解析模板開頭註解 ({# ... #}) 中 Parameters 的型別宣告。
+    """
+    header = _HEADER_RE.search(source)
+    if not header:
+        return {}
+    types = {}
+    for names, type_name in _PARAM_LINE_RE.findall(header.group(1)):
+        for name in names.split("/"):
+            types[name.strip()] = type_name
+    return types
+
+
+class TemplateSpec:
+    """
+    template_index.yaml 中單一模板的描述與已編譯的 Jinja Template。
+    """
+
+    def __init__(self, name: str, meta: Dict[str, Any], template: Template,
+                 param_types: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.file: str = meta["file"]
+        self.description: str = meta.get("description", "")
+        self.required_params: List[str] = list(meta.get("required_params") or [])
+        self.optional_params: List[str] = list(meta.get("optional_params") or [])
+        self.returns: List[str] = list(meta.get("returns") or [])
+        self.backend: str = meta.get("backend", "mysql")
+        # 大型 ID 清單分塊執行: chunk_param 為要切分的 list 參數，row_limit 為單次查詢的 LIMIT
+        self.chunk_param: Optional[str] = meta.get("chunk_param")
+        self.chunk_size: Optional[int] = meta.get("chunk_size")
+        self.row_limit: Optional[int] = meta.get("row_limit")
+        # Keyset 分頁: 排序鍵欄位、每頁列數與總列數上限
+        self.keyset_columns: List[str] = list(meta.get("keyset_columns") or [])
+        self.page_size: Optional[int] = meta.get("page_size")
+        self.max_rows: Optional[int] = meta.get("max_rows")
+        # 結果快取秒數 (0 表示不快取)
+        self.cache_ttl: float = float(meta.get("cache_ttl") or 0)
+        # 執行時限秒數 (MySQL MAX_EXECUTION_TIME / ClickHouse max_execution_time)，未設定時見 query_timeout
+        self.timeout: Optional[float] = float(meta["timeout"]) if meta.get("timeout") is not None else None
+        self.meta = meta
+        self.template = template
+        self.param_types: Dict[str, str] = param_types or {}
+        self.signature = self._build_signature()
+
+    def _build_signature(self) -> inspect.Signature:
+        """
+        render_<name> 的簽章：必要參數 (無預設值)、選填參數 (預設 None)，其餘內部參數以 **internal 傳入。
+        """
+        params = []
+        for name in self.required_params:
+            annotation = _PARAM_TYPES.get(self.param_types.get(name), (Any,))[0]
+            params.append(inspect.Parameter(name, inspect.Parameter.KEYWORD_ONLY, annotation=annotation))
+        for name in self.optional_params:
+            if name in self.required_params:
+                continue
+            annotation = _PARAM_TYPES.get(self.param_types.get(name), (Any,))[0]
+            params.append(inspect.Parameter(
+                name, inspect.Parameter.KEYWORD_ONLY, default=None, annotation=Optional[annotation]
+            ))
+        params.append(inspect.Parameter("internal", inspect.Parameter.VAR_KEYWORD, annotation=Any))
+        return inspect.Signature(params, return_annotation=str)
+
+    def check_types(self, context: Dict[str, Any]) -> None:
+        """
+        依模板註解宣告的型別檢查參數 (None 視為未傳入)；不符時拋出 ValueError。
+        """
+        errors = []
+        for name, value in context.items():
+            type_name = self.param_types.get(name)
+            if value is None or type_name not in _PARAM_TYPES:
+                continue
+            if not _PARAM_TYPES[type_name][1](value):
+                errors.append(f"{name} should be {type_name}, got {type(value).__name__}")
+        if errors:
+            raise ValueError(f"Error: Template '{self.name}' got invalid params: {errors}")
+
+    def missing_params(self, context: Dict[str, Any]) -> List[str]:
+        return [p for p in self.required_params if context.get(p) in (None, "", [])]
+
+    def __repr__(self) -> str:
+        return f"TemplateSpec({self.name!r}, file={self.file!r})"
+
+
+class TemplateRegistry:
+    def __init__(self, template_dir: str = TEMPLATE_DIR):
+        self.template_dir = template_dir
+        # 模板在 process 生命週期內不會變動：關閉 auto_reload，避免每次 get_template 都 stat 檔案
+        self.env = Environment(
+            loader=FileSystemLoader(template_dir),
+            autoescape=select_autoescape(['sql']),
+            auto_reload=False
+        )
+        self._specs: Dict[str, TemplateSpec] = {}
+        self._by_file: Dict[str, TemplateSpec] = {}
+        self._load()
+
+    def _load(self) -> None:
+        index_path = os.path.join(self.template_dir, INDEX_FILE)
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                index = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            raise ValueError(f"Error: Could not load SQL template index {index_path}: {e}") from e
+
+        errors = []
+        for name, meta in (index.get("templates") or {}).items():
+            if not meta or not meta.get("file"):
+                errors.append(f"{name}: missing 'file'")
+                continue
+            try:
+                template = self.env.get_template(meta["file"])
+                source = self.env.loader.get_source(self.env, meta["file"])[0]
+            except Exception as e:
+                errors.append(f"{name}: {meta['file']} ({type(e).__name__}: {e})")
+                continue
+            spec = TemplateSpec(name, meta, template, _header_param_types(source))
+            self._specs[name] = spec
+            self._by_file[spec.file] = spec
+
+        if errors:
+            raise ValueError("Error: Invalid SQL templates in template_index.yaml:\n  " + "\n  ".join(errors))
+
+    def names(self) -> List[str]:
+        return list(self._specs)
+
+    def get(self, name: str) -> TemplateSpec:
+        """
+        以索引名稱 (id_finder) 或檔名 (id_finder.sql) 取得模板。
+        """
+        spec = self._specs.get(name) or self._by_file.get(name)
+        if spec is None:
+            raise ValueError(f"Error: Unknown SQL template '{name}'. Available: {self.names()}")
+        return spec
+
+    def render(self, name: str, context: Dict[str, Any]) -> str:
+        """
+        檢查 required_params 與參數型別後渲染模板；缺少必要參數或型別不符時拋出 ValueError。
+        """
+        spec = self.get(name)
+        missing = spec.missing_params(context)
+        if missing:
+            raise ValueError(f"Error: Template '{spec.name}' is missing required params: {missing}")
+        spec.check_types(context)
+        return spec.template.render(**context)
+
+    def renderer(self, name: str) -> Callable[..., str]:
+        """
+        模板專屬的 render 函式 render_<name>(*, <required>, <optional>=None, **internal)：
+        簽章與型別來自索引與模板註解；缺少必要參數時 bind 即拋出 TypeError，型別不符時拋出 ValueError。
+        """
+        spec = self.get(name)
+
+        def _render(**kwargs) -> str:
+            bound = spec.signature.bind(**kwargs)
+            context = dict(bound.arguments)
+            context.update(context.pop("internal", {}))
+            return self.render(spec.name, context)
+
+        _render.__name__ = _render.__qualname__ = f"render_{spec.name}"
+        _render.__signature__ = spec.signature
+        _render.__doc__ = spec.description
+        return _render
+
+    def renderers(self) -> Dict[str, Callable[..., str]]:
+        return {name: self.renderer(name) for name in self.names()}
+
+
+_registry: Optional[TemplateRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> TemplateRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = TemplateRegistry()
+                print(f"📚 Loaded {len(_registry.names())} SQL templates from {INDEX_FILE}")
+    return _registry
+
+
+def render_template(name: str, context: Dict[str, Any]) -> str:
+    return get_registry().render(name, context)
+
+
+def __getattr__(attr: str) -> Callable[..., str]:
+    """
+    模組層級的 render_<模板名稱>，例如 `from tools.template_registry import render_id_finder`。
+    """
+    if attr.startswith("render_"):
+        try:
+            return get_registry().renderer(attr[len("render_"):])
+        except ValueError as e:
+            raise AttributeError(str(e)) from e
+    raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")